@@ -0,0 +1,130 @@
+"""
+Benchmark aggregation of a year of sheet rows.
+
+Compares building one SheetSpending model per row with the columnar frame, in
+time and in memory held by the spendings.
+
+    poetry run python -m benchmarks.bench_frame --records 50000
+"""
+import argparse
+import tracemalloc
+from datetime import date
+from typing import Any, Callable, Dict, List, Tuple
+
+from benchmarks.common import measure, report
+from src.aggregates import MONTHS_IN_YEAR, MonthlyAggregate
+from src.finances import SheetSpending
+from src.sheet_mirror import Rows
+from src.spending_frame import DATE_COLUMN, SpendingFrame
+
+CATEGORIES = ("Food", "Transport", "Rent", "Health", "Fun", "Travel")
+CURRENCIES = ("USD", "GEL", "EUR")
+SOURCES = ("Cash", "Card", "Bank")
+YEAR = 2023
+# days of every month the rows are spread over
+ROW_DAYS = 28
+MAX_USD = 50
+DEFAULT_RECORDS = 50000
+MEBIBYTE = 1024 * 1024
+
+
+def make_row(index: int) -> List[str]:
+    """Make the sheet row number ``index``."""
+    month = index % MONTHS_IN_YEAR + 1
+    day = index % ROW_DAYS + 1
+    cost = index % 100
+    usd = index % MAX_USD
+    return [
+        f"Spending {index}",
+        CATEGORIES[index % len(CATEGORIES)],
+        "Description",
+        f"{cost},5",
+        CURRENCIES[index % len(CURRENCIES)],
+        SOURCES[index % len(SOURCES)],
+        f"{YEAR}-{month:02d}-{day:02d}",
+        f"{usd}.25",
+    ]
+
+
+def make_rows(count: int) -> Rows:
+    """Make ``count`` sheet rows spread over the days of a year."""
+    return [make_row(index) for index in range(count)]
+
+
+def rows_by_month(rows: Rows) -> Dict[int, Rows]:
+    """Split rows by month, as they are read from the monthly sub-sheets."""
+    months: Dict[int, Rows] = {}
+    for row in rows:
+        month = date.fromisoformat(row[DATE_COLUMN]).month
+        months.setdefault(month, []).append(row)
+    return months
+
+
+def aggregate_models(months: Dict[int, Rows]) -> List[MonthlyAggregate]:
+    """Aggregate a year the way it was done before the frame."""
+    return [
+        MonthlyAggregate.from_spendings(
+            YEAR,
+            month,
+            [SheetSpending.from_list(row) for row in rows],
+        )
+        for month, rows in months.items()
+    ]
+
+
+def aggregate_frame(months: Dict[int, Rows]) -> List[MonthlyAggregate]:
+    """Aggregate a year with group-by sums over frames."""
+    return [
+        MonthlyAggregate.from_frame(YEAR, month, SpendingFrame.from_rows(rows))
+        for month, rows in months.items()
+    ]
+
+
+def make_benchmarks(
+    months: Dict[int, Rows],
+) -> Dict[str, Callable[[], Any]]:
+    """Make the benchmarked calls by name."""
+    return {
+        "year report, models": lambda: aggregate_models(months),
+        "year report, frame": lambda: aggregate_frame(months),
+    }
+
+
+def peak_memory(func: Callable[[], Any]) -> Tuple[int, Any]:
+    """Return the memory held by the result of a call, in bytes."""
+    tracemalloc.start()
+    held = func()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, held
+
+
+def report_memory(rows: Rows) -> None:
+    """Report the memory held by the spendings of rows, as models and as a frame."""
+    held_memory = {
+        "models": peak_memory(
+            lambda: [SheetSpending.from_list(row) for row in rows],
+        )[0],
+        "frame": peak_memory(lambda: SpendingFrame.from_rows(rows))[0],
+    }
+    for name, memory in held_memory.items():
+        label = f"spendings memory, {name}"
+        mebibytes = memory / MEBIBYTE
+        report(f"{label:<32} {mebibytes:>12.1f} MiB")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=DEFAULT_RECORDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rows = make_rows(args.records)
+    report(f"{args.records} rows over a year, best of {args.repeat} runs")
+    for name, func in make_benchmarks(rows_by_month(rows)).items():
+        measure(name, args.records, func, args.repeat)
+    report_memory(rows)
+
+
+if __name__ == "__main__":
+    main()
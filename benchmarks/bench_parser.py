@@ -0,0 +1,77 @@
+"""
+Benchmark parsing of spending records.
+
+Compares the record by record parsing with the batch parser, on a text message
+and on a CSV file.
+
+    poetry run python -m benchmarks.bench_parser --records 10000
+"""
+import argparse
+from io import BytesIO
+from typing import Any, Callable, Dict, List
+
+from benchmarks.common import measure, report
+from src.finances import Spending
+from src.importer import SpendingImport
+from src.spending_parser import parse_spendings
+
+RECORD = "Lunch {0};1{0},5;Food;Nice meal;GEL;Card;2023-11-{1:02d}"
+# days of the month the records are spread over
+RECORD_DAYS = 28
+DEFAULT_RECORDS = 10000
+
+
+def make_record(index: int) -> str:
+    """Make the record number ``index``."""
+    return RECORD.format(index, index % RECORD_DAYS + 1)
+
+
+def make_records(count: int) -> List[str]:
+    """Make ``count`` distinct valid records."""
+    return [make_record(index) for index in range(count)]
+
+
+def parse_one_by_one(message: str) -> List[Spending]:
+    """Parse a message the way it was parsed before the batch parser."""
+    return [Spending.from_string(record.strip()) for record in message.split("|")]
+
+
+def import_file(content: bytes, chunk_size: int) -> int:
+    """Import a whole file, returning the number of spendings."""
+    spending_import = SpendingImport(BytesIO(content))
+    chunk = spending_import.read_chunk(chunk_size)
+    while chunk:
+        chunk = spending_import.read_chunk(chunk_size)
+    return spending_import.imported
+
+
+def make_benchmarks(records: List[str]) -> Dict[str, Callable[[], Any]]:
+    """Make the benchmarked calls by name."""
+    message = " | ".join(records)
+    content = "\n".join(records).encode()
+    invalid_message = " | ".join(
+        record.replace("GEL", "XYZ") if index % 10 == 0 else record
+        for index, record in enumerate(records)
+    )
+    return {
+        "message, one by one": lambda: parse_one_by_one(message),
+        "message, batch": lambda: parse_spendings(message),
+        "message 10% invalid, batch": lambda: parse_spendings(invalid_message),
+        "file, chunks of 1000": lambda: import_file(content, 1000),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=DEFAULT_RECORDS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    report(f"{args.records} records, best of {args.repeat} runs")
+    benchmarks = make_benchmarks(make_records(args.records))
+    for name, func in benchmarks.items():
+        measure(name, args.records, func, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark the cold start of the webhook server.
+
+Every run starts a fresh interpreter, imports the server, starts it and posts a
+first webhook update, with and without LAZY_STARTUP. It reports the time from
+the start of the server import to the end of the import, the first webhook
+answer and the bot being ready to handle updates, along with the startup phases
+the server measured itself.
+
+    poetry run python -m benchmarks.bench_startup --repeat 3
+"""
+import argparse
+import json
+import os
+import subprocess  # noqa: S404
+import sys
+from typing import Dict, List
+
+from benchmarks.common import report
+
+# runs in the child interpreter, prints the timings as JSON
+CHILD = """
+import json, os, time
+started_at = time.perf_counter()
+import main
+imported_at = time.perf_counter()
+from fastapi.testclient import TestClient
+update = {
+    "update_id": 1,
+    "edited_message": {
+        "message_id": 1,
+        "date": 1700000000,
+        "chat": {"id": 1, "type": "private"},
+        "text": "benchmark",
+    },
+}
+with TestClient(main.app) as client:
+    client.post("/webhook", json=update)
+    answered_at = time.perf_counter()
+    if hasattr(main.app.state, "bot_loading"):
+        client.portal.call(lambda: main.app.state.bot_loading)
+    ready_at = time.perf_counter()
+    print(json.dumps({
+        "import": imported_at - started_at,
+        "first answer": answered_at - started_at,
+        "ready": ready_at - started_at,
+        "phases": main.boot_timer.phases,
+    }))
+    # background exchange rate requests are not waited for
+    os._exit(0)
+"""
+
+# settings the server can not be imported without, unless already set
+REQUIRED_ENV = {
+    "TELEGRAM_BOT_TOKEN": "123456:benchmark",  # noqa: S105
+    "WELCOME_MD_FILE_PATH": "src/static/bot_phrases/welcome.md",
+    "HELP_MD_FILE_PATH": "src/static/bot_phrases/help.md",
+    "JOURNAL_PATH": "",
+}
+
+
+# the timings of a run by name, in seconds
+Timings = Dict[str, float]
+
+
+def parse_timings(output: str) -> Timings:
+    """Parse the timings printed last by the child, with its startup phases."""
+    last_line = output.strip().splitlines()[-1]
+    timings = json.loads(last_line)
+    for phase, seconds in timings.pop("phases").items():
+        timings[f"phase {phase}"] = seconds
+    return timings
+
+
+def run_cold_start(lazy: bool) -> Timings:
+    """Start the server in a new interpreter and return its timings."""
+    env = {**REQUIRED_ENV, **os.environ, "LAZY_STARTUP": "1" if lazy else ""}
+    child = subprocess.run(  # noqa: S603
+        [sys.executable, "-c", CHILD],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return parse_timings(child.stdout)
+
+
+def report_best(runs: List[Timings]) -> None:
+    """Report the best time of every timing of the runs."""
+    for name in runs[0]:
+        durations = [run[name] for run in runs if name in run]
+        best = min(durations)
+        line = f"  {name:<22} {best:>8.3f} s"
+        report(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    report(f"seconds from the start of the server import, best of {args.repeat} runs")
+    for lazy in (False, True):
+        runs = [run_cold_start(lazy) for _ in range(args.repeat)]
+        report("lazy startup" if lazy else "eager startup")
+        report_best(runs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+"""
+Benchmark the storage operations against an in-memory fake Sheets service.
+
+Every operation runs from a cold state (empty sub-sheet index, aggregates and
+report cache, and a fresh local mirror), and reports its duration, its rate and
+the Sheets API calls it made, so regressions in round trips or in per-row cost
+show up here.
+
+    poetry run python -m benchmarks.bench_storage --sizes 100,10000 --latency 0.05
+"""
+import argparse
+import asyncio
+import tempfile
+from datetime import date
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Counter, Dict, List, Tuple
+
+from benchmarks.common import report, timed
+from benchmarks.fake_sheets import FakeSheetsService
+from src import spreadsheets
+from src.aggregates import aggregate_stores
+from src.finances import Spending
+from src.report_service import ReportService
+from src.settings import IMPORT_CHUNK_SIZE
+from src.sheet_mirror import Rows, SheetMirror, sheet_mirrors
+from src.sheets_scheduler import sheets_scheduler
+from src.spending_parser import parse_spendings
+from src.tenants import default_tenant
+
+READ_MONTH = (2023, 11)
+WRITE_MONTH = (2023, 12)
+CATEGORIES = ("Food", "Transport", "Rent", "Health", "Fun", "Travel")
+SOURCES = ("Cash", "Card", "Bank")
+# days of every month the rows are spread over
+ROW_DAYS = 28
+# last day of the report period
+REPORT_DAY = 30
+# from this size on, a single run per operation is enough
+LARGE_SIZE = 100000
+
+Step = Callable[[], Any]
+# an operation with its untimed preparation
+Operation = Tuple[Step, Step]
+
+
+def make_row(index: int) -> List[str]:
+    """Make the sheet row number ``index`` of READ_MONTH, already backfilled."""
+    day = date(*READ_MONTH, index % ROW_DAYS + 1)
+    cost = str(index % 100)
+    return [
+        "Spending",
+        CATEGORIES[index % len(CATEGORIES)],
+        "",
+        cost,
+        "USD",
+        SOURCES[index % len(SOURCES)],
+        day.isoformat(),
+        cost,
+    ]
+
+
+def make_rows(count: int) -> Rows:
+    """Make ``count`` sheet rows of READ_MONTH."""
+    # every combination of category, source and day
+    distinct = len(CATEGORIES) * len(SOURCES) * ROW_DAYS
+    templates = [make_row(index) for index in range(distinct)]
+    return [list(templates[index % distinct]) for index in range(count)]
+
+
+def make_record(index: int) -> str:
+    """Make the record number ``index`` of WRITE_MONTH."""
+    day = date(*WRITE_MONTH, index % ROW_DAYS + 1).isoformat()
+    category = CATEGORIES[index % len(CATEGORIES)]
+    source = SOURCES[index % len(SOURCES)]
+    cost = index % 100
+    return f"Spending;{cost},5;{category};;USD;{source};{day}"
+
+
+def make_message(count: int) -> str:
+    """Make a message of ``count`` records of WRITE_MONTH."""
+    return " | ".join(make_record(index) for index in range(count))
+
+
+class StorageBenchmark:
+    """Runs the storage operations against a fake service holding ``rows``."""
+
+    def __init__(self, rows: int, latency: float, mirror: bool) -> None:
+        self.rows = rows
+        self.latency = latency
+        self.mirror = mirror
+        self.service = FakeSheetsService(latency)
+        self.service.add_sheet(
+            spreadsheets.generate_sub_sheet_name(*READ_MONTH),
+            [[str(header) for header in spreadsheets.TABLE_HEADERS], *make_rows(rows)],
+        )
+        self.spendings: List[Spending] = parse_spendings(make_message(rows))[0]
+        self._mirror_dir = tempfile.TemporaryDirectory()
+        spreadsheets.get_sheets_service = lambda: self.service  # type: ignore
+
+    def reset(self) -> None:
+        """Forget every cached state, and the spendings written by a previous run."""
+        write_sheet = spreadsheets.generate_sub_sheet_name(*WRITE_MONTH)
+        self.service.sheet_ids.pop(write_sheet, None)
+        self.service.sheet_rows.pop(write_sheet, None)
+        self.service.calls.clear()
+        spreadsheets.sub_sheet_indexes.clear()
+        aggregate_stores.clear()
+        ReportService.cache.clear()
+        sheet_mirrors[default_tenant.key] = None
+        if self.mirror:
+            mirror_name = id(self)
+            mirror_path = Path(self._mirror_dir.name) / f"{mirror_name}.sqlite3"
+            mirror_path.unlink(missing_ok=True)
+            sheet_mirrors[default_tenant.key] = SheetMirror(str(mirror_path))
+
+    def operations(self) -> Dict[str, Operation]:
+        """Return the operations by name, each with its untimed preparation."""
+        message = make_message(self.rows)
+        generate_report = self.generate_report
+        return {
+            "parse": (nothing, lambda: parse_spendings(message)),
+            "add_spending": (nothing, self.add_spending),
+            "get_spendings": (nothing, self.get_spendings),
+            "generate_report": (nothing, generate_report),
+            "generate_report, cached": (generate_report, generate_report),
+        }
+
+    def add_spending(self) -> None:
+        """Write the spendings in chunks, as the file import does."""
+        spendings = self.spendings
+        while spendings:
+            spreadsheets.add_spending(spendings[:IMPORT_CHUNK_SIZE])
+            spendings = spendings[IMPORT_CHUNK_SIZE:]
+
+    def get_spendings(self) -> Any:
+        return spreadsheets.get_spendings(*READ_MONTH)
+
+    def generate_report(self) -> Any:
+        start = date(*READ_MONTH, 1)
+        end = date(*READ_MONTH, REPORT_DAY)
+        return asyncio.run(ReportService.generate_report(start, end))
+
+    def run(
+        self,
+        name: str,
+        prepare: Step,
+        operation: Step,
+        repeat: int,
+    ) -> None:
+        """Report the best duration of ``repeat`` cold runs and their API calls."""
+        best = min(self._cold_run(prepare, operation) for _ in range(repeat))
+        milliseconds = best * 1000
+        rate = self.rows / best
+        columns = [
+            f"{name:<24}",
+            f"{self.rows:>9}",
+            f"{milliseconds:>11.1f} ms",
+            f"{rate:>14,.0f} rows/s ",
+            format_calls(self.service.calls),
+        ]
+        report(" ".join(columns))
+
+    def _cold_run(self, prepare: Step, operation: Step) -> float:
+        self.reset()
+        prepare()
+        self.service.calls.clear()
+        return timed(operation)
+
+
+def format_calls(calls: Counter[str]) -> str:
+    """Format the API calls by method, or "-" when none was made."""
+    by_method = sorted(calls.items())
+    counts = [f"{method}={count}" for method, count in by_method]
+    return " ".join(counts) or "-"
+
+
+def nothing() -> None:
+    """Prepare nothing."""
+
+
+async def skip_pie(*args: Any) -> BytesIO:
+    """Charts are benchmarked separately, keep them out of the report timing."""
+    return BytesIO()
+
+
+def run_size(size: int, args: argparse.Namespace) -> None:
+    """Run every operation against a spreadsheet of ``size`` rows."""
+    benchmark = StorageBenchmark(size, args.latency, not args.no_mirror)
+    repeat = 1 if size >= LARGE_SIZE else args.repeat
+    for name, (prepare, operation) in benchmark.operations().items():
+        benchmark.run(name, prepare, operation, repeat)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="100,10000,1000000")
+    parser.add_argument("--latency", type=float, default=0, help="seconds per call")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-mirror", action="store_true")
+    args = parser.parse_args()
+
+    ReportService.generate_pie = skip_pie  # type: ignore
+    # the calls are made to the fake service, not within the API quotas
+    sheets_scheduler.quotas = {"read": 0, "write": 0}
+    report(f"latency {args.latency}s per call, best of {args.repeat} cold runs")
+    for size in map(int, args.sizes.split(",")):
+        run_size(size, args)
+
+
+if __name__ == "__main__":
+    main()
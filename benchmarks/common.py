@@ -0,0 +1,29 @@
+"""Helpers shared by the benchmarks."""
+import sys
+import time
+from typing import Any, Callable
+
+
+def timed(func: Callable[[], Any]) -> float:
+    """Return the duration of a call, in seconds."""
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def report(line: str) -> None:
+    """Write a line of the results to the standard output."""
+    sys.stdout.write(f"{line}\n")
+
+
+def measure(name: str, records: int, func: Callable[[], Any], repeat: int) -> None:
+    """Report the best rate of ``repeat`` runs."""
+    best = min(timed(func) for _ in range(repeat))
+    rate = records / best
+    milliseconds = best * 1000
+    columns = [
+        f"{name:<32}",
+        f"{rate:>12,.0f} records/s",
+        f"{milliseconds:>10.1f} ms",
+    ]
+    report(" ".join(columns))
@@ -0,0 +1,238 @@
+"""In-memory fake of the Sheets v4 spreadsheets service."""
+import re
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.sheet_mirror import Rows
+
+# 0-based sheet title, first and last column, first and last row of an A1 range
+A1Range = Tuple[str, int, int, int, Optional[int]]
+
+RANGE_PATTERN = re.compile(
+    r"^(?P<sheet>[^!]+)!(?P<column>[A-Z]+)(?P<first_row>\d+)"
+    + r"(?::(?P<last_column>[A-Z]+)(?P<last_row>\d*))?$",
+)
+
+
+def column_index(letters: str) -> int:
+    """Convert a column letter to a 0-based index."""
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64  # noqa: WPS432
+    return index - 1
+
+
+def parse_range(a1_range: str) -> A1Range:
+    """
+    Parse an A1 range as used by the spreadsheets module.
+
+    :return: The sheet title, the first and last 0-based columns, the first 0-based
+        row and the last 0-based row, None for an unbounded range
+    """
+    match = RANGE_PATTERN.match(a1_range)
+    if match is None:
+        raise ValueError(f"Unsupported range: {a1_range}")
+    first_column = column_index(match["column"])
+    last_column = column_index(match["last_column"] or match["column"])
+    first_row = int(match["first_row"]) - 1
+    last_row: Optional[int] = first_row
+    if match["last_column"]:
+        last_row = int(match["last_row"]) - 1 if match["last_row"] else None
+    return match["sheet"], first_column, last_column, first_row, last_row
+
+
+def row_slice(parsed: A1Range) -> slice:
+    """Return the slice of the rows covered by a parsed range."""
+    last_row = parsed[4]
+    return slice(parsed[3], None if last_row is None else last_row + 1)
+
+
+def write_cells(row: List[str], first_column: int, cells: List[Any]) -> None:
+    """Write the cells into the row from the first column, padding it as needed."""
+    for offset, cell in enumerate(cells):
+        column = first_column + offset
+        while len(row) <= column:
+            row.append("")
+        row[column] = str(cell)
+
+
+def cell_value(cell: Dict[str, Any]) -> str:
+    """Return the formatted value of CellData, the way values.get reads it."""
+    user_entered_value = cell.get("userEnteredValue", {})
+    number = user_entered_value.get("numberValue")
+    if number is not None:
+        # whole numbers are displayed without decimals by the default format
+        if float(number).is_integer():
+            return str(int(number))
+        return str(number)
+    return str(user_entered_value.get("stringValue", ""))
+
+
+class FakeRequest:
+    """A request executed against the fake, counted and delayed on execute."""
+
+    def __init__(
+        self,
+        service: "FakeSheetsService",
+        name: str,
+        call: Callable[[], Any],
+    ) -> None:
+        self.service = service
+        self.name = name
+        self.call = call
+
+    def execute(self) -> Any:
+        self.service.calls[self.name] += 1
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        return self.call()
+
+
+class FakeSheetsService:
+    """
+    The spreadsheets service of a single spreadsheet, kept in memory.
+
+    Every executed request is counted in ``calls`` by method name and delayed by
+    ``latency`` seconds, to simulate the round trip to the API.
+    """
+
+    def __init__(self, latency: float = 0) -> None:
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self.sheet_ids: Dict[str, int] = {}
+        self.sheet_rows: Dict[str, Rows] = {}
+
+    def add_sheet(self, title: str, rows: Optional[Rows] = None) -> None:
+        """Create a sheet directly, without counting an API call."""
+        self.sheet_ids[title] = len(self.sheet_ids) + 1
+        self.sheet_rows[title] = list(rows or [])
+
+    def get(self, spreadsheetId: str, fields: str = "") -> FakeRequest:  # noqa: N803
+        return FakeRequest(self, "get", self._get)
+
+    def batchUpdate(  # noqa: N802
+        self,
+        spreadsheetId: str,  # noqa: N803
+        body: Dict[str, Any],
+    ) -> FakeRequest:
+        return FakeRequest(self, "batchUpdate", lambda: self._batch_update(body))
+
+    def values(self) -> "FakeValuesService":
+        return FakeValuesService(self)
+
+    def _get(self) -> Dict[str, Any]:
+        return {
+            "sheets": [
+                {"properties": {"sheetId": sheet_id, "title": title}}
+                for title, sheet_id in self.sheet_ids.items()
+            ],
+        }
+
+    def _batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        handlers = {
+            "addSheet": self._add_sheet,
+            "updateCells": self._update_cells,
+            "appendCells": self._append_cells,
+        }
+        for request in body["requests"]:
+            for kind, params in request.items():
+                handlers[kind](params)
+        return {"replies": [{} for _ in body["requests"]]}
+
+    def _add_sheet(self, params: Dict[str, Any]) -> None:
+        title = params["properties"]["title"]
+        if title in self.sheet_ids:
+            raise ValueError(f"Sheet exists: {title}")
+        self.sheet_ids[title] = params["properties"]["sheetId"]
+        self.sheet_rows[title] = []
+
+    def _update_cells(self, params: Dict[str, Any]) -> None:
+        rows = self._rows_by_id(params["start"]["sheetId"])
+        row_index = params["start"]["rowIndex"]
+        for offset, row_data in enumerate(params["rows"]):
+            self._write_row(rows, row_index + offset, row_data["values"])
+
+    def _append_cells(self, params: Dict[str, Any]) -> None:
+        rows = self._rows_by_id(params["sheetId"])
+        rows.extend(
+            [cell_value(cell) for cell in appended["values"]]
+            for appended in params["rows"]
+        )
+
+    def _rows_by_id(self, sheet_id: int) -> Rows:
+        titles = {sheet: title for title, sheet in self.sheet_ids.items()}
+        return self.sheet_rows[titles[sheet_id]]
+
+    def _write_row(
+        self,
+        rows: Rows,
+        row_index: int,
+        cells: List[Dict[str, Any]],
+    ) -> None:
+        while len(rows) <= row_index:
+            rows.append([])
+        rows[row_index] = [cell_value(cell) for cell in cells]
+
+
+class FakeValuesService:
+    """The values collection of the fake spreadsheets service."""
+
+    def __init__(self, service: FakeSheetsService) -> None:
+        self.service = service
+
+    def get(self, **request: str) -> FakeRequest:
+        a1_range = request["range"]
+        return FakeRequest(
+            self.service,
+            "values.get",
+            lambda: {"range": a1_range, "values": self._read(a1_range)},
+        )
+
+    def batchGet(  # noqa: N802
+        self,
+        spreadsheetId: str,  # noqa: N803
+        ranges: List[str],
+    ) -> FakeRequest:
+        return FakeRequest(
+            self.service,
+            "values.batchGet",
+            lambda: {
+                "valueRanges": [
+                    {"range": a1_range, "values": self._read(a1_range)}
+                    for a1_range in ranges
+                ],
+            },
+        )
+
+    def batchUpdate(  # noqa: N802
+        self,
+        spreadsheetId: str,  # noqa: N803
+        body: Dict[str, Any],
+    ) -> FakeRequest:
+        return FakeRequest(
+            self.service,
+            "values.batchUpdate",
+            lambda: self._batch_update(body),
+        )
+
+    def _read(self, a1_range: str) -> Rows:
+        parsed = parse_range(a1_range)
+        rows = self.service.sheet_rows[parsed[0]]
+        columns = slice(parsed[1], parsed[2] + 1)
+        values = [row[columns] for row in rows[row_slice(parsed)]]
+        # like the API, trailing empty rows are not returned
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _batch_update(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        for value_range in body["data"]:
+            self._write_range(value_range["range"], value_range["values"])
+        return {"totalUpdatedCells": len(body["data"])}
+
+    def _write_range(self, a1_range: str, range_values: List[List[Any]]) -> None:
+        parsed = parse_range(a1_range)
+        rows = self.service.sheet_rows[parsed[0]]
+        for row_offset, row_values in enumerate(range_values):
+            write_cells(rows[parsed[3] + row_offset], parsed[1], row_values)
@@ -1,36 +1,181 @@
 """FastAPI server for webhook."""
+import asyncio
 import logging
 from json import JSONDecodeError
-from typing import Any, Dict
+from typing import TYPE_CHECKING, Any, Dict
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from src.dedup import UpdateDeduplicator
+from src.metrics import cache_sizes, queue_depths, registry
+from src.settings import (
+    DEDUP_MAX_SIZE,
+    DEDUP_STORE_PATH,
+    DEDUP_WINDOW,
+    LAZY_STARTUP,
+    UPDATE_QUEUE_PUT_TIMEOUT,
+    UPDATE_QUEUE_SIZE,
+    UPDATE_WORKERS,
+    WEBHOOK_HOST,
+)
+from src.startup import PendingUpdates, boot_timer, import_in_background
+from src.update_queue import UpdateQueue
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+if TYPE_CHECKING:
+    from aiogram.types import Update
+
+
+async def feed_update(update: "Update") -> Any:
+    """Process an update with the bot, loaded before any update is queued."""
+    from src.bot import bot, dp  # noqa: WPS433
+
+    return await dp.feed_update(bot, update)
 
-import requests
-from aiogram import types
-from fastapi import FastAPI, Request
-from src.bot import bot, bot_url, dp
-from src.settings import WEBHOOK_HOST
 
 app = FastAPI()
+update_queue = UpdateQueue(
+    handler=feed_update,
+    workers=UPDATE_WORKERS,
+    maxsize=UPDATE_QUEUE_SIZE,
+    put_timeout=UPDATE_QUEUE_PUT_TIMEOUT,
+)
+update_deduplicator = UpdateDeduplicator(
+    maxsize=DEDUP_MAX_SIZE,
+    window=DEDUP_WINDOW,
+    path=DEDUP_STORE_PATH,
+)
+pending_updates = PendingUpdates(maxsize=UPDATE_QUEUE_SIZE)
+queue_depths.track("updates", update_queue.depth)
+queue_depths.track("pending_updates", lambda: len(pending_updates))
+cache_sizes.track("delivered_updates", lambda: len(update_deduplicator))
+
+WEBHOOK_SECONDS = registry.histogram(
+    "webhook_seconds",
+    "Latency of the webhook answer to Telegram",
+)
+WEBHOOK_UPDATES = registry.counter(
+    "webhook_updates_total",
+    "Webhook deliveries by outcome (queued, buffered, duplicate, rejected, invalid)",
+    ["outcome"],
+)
+
+
+@app.on_event("startup")
+async def on_startup() -> None:
+    """
+    Start processing updates, once the bot is loaded and warmed up.
+
+    With LAZY_STARTUP the bot is loaded in the background, and the webhook is
+    answered meanwhile.
+    """
+    await update_queue.start()
+    if LAZY_STARTUP:
+        app.state.bot_loading = asyncio.create_task(load_bot())
+    else:
+        await load_bot()
+
+
+@app.on_event("shutdown")
+async def on_shutdown() -> None:
+    """Process the queued updates and flush the journal before exiting."""
+    await update_queue.stop(timeout=UPDATE_QUEUE_PUT_TIMEOUT)
+    if not pending_updates.loading:
+        from src import storage  # noqa: WPS433
+
+        await storage.stop()
+
+
+async def load_bot() -> None:
+    """
+    Import the bot and warm it up, then queue the updates received meanwhile.
+
+    The buffering stops even if the bot fails to load, otherwise the webhook would
+    answer 503 forever. The updates are then queued anyway, and each one imports
+    the bot again when it is processed.
+    """
+    try:
+        bot_module = await import_in_background("src.bot")
+        boot_timer.mark("bot_imported")
+        from src import storage  # noqa: WPS433
+
+        await storage.start()
+        await bot_module.warm_up()
+        boot_timer.mark("ready")
+    except Exception:
+        logging.exception("Unable to load the bot")
+        raise
+    finally:
+        await queue_pending_updates()
+
+
+async def queue_pending_updates() -> None:
+    """Stop buffering the updates, and queue the ones received while loading."""
+    for update_data in pending_updates.release():
+        outcome = await queue_update(update_data)
+        if outcome == "rejected":
+            logging.error(f"Dropped update received while loading: {update_data}")
+        WEBHOOK_UPDATES.labels(outcome).inc()
 
 
 @app.post("/webhook")
 async def get_telegram_update(request: Request) -> Dict[str, bool]:
     """Get update from Telegram.
 
+    The update is queued for background processing, so Telegram gets its answer
+    without waiting for the handlers.
+
     Args:
         request (Request): The request object.
 
     Returns:
         dict: A success status.
     """
+    with WEBHOOK_SECONDS.time():
+        outcome = await handle_update(request)
+    WEBHOOK_UPDATES.labels(outcome).inc()
+    boot_timer.mark("first_update")
+    if outcome == "rejected":
+        raise HTTPException(status_code=HTTP_503_SERVICE_UNAVAILABLE)
+    return {"success": True}
+
+
+async def handle_update(request: Request) -> str:
+    """Queue or buffer an update, returning the outcome of the delivery."""
     try:
         request_data = await request.json()
     except JSONDecodeError as err:
         logging.error(f"Invalid request data from Telegram!!!, {err}")
         # HOT FIX: Telegram sends empty updates sometimes or invalid JSON
-        return {"success": True}
-    update = types.Update(**request_data)
-    await dp.feed_update(bot, update)
-    return {"success": True}
+        return "invalid"
+    if pending_updates.loading:
+        # queued once the bot is loaded, Telegram retries if there is no room
+        return "buffered" if pending_updates.add(request_data) else "rejected"
+    return await queue_update(request_data)
+
+
+async def queue_update(request_data: Dict[str, Any]) -> str:
+    """Queue an update for processing, returning the outcome of the delivery."""
+    from aiogram import types as aiogram_types  # noqa: WPS433
+
+    update = aiogram_types.Update(**request_data)
+    if update_deduplicator.is_duplicate(update):
+        logging.info(f"Skipping re-delivered update {update.update_id}")
+        return "duplicate"
+    if not await update_queue.put(update):
+        # Telegram retries the delivery later
+        update_deduplicator.forget(update)
+        return "rejected"
+    return "queued"
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Expose the metrics in the Prometheus text format."""
+    return PlainTextResponse(
+        registry.render(),
+        media_type="text/plain; version=0.0.4",
+    )
 
 
 @app.get("/set_webhook")
@@ -40,6 +185,8 @@ def url_setter() -> Dict[Any, Any]:
     Returns:
         dict: The response from the webhook URL setup.
     """
+    import requests  # noqa: WPS433
+    from src.bot import bot_url  # noqa: WPS433
 
     set_url: str = f"{bot_url}/setWebHook?url=https://{WEBHOOK_HOST}"
     set_url = f"{set_url}/webhook"
@@ -47,3 +194,6 @@ def url_setter() -> Dict[Any, Any]:
 
     resp = requests.get(set_url, timeout=10)  # Added a timeout
     return resp.json()
+
+
+boot_timer.mark("app_imported")
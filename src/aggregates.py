@@ -0,0 +1,275 @@
+"""Materialized per-month spending aggregates."""
+import itertools
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import date
+from typing import DefaultDict, Dict, Iterable, List, Optional, Set, Tuple
+
+from src.finances import SheetSpending
+from src.settings import AGGREGATE_STORE_SIZE, AGGREGATE_TTL
+from src.spending_frame import SpendingFrame
+from src.tenants import get_tenant
+
+MonthKey = Tuple[int, int]
+
+MONTHS_IN_YEAR = 12
+
+_revisions = itertools.count(1)
+
+
+def month_index(day: date) -> int:
+    """Count the months from the start of the calendar to the month of a day."""
+    return day.year * MONTHS_IN_YEAR + day.month - 1
+
+
+def months_between(start: date, end: date) -> List[MonthKey]:
+    """List the (year, month) pairs from start to end, both included."""
+    months: List[MonthKey] = []
+    for index in range(month_index(start), month_index(end) + 1):
+        year, month = divmod(index, MONTHS_IN_YEAR)
+        months.append((year, month + 1))
+    return months
+
+
+def sum_days(
+    by_day: Dict[Tuple[int, str], float],
+    days: Set[int],
+) -> DefaultDict[str, float]:
+    """
+    Sum per-day amounts by their key over the given days.
+
+    :param by_day: Amounts keyed by the day of the month and a name
+    :param days: The days of the month to sum
+    :return: The amounts by name
+    """
+    sums: DefaultDict[str, float] = defaultdict(float)
+    for (day, name), amount in by_day.items():
+        if day in days:
+            sums[name] += amount
+    return sums
+
+
+class SpendingTotals:
+    """Sums of a set of spendings, in common currency (USD)."""
+
+    def __init__(self) -> None:
+        self.by_category: DefaultDict[str, float] = defaultdict(float)
+        self.by_source: DefaultDict[str, float] = defaultdict(float)
+        self.total: float = 0
+        self.count: int = 0
+        self.days: Set[date] = set()
+
+    def merge(self, other: "SpendingTotals") -> None:
+        """Add the sums of other totals."""
+        for category, category_cost in other.by_category.items():
+            self.by_category[category] += category_cost
+        for source, source_cost in other.by_source.items():
+            self.by_source[source] += source_cost
+        self.total += other.total
+        self.count += other.count
+        self.days |= other.days
+
+
+class MonthlyAggregate:
+    """
+    Per-day sums of the spendings of one month by category and by source.
+
+    The revision changes whenever the sums do, so results derived from the
+    aggregate can be validated against it.
+    """
+
+    def __init__(self, year: int, month: int) -> None:
+        self.year = year
+        self.month = month
+        self.revision = next(_revisions)
+        self.by_day_category: DefaultDict[Tuple[int, str], float] = defaultdict(float)
+        self.by_day_source: DefaultDict[Tuple[int, str], float] = defaultdict(float)
+        self.count_by_day: DefaultDict[int, int] = defaultdict(int)
+
+    @classmethod
+    def from_spendings(
+        cls,
+        year: int,
+        month: int,
+        spendings: Iterable[SheetSpending],
+    ) -> "MonthlyAggregate":
+        aggregate = cls(year, month)
+        for spending in spendings:
+            aggregate.add(spending)
+        return aggregate
+
+    @classmethod
+    def from_frame(
+        cls,
+        year: int,
+        month: int,
+        frame: SpendingFrame,
+    ) -> "MonthlyAggregate":
+        """Build the aggregate with group-by sums over the columns of a frame."""
+        aggregate = cls(year, month)
+        aggregate.by_day_category.update(frame.group_sum("day", "category"))
+        aggregate.by_day_source.update(frame.group_sum("day", "source"))
+        aggregate.count_by_day.update(
+            {day: count for (day,), count in frame.group_count("day").items()},
+        )
+        return aggregate
+
+    def add(self, spending: SheetSpending) -> None:
+        """Apply a spending of this month."""
+        day = spending.datetime.day
+        usd = spending.usd or 0
+        self.by_day_category[day, spending.category] += usd
+        self.by_day_source[day, spending.source] += usd
+        self.count_by_day[day] += 1
+        self.revision = next(_revisions)
+
+    def same_sums(self, other: "MonthlyAggregate") -> bool:
+        """Check whether two aggregates hold the same sums."""
+        return (
+            self.by_day_category == other.by_day_category
+            and self.by_day_source == other.by_day_source
+            and self.count_by_day == other.count_by_day
+        )
+
+    def totals(self, days: Optional[Iterable[int]] = None) -> SpendingTotals:
+        """
+        Sum the month up.
+
+        :param days: Restrict the sums to these days of the month
+        :return: The spending totals
+        """
+        selected_days = set(self.count_by_day if days is None else days)
+        totals = SpendingTotals()
+        totals.by_category = sum_days(self.by_day_category, selected_days)
+        totals.by_source = sum_days(self.by_day_source, selected_days)
+        totals.total = sum(totals.by_category.values())
+        for day, count in self.count_by_day.items():
+            if day in selected_days:
+                totals.count += count
+                totals.days.add(date(self.year, self.month, day))
+        return totals
+
+    def totals_between(self, start: date, end: date) -> SpendingTotals:
+        """Sum the days of the month from start to end, both included."""
+        first_day = 1
+        if (start.year, start.month) == (self.year, self.month):
+            first_day = start.day
+        last_day = 31
+        if (end.year, end.month) == (self.year, self.month):
+            last_day = end.day
+        return self.totals(days=range(first_day, last_day + 1))
+
+
+class AggregateStore:
+    """
+    In-process aggregates keyed by (year, month).
+
+    Written spendings are applied as deltas to the aggregates already built, the
+    missing ones are rebuilt lazily by the reader. Aggregates expire after ``ttl``
+    seconds, so edits made directly in the sheet are eventually picked up. At most
+    ``maxsize`` months are kept, the expired and least recently used ones are
+    dropped first.
+    """
+
+    def __init__(
+        self,
+        ttl: float = AGGREGATE_TTL,
+        maxsize: int = AGGREGATE_STORE_SIZE,
+    ) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._aggregates: "OrderedDict[MonthKey, Tuple[MonthlyAggregate, float]]" = (
+            OrderedDict()
+        )
+        # writes applied to each month, a rebuild read before one is outdated
+        self._generations: DefaultDict[MonthKey, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def get(self, year: int, month: int) -> Optional[MonthlyAggregate]:
+        """Return the aggregate of a month, None if it must be rebuilt."""
+        with self._lock:
+            stored = self._aggregates.get((year, month))
+            if stored is not None:
+                self._aggregates.move_to_end((year, month))
+        if stored is None:
+            return None
+        aggregate, built_at = stored
+        if time.monotonic() - built_at > self.ttl:
+            return None
+        return aggregate
+
+    def generation(self, year: int, month: int) -> int:
+        """Return the number of writes to a month, taken before a rebuild reads it."""
+        with self._lock:
+            return self._generations[year, month]
+
+    def put(
+        self,
+        aggregate: MonthlyAggregate,
+        generation: Optional[int] = None,
+    ) -> bool:
+        """
+        Store a freshly built aggregate, keeping the revision if unchanged.
+
+        :param aggregate: The rebuilt aggregate
+        :param generation: The generation of the month before the rebuild read it
+        :return: False if the month was written to since, the aggregate is not stored
+        """
+        with self._lock:
+            month = (aggregate.year, aggregate.month)
+            if generation is not None and self._generations[month] != generation:
+                return False
+            previous = self._aggregates.get((aggregate.year, aggregate.month))
+            if previous is not None and previous[0].same_sums(aggregate):
+                aggregate.revision = previous[0].revision
+            self._aggregates[aggregate.year, aggregate.month] = (
+                aggregate,
+                time.monotonic(),
+            )
+            self._aggregates.move_to_end((aggregate.year, aggregate.month))
+            self._evict()
+        return True
+
+    def apply(self, spendings: Iterable[SheetSpending]) -> None:
+        """Apply written spendings to the aggregates of their months."""
+        with self._lock:
+            for spending in spendings:
+                month = (spending.datetime.year, spending.datetime.month)
+                self._generations[month] += 1
+                stored = self._aggregates.get(month)
+                if stored is not None:
+                    stored[0].add(spending)
+
+    def invalidate(self, year: int, month: int) -> None:
+        """Drop the aggregate of a month."""
+        with self._lock:
+            self._generations[year, month] += 1
+            self._aggregates.pop((year, month), None)
+
+    def __len__(self) -> int:
+        return len(self._aggregates)
+
+    def _evict(self) -> None:
+        expired_at = time.monotonic() - self.ttl
+        for month, (_, built_at) in list(self._aggregates.items()):
+            if built_at < expired_at:
+                self._aggregates.pop(month)
+        while len(self._aggregates) > self.maxsize:
+            self._aggregates.popitem(last=False)
+
+
+# aggregates by tenant, months of different spreadsheets never mix
+aggregate_stores: Dict[str, AggregateStore] = {}
+_aggregate_stores_lock = threading.Lock()
+
+
+def get_aggregate_store() -> AggregateStore:
+    """Return the aggregates of the current tenant."""
+    tenant_key = get_tenant().key
+    with _aggregate_stores_lock:
+        store = aggregate_stores.get(tenant_key)
+        if store is None:
+            store = AggregateStore()
+            aggregate_stores[tenant_key] = store
+        return store
@@ -1,17 +1,25 @@
 """Telegram bot for managing spendings."""
 import logging
+import tempfile
+from datetime import date
 from io import BytesIO
-from typing import Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
-from aiogram import Bot, Dispatcher, types
+from aiogram import BaseMiddleware, Bot, Dispatcher, F, types  # noqa: WPS347
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
 from aiogram.types import BufferedInputFile  # noqa:WPS458
-from src.finances import Spending
+from src import storage, tracing
+from src.currency_converter import CurrencyConverter
+from src.exporter import ExportInputFile, export_spendings
+from src.finances import CURRENCIES
+from src.importer import ImportFileError, SpendingImport
+from src.metrics import registry
 from src.phrase import HELP_MESSAGE, WELCOME_MESSAGE
-from src.report_service import ReportService
-from src.settings import TELEGRAM_BOT_TOKEN
-from src.spreadsheets import add_spending as add_spending_spreadsheet
+from src.report_service import ReportService, parse_report_period
+from src.settings import IMPORT_CHUNK_SIZE, TELEGRAM_BOT_TOKEN
+from src.spending_parser import SPENDING_FORMAT_ERROR, ParseErrors, parse_spendings
+from src.tenants import tenant_router, use_tenant
 
 logging.basicConfig(level=logging.INFO)
 
@@ -20,11 +28,91 @@ bot_commands = [
     types.BotCommand(command="start", description="Start the bot"),
     types.BotCommand(command="help", description="Help"),
     types.BotCommand(command="report", description="Generate report"),
+    types.BotCommand(command="export", description="Export spendings as CSV"),
 ]
 
+# import errors listed in the reply, the rest are only counted
+MAX_REPORTED_IMPORT_ERRORS = 10
+# trailing /export arguments asking for a gzipped file
+GZIP_ARGUMENTS = frozenset(("gz", "gzip"))
+
+# the data passed along an update, and the next middleware or handler it goes to
+HandlerData = Dict[str, Any]
+Handler = Callable[[types.TelegramObject, HandlerData], Awaitable[Any]]
+
 bot = Bot(TELEGRAM_BOT_TOKEN)
 dp = Dispatcher(bot=bot)
 
+HANDLER_SECONDS = registry.histogram(
+    "bot_handler_seconds",
+    "Latency of the bot handlers",
+    ["handler"],
+)
+HANDLER_ERRORS = registry.counter(
+    "bot_handler_errors_total",
+    "Bot handlers failed with an exception",
+    ["handler"],
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Measure the latency and the failures of the handler a message goes to."""
+
+    async def __call__(
+        self,
+        handler: Handler,
+        event: types.TelegramObject,
+        data: HandlerData,
+    ) -> Any:
+        handler_name = data["handler"].callback.__name__
+        with HANDLER_SECONDS.labels(handler_name).time():
+            with tracing.span(f"bot.{handler_name}"):
+                try:
+                    return await handler(event, data)
+                except Exception:
+                    HANDLER_ERRORS.labels(handler_name).inc()
+                    raise
+
+
+class TracingMiddleware(BaseMiddleware):
+    """Trace every update, and profile a sampled fraction of them."""
+
+    async def __call__(
+        self,
+        handler: Handler,
+        event: types.TelegramObject,
+        data: HandlerData,
+    ) -> Any:
+        update_id = getattr(event, "update_id", "unknown")
+        name = f"update-{update_id}"
+        with tracing.trace(name):
+            with tracing.sampled_profile(name):
+                return await handler(event, data)
+
+
+class TenantMiddleware(BaseMiddleware):
+    """Route the storage calls of an update to the spreadsheet of its chat."""
+
+    async def __call__(
+        self,
+        handler: Handler,
+        event: types.TelegramObject,
+        data: HandlerData,
+    ) -> Any:
+        chat: Optional[types.Chat] = data.get("event_chat")
+        user: Optional[types.User] = data.get("event_from_user")
+        tenant = tenant_router.resolve(
+            chat.id if chat else None,
+            user.id if user else None,
+        )
+        with use_tenant(tenant):
+            return await handler(event, data)
+
+
+dp.update.outer_middleware(TracingMiddleware())
+dp.update.outer_middleware(TenantMiddleware())
+dp.message.middleware(HandlerMetricsMiddleware())
+
 
 @dp.message(Command("start"))
 async def send_welcome(message: types.Message) -> None:
@@ -62,19 +150,18 @@ async def generate_report(message: types.Message) -> None:
         await safe_replay(message, "No data provided")
         return
 
-    arguments = [el.strip() for el in message.text.split(" ")]
+    arguments = message.text.split()
 
     # remove headers
     arguments = arguments[1:]
 
-    if len(arguments) != 1:
-        await safe_replay(
-            message,
-            "Pass only one argument - date in format YYYY-MM or YYYY-MM-DD",
-        )
+    try:
+        start, end = parse_report_period(arguments)
+    except ValueError as error:
+        await safe_replay(message, str(error))
         return
 
-    report, photo = ReportService.generate_report(*arguments[0].split("-"))
+    report, photo = await ReportService.generate_report(start, end)
 
     await safe_replay(
         message,
@@ -85,6 +172,133 @@ async def generate_report(message: types.Message) -> None:
     )
 
 
+@dp.message(Command("export"))
+async def export(message: types.Message) -> None:
+    """
+    Send the spendings of a period as a CSV document.
+
+    Args:
+        message (types.Message): The message object from Telegram.
+    """
+    logging.info(f"Exporting spendings for message: {message}")
+
+    if not message.text:
+        await safe_replay(message, "No data provided")
+        return
+
+    try:
+        start, end, compress = parse_export_arguments(message.text)
+    except ValueError as error:
+        await safe_replay(message, str(error))
+        return
+
+    await send_export(message, start, end, compress)
+
+
+def parse_export_arguments(text: str) -> Tuple[date, date, bool]:
+    """Parse the /export arguments into the period and whether to gzip the file."""
+    # remove headers
+    arguments = text.split()[1:]
+    last_argument = arguments[-1].lower() if arguments else ""
+    compress = last_argument in GZIP_ARGUMENTS
+    if compress:
+        arguments = arguments[:-1]
+    start, end = parse_report_period(arguments)
+    return start, end, compress
+
+
+async def send_export(
+    message: types.Message,
+    start: date,
+    end: date,
+    compress: bool,
+) -> None:
+    """Export the spendings of a period and reply with the CSV document."""
+    export_file, count = await storage.run_in_worker(
+        export_spendings,
+        start,
+        end,
+        compress,
+    )
+    with export_file:
+        filename = f"spendings_{start.isoformat()}_{end.isoformat()}.csv"
+        if compress:
+            filename = f"{filename}.gz"
+        try:
+            await message.reply_document(
+                ExportInputFile(export_file, filename=filename),
+                caption=f"Spendings exported, count: {count}",
+            )
+        except TelegramBadRequest as err:
+            logging.info(f"Export not sent, reason: {err}")
+
+
+async def write_import(
+    spending_import: SpendingImport,
+    progress: types.Message,
+) -> None:
+    """Write the spendings of an import chunk by chunk, reporting the progress."""
+    while True:
+        chunk = await storage.run_in_worker(
+            spending_import.read_chunk,
+            IMPORT_CHUNK_SIZE,
+        )
+        if not chunk:
+            return
+        await storage.add_spending(chunk)
+        await safe_edit(
+            progress,
+            f"Importing spendings... imported: {spending_import.imported}",
+        )
+
+
+def import_summary(spending_import: SpendingImport) -> str:
+    """Describe a finished import, with the first invalid rows."""
+    skipped = len(spending_import.errors)
+    errors = [
+        f"line {line_number}: {error}"
+        for line_number, error in spending_import.errors[:MAX_REPORTED_IMPORT_ERRORS]
+    ]
+    return "\n".join(
+        [
+            f"Spendings imported, count: {spending_import.imported}",
+            f"Invalid rows skipped: {skipped}",
+            *errors,
+        ],
+    )
+
+
+@dp.message(F.document)
+async def import_spendings(message: types.Message) -> None:
+    """
+    Import spendings from an uploaded CSV/TSV document.
+
+    The file is downloaded to a temporary file and parsed lazily, the spendings
+    are written to the spreadsheet in chunks of IMPORT_CHUNK_SIZE rows.
+
+    Args:
+        message (types.Message): The message object with the document.
+    """
+    logging.info(f"Importing spendings for message: {message}")
+    if message.document is None:
+        return
+
+    progress = await message.reply("Importing spendings...")
+    with tempfile.TemporaryFile() as import_file:
+        await bot.download(message.document, destination=import_file)
+        spending_import = SpendingImport(import_file)
+        try:
+            await write_import(spending_import, progress)
+        except ImportFileError as error:
+            await safe_edit(
+                progress,
+                f"Import stopped, imported: {spending_import.imported}\n{error}",
+            )
+            return
+
+    await safe_edit(progress, import_summary(spending_import))
+
+
 @dp.message()
 async def add_spending(message: types.Message) -> None:
     """
@@ -98,19 +312,32 @@ async def add_spending(message: types.Message) -> None:
         await safe_replay(message, "No data provided")
         return
 
-    spending_records = message.text.split("|")
-    try:
-        spending_objects = [
-            Spending.from_string(record.strip()) for record in spending_records
-        ]
-    except ValueError as error:
-        await safe_replay(message, str(error))
+    spending_objects, errors = parse_spendings(message.text)
+    if not spending_objects:
+        await safe_replay(
+            message,
+            "\n".join([SPENDING_FORMAT_ERROR, *report_parse_errors(errors)]),
+        )
         return
-    add_spending_spreadsheet(spending_objects)
-    await safe_replay(
-        message,
-        f"Spendings added, count: {len(spending_objects)}",  # noqa:WPS237
-    )
+    await storage.record_spending(spending_objects)
+    await safe_replay(message, add_summary(len(spending_objects), errors))
+
+
+def report_parse_errors(errors: ParseErrors) -> List[str]:
+    """Describe the first invalid records of a message."""
+    return [
+        f"record {position}: {error}"
+        for position, error in errors[:MAX_REPORTED_IMPORT_ERRORS]
+    ]
+
+
+def add_summary(added: int, errors: ParseErrors) -> str:
+    """Describe the added spendings, with the first invalid records."""
+    summary = [f"Spendings added, count: {added}"]
+    skipped = len(errors)
+    if skipped:
+        summary.append(f"Invalid records skipped: {skipped}")
+    return "\n".join([*summary, *report_parse_errors(errors)])
 
 
 async def safe_replay(
@@ -132,9 +359,26 @@ async def safe_replay(
         logging.info("Replay not achieved, reason: TelegramBadRequest", err)
 
 
+async def warm_up() -> None:
+    """Prepare the caches and the storage before the first update arrives."""
+    CurrencyConverter.prefetch(CURRENCIES)
+    await storage.warm_up()
+
+
+async def safe_edit(message: types.Message, text: str) -> None:
+    try:
+        await message.edit_text(text)
+    except TelegramBadRequest as err:
+        logging.info(f"Edit not achieved, reason: {err}")
+
+
 async def run_bot() -> None:
     """Run the Telegram bot."""
+    await warm_up()
+    await storage.start()
     await bot.set_my_commands(bot_commands)
+    # flushes the journal once polling stops
+    dp.shutdown.register(storage.stop)
     await dp.start_polling(bot)
 
 
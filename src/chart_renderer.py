@@ -0,0 +1,43 @@
+"""
+Local rendering of the charts, run in the chart render processes.
+
+The render processes import this module only, so it must not import the rest of
+the application: a child importing the storage would open its own journal, shared
+cache and thread pools.
+"""
+from io import BytesIO
+from typing import Any, Dict
+
+
+def render_pie_png(options: Dict[str, Any]) -> bytes:
+    """
+    Render a pie chart to PNG with matplotlib.
+
+    Runs in a worker process, matplotlib is an optional dependency
+    (``poetry install --extras charts``).
+    """
+    # the backend is picked before pyplot is imported
+    from matplotlib import use as use_backend  # noqa: WPS433
+
+    use_backend("Agg")
+    from matplotlib import pyplot  # noqa: WPS433
+
+    figure, axes = pyplot.subplots(figsize=options["figsize"])
+    wedges, _, _ = axes.pie(
+        options["chart_values"],
+        autopct=options["autopct"],
+        startangle=options["chart_rotation"],
+    )
+    axes.set_title(options["title"])
+    axes.axis("equal")
+    axes.legend(
+        wedges,
+        options["labels"],
+        title=options["legend_title"],
+        loc=options["legend_loc"],
+        bbox_to_anchor=options["bbox_to_anchor"],
+    )
+    png = BytesIO()
+    figure.savefig(png, format="png", bbox_inches="tight")
+    pyplot.close(figure)
+    return png.getvalue()
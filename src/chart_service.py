@@ -1,15 +1,54 @@
+import asyncio
+import hashlib
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
-from requests import Response, post
-from src.settings import CHART_SERVICE_RESPONSE_TIMEOUT, CHART_SERVICE_URL
+from requests import Response, Session
+from src import storage, tracing
+from src.cache import LRUCache
+from src.chart_renderer import render_pie_png
+from src.metrics import CACHE_REQUESTS, cache_sizes, registry
+from src.settings import (
+    CHART_CACHE_SIZE,
+    CHART_RENDER_WORKERS,
+    CHART_RENDERER,
+    CHART_SERVICE_RESPONSE_TIMEOUT,
+    CHART_SERVICE_URL,
+)
 
 DEFAULT_BB_TO_ANCHOR = (1, 0, 0.5, 1)
 
+CHART_RENDER_SECONDS = registry.histogram(
+    "chart_render_seconds",
+    "Latency of the charts rendering, by renderer (remote, local)",
+    ["renderer"],
+)
+
+
+def chart_key(chart_type: str, options: Dict[str, Any]) -> str:
+    """Hash a chart type and its options into a cache key."""
+    payload = json.dumps({"chart": chart_type, **options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
 
 class ChartService:
-    @staticmethod
-    def pie(  # noqa:WPS211
+    """
+    Render charts with the chart service, or locally with matplotlib.
+
+    Rendered charts are cached by a hash of their values, labels and options, so
+    identical charts are never rendered twice.
+    """
+
+    cache: LRUCache[bytes] = LRUCache(CHART_CACHE_SIZE)
+    _session = Session()
+    _process_pool: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    async def pie(  # noqa:WPS211
+        cls,
         chart_values: List[float],
         labels: List[str],
         figsize: Tuple[int, int] = (10, 10),
@@ -20,20 +59,64 @@ class ChartService:
         bbox_to_anchor: Tuple[float, float, float, float] = DEFAULT_BB_TO_ANCHOR,
         autopct: str = "%1.1f%%",
     ) -> BytesIO:
-        pie: Response = post(
-            url=CHART_SERVICE_URL + "/pie",
-            json={
-                "chart_values": chart_values,
-                "labels": labels,
-                "figsize": figsize,
-                "chart_rotation": chart_rotation,
-                "title": title,
-                "legend_title": legend_title,
-                "legend_loc": legend_loc,
-                "bbox_to_anchor": bbox_to_anchor,
-                "autopct": autopct,
-            },
-            stream=True,
+        options = {
+            "chart_values": chart_values,
+            "labels": labels,
+            "figsize": figsize,
+            "chart_rotation": chart_rotation,
+            "title": title,
+            "legend_title": legend_title,
+            "legend_loc": legend_loc,
+            "bbox_to_anchor": bbox_to_anchor,
+            "autopct": autopct,
+        }
+        key = chart_key("pie", options)
+        png = cls.cache.get(key)
+        if png is not None:
+            CACHE_REQUESTS.labels("chart", "hit").inc()
+            return BytesIO(png)
+        CACHE_REQUESTS.labels("chart", "miss").inc()
+        with CHART_RENDER_SECONDS.labels(CHART_RENDERER).time():
+            with tracing.span(f"chart.{CHART_RENDERER}"):
+                png = await cls.render_pie(options)
+        return BytesIO(png)
+
+    @classmethod
+    async def render_pie(cls, options: Dict[str, Any]) -> bytes:
+        """Render a pie chart with the configured renderer and cache it."""
+        if CHART_RENDERER == "local":
+            loop = asyncio.get_running_loop()
+            png = await loop.run_in_executor(
+                cls.get_process_pool(),
+                render_pie_png,
+                options,
+            )
+            cls.cache.put(chart_key("pie", options), png)
+            return png
+        return await storage.run_in_worker(cls.request_chart, "pie", options)
+
+    @classmethod
+    def request_chart(cls, chart_type: str, options: Dict[str, Any]) -> bytes:
+        """Render a chart with the chart service, reusing its connection."""
+        chart: Response = cls._session.post(
+            url=f"{CHART_SERVICE_URL}/{chart_type}",
+            json=options,
             timeout=CHART_SERVICE_RESPONSE_TIMEOUT,
         )
-        return BytesIO(pie.content)
+        if chart.ok:
+            cls.cache.put(chart_key(chart_type, options), chart.content)
+        return chart.content
+
+    @classmethod
+    def get_process_pool(cls) -> ProcessPoolExecutor:
+        """Start the local rendering processes on first use."""
+        if cls._process_pool is None:
+            # forked from a process running threads, a child could inherit held locks
+            cls._process_pool = ProcessPoolExecutor(
+                max_workers=CHART_RENDER_WORKERS,
+                mp_context=multiprocessing.get_context("forkserver"),
+            )
+        return cls._process_pool
+
+
+cache_sizes.track("chart", lambda: len(ChartService.cache))
@@ -1,52 +1,243 @@
-import functools
+import contextvars
 import json
 import logging
-from typing import Any, Dict
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
 
 import google_currency
+from src import tracing
+from src.metrics import CACHE_REQUESTS, cache_sizes, registry
+from src.settings import FX_RATE_TTL, FX_RATES_PATH
+from src.shared_cache import SharedCache, shared_cache
 
 logger = logging.getLogger(__name__)
 
+FX_FETCH_SECONDS = registry.histogram(
+    "fx_fetch_seconds",
+    "Latency of the exchange rate requests",
+)
 
-class CurrencyConverter:
-    """Currency converter class."""
+CurrencyPair = Tuple[str, str]
 
-    @classmethod
-    @functools.lru_cache(maxsize=10)
-    def get_rate(cls, from_currency: str, to_currency: str) -> float:  # noqa: C901
-        """Get rate from a currency to another."""
-        if from_currency == to_currency:
-            return 1.0
 
-        resp: str = google_currency.convert(from_currency, to_currency, 1)
-        try:
-            resp_json: Dict[str, Any] = json.loads(resp)
-        except json.JSONDecodeError as err:
-            logger.error(
-                f"Unable to convert from {from_currency} to {to_currency}",
-                err,
+class RateStore:
+    """
+    Exchange rates with an expiry time, persisted to a JSON file.
+
+    With a shared cache the rates are kept there instead, so the worker processes
+    of the host fetch each rate once for all of them.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float,
+        shared: Optional[SharedCache] = None,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.shared = shared
+        self._rates: Dict[str, Tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        if shared is None:
+            self._load()
+
+    def get(self, from_currency: str, to_currency: str) -> Tuple[Optional[float], bool]:
+        """Return the rate, or None if unknown, and whether it is still fresh."""
+        key = self._key(from_currency, to_currency)
+        if self.shared is not None:
+            cached = self.shared.get(key)
+            if cached is None:
+                return None, False
+            return cached[0], cached[1] <= self.ttl
+        with self._lock:
+            stored_rate = self._rates.get(key)
+        if stored_rate is None:
+            return None, False
+        rate, fetched_at = stored_rate
+        return rate, time.time() - fetched_at <= self.ttl
+
+    def set_many(self, rates: Dict[CurrencyPair, float]) -> None:
+        """Store fetched rates and persist the store."""
+        if self.shared is not None:
+            self.shared.set_many(
+                {self._key(*pair): rate for pair, rate in rates.items()},
             )
-            return 0
+            return
+        fetched_at = time.time()
+        with self._lock:
+            for (from_currency, to_currency), rate in rates.items():
+                self._rates[self._key(from_currency, to_currency)] = (rate, fetched_at)
+            self._save()
+
+    def fill(
+        self,
+        pair: CurrencyPair,
+        fetch: Callable[[str, str], Optional[float]],
+    ) -> Optional[float]:
+        """Fetch and store a rate, unless another worker process just did."""
+        if self.shared is None:
+            rate = fetch(*pair)
+            if rate is not None:
+                self.set_many({pair: rate})
+            return rate
+        return self.shared.fill(
+            self._key(*pair),
+            lambda: fetch(*pair),
+            lambda _, age: age <= self.ttl,
+        )
+
+    def __len__(self) -> int:
+        if self.shared is not None:
+            return self.shared.count("fx:")
+        return len(self._rates)
+
+    def _key(self, from_currency: str, to_currency: str) -> str:
+        if self.shared is not None:
+            return f"fx:{from_currency}/{to_currency}"
+        return f"{from_currency}/{to_currency}"
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r") as rates_file:
+                self._rates = {
+                    pair: (rate, fetched_at)
+                    for pair, (rate, fetched_at) in json.load(rates_file).items()
+                }
+        except (OSError, ValueError) as err:
+            logger.error(f"Unable to load exchange rates from {self.path}: {err}")
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
         try:
-            rate = float(resp_json["amount"])
-        except KeyError as err:  # ignore:WPS440
+            with open(tmp_path, "w") as rates_file:
+                json.dump(self._rates, rates_file)
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logger.error(f"Unable to save exchange rates to {self.path}: {err}")
+
+
+class CurrencyConverter:
+    """
+    Currency converter class.
+
+    Known rates are served from the rate store and refreshed in the background once
+    they expire, so only a rate that was never fetched is requested inline.
+    """
+
+    rate_store = RateStore(FX_RATES_PATH, FX_RATE_TTL, shared_cache)
+    _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fx")
+    # refreshes wait on fetches of the executor above, they never take its workers
+    _refresh_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fx-bg")
+    _refreshing: Set[CurrencyPair] = set()
+    _refreshing_lock = threading.Lock()
+
+    @classmethod
+    def fetch_rate(cls, from_currency: str, to_currency: str) -> Optional[float]:
+        """Request a rate from a currency to another, None if it is unavailable."""
+        with FX_FETCH_SECONDS.time():
+            with tracing.span("fx.fetch"):
+                resp: str = google_currency.convert(from_currency, to_currency, 1)
+        try:
+            # a JSONDecodeError is a ValueError
+            rate = float(json.loads(resp)["amount"])
+        except (KeyError, ValueError) as err:
             logger.error(
-                f"Unable to convert from {from_currency} to {to_currency}",
-                err,
-                resp,
+                f"Unable to convert from {from_currency} to {to_currency}: "
+                + f"{err}, {resp}",
             )
-            return 0
-        except ValueError as err:  # ignore:WPS440
-            logger.error(
-                f"Unable to convert from {from_currency} to {to_currency}",
-                err,
-                resp,
+            return None
+        logger.info(f"Fetched rate {from_currency} to {to_currency}: {rate}")
+        return rate
+
+    @classmethod
+    def fetch_rates(cls, pairs: Iterable[CurrencyPair]) -> Dict[CurrencyPair, float]:
+        """Request several rates concurrently and store the available ones."""
+        pairs = list(pairs)
+        # the trace of the update goes along to the fetching threads, a copy each
+        # as a context is run by one thread at a time
+        context = contextvars.copy_context()
+        fetched = cls._executor.map(
+            lambda pair: context.copy().run(cls.rate_store.fill, pair, cls.fetch_rate),
+            pairs,
+        )
+        return {pair: rate for pair, rate in zip(pairs, fetched) if rate is not None}
+
+    @classmethod
+    def refresh(cls, pairs: Iterable[CurrencyPair]) -> Optional[Future[Any]]:
+        """Refresh rates in the background, skipping the ones already refreshing."""
+        with cls._refreshing_lock:
+            pairs = [pair for pair in pairs if pair not in cls._refreshing]
+            cls._refreshing.update(pairs)
+        if not pairs:
+            return None
+        future = cls._refresh_executor.submit(
+            contextvars.copy_context().run,
+            cls.fetch_rates,
+            pairs,
+        )
+        future.add_done_callback(lambda _: cls._refresh_done(pairs))
+        return future
+
+    @classmethod
+    def prefetch(
+        cls,
+        currencies: Iterable[str],
+        to_currency: str = "USD",
+    ) -> Optional[Future[Any]]:
+        """Fetch in the background the missing or expired rates of currencies."""
+        pairs: List[CurrencyPair] = []
+        for from_currency in currencies:
+            if from_currency == to_currency:
+                continue
+            rate, fresh = cls.rate_store.get(from_currency, to_currency)
+            if rate is None or not fresh:
+                pairs.append((from_currency, to_currency))
+        return cls.refresh(pairs)
+
+    @classmethod
+    def get_rate(cls, from_currency: str, to_currency: str) -> Optional[float]:
+        """Get rate from a currency to another, None if it is unavailable."""
+        if from_currency == to_currency:
+            return 1.0
+
+        rate, fresh = cls.rate_store.get(from_currency, to_currency)
+        if rate is None:
+            CACHE_REQUESTS.labels("fx_rate", "miss").inc()
+            return cls.fetch_rates([(from_currency, to_currency)]).get(
+                (from_currency, to_currency),
             )
-            return 0
-        logger.info(f"Converted {from_currency} to {to_currency} with rate {rate}")
+        if fresh:
+            CACHE_REQUESTS.labels("fx_rate", "hit").inc()
+        else:
+            CACHE_REQUESTS.labels("fx_rate", "stale").inc()
+            cls.refresh([(from_currency, to_currency)])
         return rate
 
     @classmethod
-    def convert(cls, from_currency: str, to_currency: str, amount: float) -> float:
-        """Convert from one currency to another."""
-        return amount * cls.get_rate(from_currency, to_currency)
+    def convert(
+        cls,
+        from_currency: str,
+        to_currency: str,
+        amount: float,
+    ) -> Optional[float]:
+        """Convert from one currency to another, None if the rate is unavailable."""
+        rate = cls.get_rate(from_currency, to_currency)
+        if rate is None:
+            return None
+        return amount * rate
+
+    @classmethod
+    def _refresh_done(cls, pairs: List[CurrencyPair]) -> None:
+        with cls._refreshing_lock:
+            cls._refreshing.difference_update(pairs)
+
+
+cache_sizes.track("fx_rate", lambda: len(CurrencyConverter.rate_store))
@@ -0,0 +1,123 @@
+"""Detection of Telegram updates delivered more than once."""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Iterator, List, Tuple
+
+# aiogram takes seconds to import, the webhook answers before it is loaded
+if TYPE_CHECKING:
+    from aiogram import types
+
+logger = logging.getLogger(__name__)
+
+
+def update_keys(update: "types.Update") -> List[str]:
+    """Return the keys identifying an update and the message it carries."""
+    keys = [f"update:{update.update_id}"]
+    message = update.message or update.edited_message
+    if message is not None:
+        chat_id = message.chat.id
+        keys.append(f"message:{chat_id}:{message.message_id}")
+    return keys
+
+
+def read_seen_keys(path: str) -> Iterator[Tuple[str, float]]:
+    """Read the keys appended to a file with the time they were seen at."""
+    with open(path, "r") as seen_file:
+        for line in seen_file:
+            key, _, seen_at = line.strip().rpartition(" ")
+            if key:
+                yield key, float(seen_at)
+
+
+class UpdateDeduplicator:
+    """
+    Remember the updates seen in the last ``window`` seconds.
+
+    At most ``maxsize`` keys are kept in memory. When ``path`` is set the keys are
+    also appended to that file and loaded back on start, so re-deliveries are
+    detected across restarts.
+    """
+
+    def __init__(self, maxsize: int, window: float, path: str = "") -> None:
+        self.maxsize = maxsize
+        self.window = window
+        self.path = path
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._appended = 0
+        self._load()
+
+    def is_duplicate(self, update: "types.Update") -> bool:
+        """Check whether an update was seen, and remember it if it was not."""
+        keys = update_keys(update)
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            if any(key in self._seen for key in keys):
+                return True
+            for key in keys:
+                self._seen[key] = now
+            while len(self._seen) > self.maxsize:
+                self._seen.popitem(last=False)
+            self._persist(keys, now)
+        return False
+
+    def forget(self, update: "types.Update") -> None:
+        """Forget an update that was not processed, so its re-delivery is kept."""
+        with self._lock:
+            for key in update_keys(update):
+                self._seen.pop(key, None)
+            self._compact()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _expire(self, now: float) -> None:
+        while self._seen:
+            oldest_key, seen_at = next(iter(self._seen.items()))
+            if now - seen_at <= self.window:
+                return
+            self._seen.pop(oldest_key)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            self._seen.update(read_seen_keys(self.path))
+        except (OSError, ValueError) as err:
+            logger.error(f"Unable to load seen updates from {self.path}: {err}")
+        self._expire(time.time())
+        while len(self._seen) > self.maxsize:
+            self._seen.popitem(last=False)
+        self._compact()
+
+    def _persist(self, keys: List[str], now: float) -> None:
+        if not self.path:
+            return
+        self._appended += len(keys)
+        if self._appended > self.maxsize:
+            self._compact()
+            return
+        try:
+            with open(self.path, "a") as seen_file:
+                seen_file.writelines(f"{key} {now}\n" for key in keys)
+        except OSError as err:
+            logger.error(f"Unable to save seen updates to {self.path}: {err}")
+
+    def _compact(self) -> None:
+        """Rewrite the file with the remembered keys only."""
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w") as seen_file:
+                seen_file.writelines(
+                    f"{key} {seen_at}\n" for key, seen_at in self._seen.items()
+                )
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            logger.error(f"Unable to save seen updates to {self.path}: {err}")
+        self._appended = 0
@@ -0,0 +1,90 @@
+"""Streaming export of spendings to CSV files."""
+import csv
+import gzip
+import io
+from datetime import date
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, AsyncGenerator, Iterable, Iterator, List, Tuple, cast
+
+from aiogram.types import InputFile
+from src import storage
+from src.aggregates import months_between
+from src.settings import EXPORT_PAGE_SIZE, EXPORT_SPOOL_SIZE
+from src.spreadsheets import TABLE_HEADERS
+
+DATE_COLUMN_INDEX = TABLE_HEADERS.index("Date")
+
+
+def in_period(row: List[str], start: date, end: date) -> bool:
+    """Check whether a sheet row is dated within the period."""
+    try:
+        return start <= date.fromisoformat(row[DATE_COLUMN_INDEX]) <= end
+    except (IndexError, ValueError):
+        # keep rows with a date edited by hand, they are in a month of the period
+        return True
+
+
+def iter_export_rows(start: date, end: date) -> Iterator[List[str]]:
+    """Iterate over the sheet rows dated within the period."""
+    rows = storage.get_backend().iter_rows(months_between(start, end), EXPORT_PAGE_SIZE)
+    return (row for row in rows if row and in_period(row, start, end))
+
+
+def write_csv(
+    rows: Iterable[List[str]],
+    compress: bool = False,
+) -> Tuple[IO[bytes], int]:
+    """
+    Write rows to a CSV file, incrementally.
+
+    The file is kept in memory up to EXPORT_SPOOL_SIZE bytes and rolled over to
+    disk beyond, so memory use does not depend on the number of rows.
+
+    :param rows: The sheet rows
+    :param compress: Whether to gzip the file
+    :return: The file positioned at its start, and the number of written rows
+    """
+    export_file = cast(IO[bytes], SpooledTemporaryFile(max_size=EXPORT_SPOOL_SIZE))
+    binary_file = export_file
+    if compress:
+        binary_file = cast(IO[bytes], gzip.GzipFile(fileobj=export_file, mode="wb"))
+    text_file = io.TextIOWrapper(binary_file, encoding="utf-8", newline="")
+    count = write_rows(text_file, rows)
+    text_file.flush()
+    text_file.detach()
+    if compress:
+        binary_file.close()
+    export_file.seek(0)
+    return export_file, count
+
+
+def write_rows(text_file: IO[str], rows: Iterable[List[str]]) -> int:
+    """Write the header and the rows as CSV, return the number of rows."""
+    writer = csv.writer(text_file)
+    writer.writerow(TABLE_HEADERS)
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+    return count
+
+
+def export_spendings(start: date, end: date, compress: bool) -> Tuple[IO[bytes], int]:
+    """Export the spendings of a period to a CSV file."""
+    return write_csv(iter_export_rows(start, end), compress)
+
+
+class ExportInputFile(InputFile):
+    """Upload an export file chunk by chunk instead of loading it in memory."""
+
+    def __init__(self, export_file: IO[bytes], filename: str) -> None:
+        super().__init__(filename=filename)
+        self.export_file = export_file
+
+    async def read(self, bot: Any) -> AsyncGenerator[bytes, None]:
+        self.export_file.seek(0)
+        while True:
+            chunk = self.export_file.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
@@ -1,16 +1,19 @@
 from datetime import date
-from typing import Any, List, Literal, Optional
+from typing import Any, List, Literal, Optional, Tuple, get_args
 
 from pydantic import BaseModel, Field
 from src.currency_converter import CurrencyConverter
 
+Currency = Literal["USD", "RUB", "GEL", "EUR", "TRY", "AMD"]
+CURRENCIES: Tuple[str, ...] = get_args(Currency)
+
 
 class Spending(BaseModel):
     name: str = Field(..., description="Name")
     category: str = Field(..., description="Category")
     description: str = Field(..., description="Description")
     cost: float = Field(..., description="Cost")  # Assuming cost is a float
-    currency: Literal["USD", "RUB", "GEL", "EUR", "TRY", "AMD"] = Field(
+    currency: Currency = Field(
         ...,
         description="Currency",
     )
@@ -81,14 +84,12 @@ class SheetSpending(Spending):
     def from_list(cls, list_: List[Any]) -> "SheetSpending":
         cost = float(list_[3].replace(",", "."))
         currency = list_[4]
+        usd: Optional[float]
         try:
-            usd: float = float(list_[7].replace(",", "."))
-        except IndexError:
-            usd = CurrencyConverter.convert(
-                amount=cost,
-                from_currency=currency,
-                to_currency="USD",
-            )
+            usd = float(list_[7].replace(",", "."))
+        except (IndexError, ValueError):
+            # rows missing the common currency cost are backfilled on read
+            usd = None
         return cls(
             name=list_[0],
             category=list_[1],
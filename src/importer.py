@@ -0,0 +1,153 @@
+"""Streaming import of spendings from CSV/TSV files."""
+import csv
+import io
+from typing import IO, Dict, Iterator, List, Optional, Tuple
+
+from src.finances import Spending
+from src.spending_parser import (
+    RECORD_FIELDS,
+    NumberedRecord,
+    ParseErrors,
+    validate_records,
+)
+
+# column order of files without a header, the same as in text messages
+IMPORT_COLUMNS = RECORD_FIELDS
+DELIMITERS = (";", ",", "\t", "|")
+
+# a CSV row with its line number
+NumberedRow = Tuple[int, List[str]]
+
+
+class ImportFileError(ValueError):
+    """The uploaded file can not be read as CSV/TSV text."""
+
+
+def file_error(err: Exception) -> ImportFileError:
+    """Describe an unreadable file for the user."""
+    if isinstance(err, UnicodeDecodeError):
+        return ImportFileError(
+            'The file is not UTF-8 text, save it as "CSV UTF-8" and send it again',
+        )
+    return ImportFileError(f"The file is not a valid CSV/TSV file: {err}")
+
+
+def header_columns(row: List[str]) -> Optional[List[str]]:
+    """
+    Map a header row to Spending fields.
+
+    Header cells may be the field names or their descriptions (the spreadsheet
+    headers), unknown columns are ignored.
+
+    :param row: The first row of the file
+    :return: The field of every column, None if the row is not a header
+    """
+    fields_by_header: Dict[str, str] = {}
+    for field_name, field_info in Spending.model_fields.items():
+        fields_by_header[field_name.lower()] = field_name
+        fields_by_header[str(field_info.description).lower()] = field_name
+    columns = [fields_by_header.get(cell.strip().lower(), "") for cell in row]
+    if not set(IMPORT_COLUMNS).issubset(columns):
+        return None
+    return columns
+
+
+def is_blank(row: List[str]) -> bool:
+    """Check whether a row has no values."""
+    return not any(cell.strip() for cell in row)
+
+
+def read_csv_rows(binary_file: IO[bytes]) -> Iterator[List[str]]:
+    """
+    Read CSV rows from a binary file, lazily.
+
+    The delimiter is the most frequent of the supported ones in the first line,
+    the file is only read once the rows are iterated.
+    """
+    text_file = io.TextIOWrapper(binary_file, encoding="utf-8-sig", newline="")
+    first_line = text_file.readline()
+    text_file.seek(0)
+    delimiter = max(DELIMITERS, key=first_line.count)
+    yield from csv.reader(text_file, delimiter=delimiter)
+
+
+def parse_row(columns: List[str], row: List[str]) -> Dict[str, str]:
+    """Map a row to Spending fields with the same rules as text messages."""
+    spending_args = {
+        column: cell.strip() for column, cell in zip(columns, row) if column
+    }
+    expected = len(IMPORT_COLUMNS)
+    if len(spending_args) < expected:
+        width = len(row)
+        raise ValueError(f"Expected {expected} columns, got {width}")
+    spending_args["cost"] = spending_args["cost"].replace(",", ".")
+    return spending_args
+
+
+class SpendingImport:
+    """
+    Spendings read out of a CSV/TSV file in chunks.
+
+    The file is read lazily, so only one chunk of rows is in memory at a time.
+    Invalid rows are skipped and reported in ``errors`` with their line number.
+    """
+
+    def __init__(self, binary_file: IO[bytes]) -> None:
+        self._rows = enumerate(read_csv_rows(binary_file), start=1)
+        # empty until the first row is read
+        self._columns: List[str] = []
+        self.errors: List[Tuple[int, str]] = []
+        self.imported = 0
+
+    def read_chunk(self, size: int) -> List[Spending]:
+        """
+        Read up to ``size`` valid spendings, an empty list at the end.
+
+        :raises ImportFileError: The rest of the file can not be read
+        """
+        chunk: List[Spending] = []
+        chunk_errors: ParseErrors = []
+        while not chunk:
+            try:
+                records = self._read_records(size, chunk_errors)
+            except (UnicodeDecodeError, csv.Error) as err:
+                raise file_error(err) from err
+            if not records:
+                break
+            chunk, errors = validate_records(records)
+            chunk_errors.extend(errors)
+        self.errors.extend(sorted(chunk_errors))
+        self.imported += len(chunk)
+        return chunk
+
+    def _read_records(self, size: int, errors: ParseErrors) -> List[NumberedRecord]:
+        """
+        Read up to ``size`` rows of the right width, with their line number.
+
+        :param size: The number of records to read
+        :param errors: Collects the rows of a wrong width by line number
+        :return: The records, none at the end of the file
+        """
+        records: List[NumberedRecord] = []
+        for line_number, row in self._data_rows():
+            try:
+                records.append((line_number, parse_row(self._columns, row)))
+            except ValueError as err:
+                errors.append((line_number, str(err)))
+            if len(records) >= size:
+                break
+        return records
+
+    def _data_rows(self) -> Iterator[NumberedRow]:
+        """Iterate over the rows left, skipping the blank rows and the header."""
+        for line_number, row in self._rows:
+            if not is_blank(row) and not self._read_header(row):
+                yield line_number, row
+
+    def _read_header(self, row: List[str]) -> bool:
+        """Take the columns from the first row, True if it is a header."""
+        if self._columns:
+            return False
+        header = header_columns(row)
+        self._columns = header or list(IMPORT_COLUMNS)
+        return header is not None
@@ -0,0 +1,365 @@
+"""Write-ahead journal of the spendings waiting to be written to the spreadsheet."""
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+from contextlib import suppress
+from typing import IO, Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from src.finances import Spending
+from src.settings import JOURNAL_FLUSH_INTERVAL, JOURNAL_MAX_ATTEMPTS
+from src.tenants import default_tenant, tenant_router, use_tenant
+
+logger = logging.getLogger(__name__)
+
+JournalEntry = Tuple[int, List[Spending]]
+# tenant key and spendings
+TenantSpendings = Tuple[str, List[Spending]]
+# entry id, tenant key and spendings
+StoredEntry = Tuple[int, str, List[Spending]]
+
+
+class SpendingJournal:
+    """
+    Append-only files of parsed spendings, one JSON line per message.
+
+    Every process journals to its own file next to ``path``, suffixed with its pid,
+    and holds an exclusive lock on it while running. The files of the processes
+    that are gone are adopted by the running ones, so entries are never written
+    twice by two processes nor lost with a worker.
+
+    An entry is fsynced before ``append`` returns, so it survives a crash, and is
+    removed from the file once flushed to the spreadsheet of its tenant. Delivery
+    is at least once: entries flushed right before a crash are replayed on the
+    next start. Entries failing for good are moved to a dead-letter file.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.base_path = path
+        root, extension = os.path.splitext(path)
+        pid = os.getpid()
+        self.path = f"{root}-{pid}{extension}"
+        self.dead_letter_path = f"{root}.dead{extension}"
+        escaped_root = glob.escape(root)
+        self._pattern = f"{escaped_root}-*{extension}"
+        self._pending: List[StoredEntry] = []
+        self._lock = threading.Lock()
+        lock_file = hold_lock(self.path)
+        if lock_file is None:
+            raise RuntimeError(f"Journal {self.path} is open in this process already")
+        self._lock_file = lock_file
+        self._next_id = 1
+        self._replay()
+        self.adopt_orphans()
+
+    def append(
+        self,
+        spendings: List[Spending],
+        tenant_key: str = default_tenant.key,
+    ) -> int:
+        """Durably add spendings of a tenant to the journal, return their entry id."""
+        with self._lock:
+            return self._append_entries([(tenant_key, spendings)])[-1]
+
+    def pending(self) -> List[JournalEntry]:
+        """Return the entries not flushed yet, oldest first."""
+        with self._lock:
+            return [(entry_id, spendings) for entry_id, _, spendings in self._pending]
+
+    def pending_by_tenant(self) -> Dict[str, List[JournalEntry]]:
+        """Return the entries not flushed yet by tenant key, oldest first."""
+        entries: Dict[str, List[JournalEntry]] = {}
+        with self._lock:
+            for entry_id, tenant_key, spendings in self._pending:
+                entries.setdefault(tenant_key, []).append((entry_id, spendings))
+        return entries
+
+    def mark_flushed(self, last_id: int, tenant_key: Optional[str] = None) -> None:
+        """Drop the entries up to ``last_id``, of a tenant only if given."""
+        with self._lock:
+            self._pending = [
+                (entry_id, entry_tenant_key, spendings)
+                for entry_id, entry_tenant_key, spendings in self._pending
+                if entry_id > last_id or tenant_key not in {None, entry_tenant_key}
+            ]
+            self._rewrite()
+
+    def mark_dead(self, dead_id: int) -> None:
+        """Move an entry that can not be written to the dead-letter file."""
+        with self._lock:
+            dead = [entry for entry in self._pending if entry[0] == dead_id]
+            self._pending = [entry for entry in self._pending if entry[0] != dead_id]
+            with open(self.dead_letter_path, "a") as dead_letter_file:
+                # shared by the processes
+                fcntl.flock(dead_letter_file, fcntl.LOCK_EX)
+                dead_letter_file.writelines(dump_entry(entry) for entry in dead)
+                dead_letter_file.flush()
+                os.fsync(dead_letter_file.fileno())
+            self._rewrite()
+
+    def adopt_orphans(self) -> int:
+        """Take over the entries journaled by the processes that are gone."""
+        adopted = 0
+        for orphan_path in (self.base_path, *glob.glob(self._pattern)):
+            if orphan_path != self.path and os.path.exists(orphan_path):
+                adopted += self._adopt(orphan_path)
+        return adopted
+
+    def close(self) -> None:
+        """Release the journal, removing its files if every entry was flushed."""
+        with self._lock:
+            if not self._pending:
+                remove_journal(self.path)
+            self._lock_file.close()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def _replay(self) -> None:
+        self._pending = load_entries(self.path)
+        if self._pending:
+            replayed = len(self._pending)
+            logger.info(f"Replaying {replayed} unflushed journal entries")
+            self._next_id += self._pending[-1][0]
+
+    def _adopt(self, orphan_path: str) -> int:
+        lock_file = hold_lock(orphan_path)
+        if lock_file is None:
+            # its process is running
+            return 0
+        try:
+            entries = load_entries(orphan_path)
+            with self._lock:
+                self._append_entries([entry[1:] for entry in entries])
+            os.remove(orphan_path)
+            os.remove(lock_path(orphan_path))
+        except FileNotFoundError:
+            return 0
+        finally:
+            lock_file.close()
+        adopted = len(entries)
+        logger.info(f"Adopted {adopted} journal entries of {orphan_path}")
+        return adopted
+
+    def _append_entries(self, entries: List[TenantSpendings]) -> List[int]:
+        stored: List[StoredEntry] = []
+        for tenant_key, spendings in entries:
+            stored.append((self._next_id, tenant_key, spendings))
+            self._next_id += 1
+        with open(self.path, "a") as journal_file:
+            journal_file.writelines(dump_entry(entry) for entry in stored)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        self._pending.extend(stored)
+        return [entry[0] for entry in stored]
+
+    def _rewrite(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as journal_file:
+            journal_file.writelines(dump_entry(entry) for entry in self._pending)
+            journal_file.flush()
+            os.fsync(journal_file.fileno())
+        os.replace(tmp_path, self.path)
+
+
+def lock_path(journal_path: str) -> str:
+    """Return the lock file of a journal file."""
+    return f"{journal_path}.lock"
+
+
+def remove_journal(journal_path: str) -> None:
+    """Remove a journal file and its lock file."""
+    for removed_path in (journal_path, lock_path(journal_path)):
+        with suppress(FileNotFoundError):
+            os.remove(removed_path)
+
+
+def try_lock(lock_file: IO[str]) -> bool:
+    """Lock a file without waiting, False if another process holds it."""
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def is_linked(opened_file: IO[str]) -> bool:
+    """Check an opened file is still the one at its path."""
+    try:
+        return os.path.samestat(
+            os.stat(opened_file.name),
+            os.fstat(opened_file.fileno()),
+        )
+    except FileNotFoundError:
+        return False
+
+
+def hold_lock(journal_path: str) -> Optional[IO[str]]:
+    """
+    Lock a journal file for this process, None if another process holds it.
+
+    The lock is held until the returned file is closed, or the process exits.
+    """
+    while True:
+        # left open to hold the lock
+        lock_file = open(lock_path(journal_path), "a")  # noqa: WPS515
+        if not try_lock(lock_file):
+            lock_file.close()
+            return None
+        if is_linked(lock_file):
+            return lock_file
+        # adopted and removed by another process meanwhile, lock the new file
+        lock_file.close()
+
+
+def dump_entry(entry: StoredEntry) -> str:
+    """Serialize a journal entry to a JSON line."""
+    entry_id, tenant_key, spendings = entry
+    return "{0}\n".format(
+        json.dumps(
+            {
+                "id": entry_id,
+                "tenant": tenant_key,
+                "spendings": [
+                    spending.model_dump(mode="json") for spending in spendings
+                ],
+            },
+        ),
+    )
+
+
+def parse_entry(line: str) -> Optional[StoredEntry]:
+    """Parse a JSON line of a journal file, None if it is invalid."""
+    try:
+        entry = json.loads(line)
+        spendings = [
+            Spending.model_validate(spending) for spending in entry["spendings"]
+        ]
+    except (KeyError, ValueError) as err:
+        # a torn write of the last line before a crash
+        logger.error(f"Skipping invalid journal entry {line!r}: {err}")
+        return None
+    # entries journaled before the tenants belong to the default one
+    return entry["id"], entry.get("tenant", default_tenant.key), spendings
+
+
+def load_entries(journal_path: str) -> List[StoredEntry]:
+    """Read the entries of a journal file, none if it does not exist."""
+    if not os.path.exists(journal_path):
+        return []
+    with open(journal_path, "r") as journal_file:
+        entries = [parse_entry(line) for line in journal_file]
+    return [entry for entry in entries if entry is not None]
+
+
+class JournalFlusher:
+    """
+    Drain the journal to the spreadsheets in the background.
+
+    All the entries of a tenant pending at the end of a flush window are written
+    together, so a burst of messages costs a single write per spreadsheet. Once a
+    write is rejected, the oldest entry is written alone until it succeeds, or is
+    moved to the dead-letter file after ``max_attempts`` rejections. Transient
+    failures (the spreadsheet being unavailable) are retried without counting.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        journal: SpendingJournal,
+        write: Callable[[List[Spending]], Awaitable[Any]],
+        interval: float = JOURNAL_FLUSH_INTERVAL,
+        max_attempts: int = JOURNAL_MAX_ATTEMPTS,
+        is_transient: Callable[[Exception], bool] = lambda error: False,
+    ) -> None:
+        self.journal = journal
+        self.write = write
+        self.interval = interval
+        self.max_attempts = max_attempts
+        self.is_transient = is_transient
+        # rejected writes by entry id
+        self._attempts: Dict[int, int] = {}
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    async def start(self) -> None:
+        """Start flushing periodically, starting with the unflushed entries."""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop flushing periodically and flush what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Write the pending entries, keeping them in the journal on failure."""
+        await asyncio.to_thread(self.journal.adopt_orphans)
+        for tenant_key, entries in self.journal.pending_by_tenant().items():
+            with use_tenant(tenant_router.get(tenant_key)):
+                await self._flush_tenant(tenant_key, entries)
+
+    async def _flush_tenant(self, tenant_key: str, entries: List[JournalEntry]) -> None:
+        while entries:
+            done = await self._flush_batch(tenant_key, entries)
+            if done is None:
+                return
+            entries = entries[done:]
+
+    async def _flush_batch(
+        self,
+        tenant_key: str,
+        entries: List[JournalEntry],
+    ) -> Optional[int]:
+        """
+        Write the next batch of the entries of a tenant.
+
+        :param tenant_key: The tenant of the entries
+        :param entries: The entries left to flush, oldest first
+        :return: The number of entries flushed or moved to the dead letters, None
+            to stop flushing the tenant
+        """
+        first_id = entries[0][0]
+        batch = entries[:1] if first_id in self._attempts else entries
+        spendings = [spending for _, entry in batch for spending in entry]
+        try:
+            await self.write(spendings)
+        except Exception as error:
+            batch_size = len(batch)
+            logger.exception(
+                f"Unable to flush {batch_size} journal entries of {tenant_key}",
+            )
+            if self.is_transient(error):
+                return None
+            return await self._reject(first_id, batched=batch_size > 1)
+        await self._mark_flushed(tenant_key, batch)
+        return len(batch)
+
+    async def _mark_flushed(self, tenant_key: str, batch: List[JournalEntry]) -> None:
+        await asyncio.to_thread(
+            self.journal.mark_flushed,
+            batch[-1][0],
+            tenant_key,
+        )
+        for entry_id, _ in batch:
+            self._attempts.pop(entry_id, None)
+        flushed = sum(len(spendings) for _, spendings in batch)
+        logger.info(f"Flushed {flushed} spendings from the journal")
+
+    async def _reject(self, entry_id: int, batched: bool) -> Optional[int]:
+        self._attempts[entry_id] = self._attempts.get(entry_id, 0) + 1
+        if self._attempts[entry_id] >= self.max_attempts:
+            logger.error(f"Moving journal entry {entry_id} to the dead letters")
+            await asyncio.to_thread(self.journal.mark_dead, entry_id)
+            self._attempts.pop(entry_id)
+            return 1
+        # a rejected batch is retried one entry at a time
+        return 0 if batched else None
+
+    async def _run(self) -> None:
+        while True:  # noqa: WPS457
+            await self.flush()
+            await asyncio.sleep(self.interval)
@@ -0,0 +1,357 @@
+"""
+In-process metrics exposed in the Prometheus text format.
+
+Observing a value takes a lock and a couple of dict lookups, so the
+instrumentation stays on under full load. Labelled series are created on first
+use and kept for the life of the process, label values must have a small, fixed
+set of values (handler names, API methods), never ids.
+"""
+import abc
+import bisect
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Generic, Iterator, List, Sequence, Tuple, TypeVar
+
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1,
+    2.5,
+    5,
+    10,
+    30,
+)
+
+LabelValues = Tuple[str, ...]
+GaugeValues = Dict[LabelValues, float]
+SeriesT = TypeVar("SeriesT")
+
+
+def quote_label_value(label_value: str) -> str:
+    """
+    Quote a label value.
+
+    A JSON string escapes the backslashes, quotes and line feeds the way the text
+    format expects them.
+    """
+    return json.dumps(str(label_value), ensure_ascii=False)
+
+
+def format_labels(names: Sequence[str], label_values: Sequence[str]) -> str:
+    """Format label pairs, with the values quoted and escaped."""
+    if not names:
+        return ""
+    quoted_values = map(quote_label_value, label_values)
+    pairs = [
+        f"{name}={quoted}"
+        for name, quoted in zip(names, quoted_values)
+    ]
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_number(number: float) -> str:
+    if number == float("inf"):
+        return "+Inf"
+    return repr(float(number)) if isinstance(number, float) else str(number)
+
+
+class Metric(abc.ABC, Generic[SeriesT]):
+    """A metric family, one series per combination of label values."""
+
+    kind = ""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[LabelValues, SeriesT] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *label_values: str) -> SeriesT:
+        """Return the series of label values, creating it on first use."""
+        series = self._series.get(label_values)
+        if series is None:
+            if len(label_values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                series = self._series.setdefault(label_values, self._new_series())
+        return series
+
+    def render(self) -> List[str]:
+        """Render the metric family in the text format."""
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for label_values, series in sorted(self._collect()):
+            lines.extend(self._render_series(label_values, series))
+        return lines
+
+    def _collect(self) -> List[Tuple[LabelValues, SeriesT]]:
+        return list(self._series.copy().items())
+
+    @abc.abstractmethod
+    def _new_series(self) -> SeriesT:
+        """Return the series of a new combination of label values."""
+
+    @abc.abstractmethod
+    def _render_series(self, label_values: LabelValues, series: SeriesT) -> List[str]:
+        """Render the lines of a series."""
+
+
+class CounterSeries:
+    def __init__(self) -> None:
+        self.count: float = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.count += amount
+
+
+class Counter(Metric[CounterSeries]):
+    """A monotonically increasing count."""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1) -> None:
+        """Increase the unlabelled series."""
+        self.labels().inc(amount)
+
+    def _new_series(self) -> CounterSeries:
+        return CounterSeries()
+
+    def _render_series(
+        self,
+        label_values: LabelValues,
+        series: CounterSeries,
+    ) -> List[str]:
+        labels = format_labels(self.labelnames, label_values)
+        count = format_number(series.count)
+        return [f"{self.name}{labels} {count}"]
+
+
+class HistogramSeries:
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = buckets
+        self.bucket_counts = [0 for _ in range(len(buckets) + 1)]
+        self.total: float = 0
+        self._lock = threading.Lock()
+
+    def observe(self, observed: float) -> None:
+        index = bisect.bisect_left(self.buckets, observed)
+        with self._lock:
+            self.bucket_counts[index] += 1
+            self.total += observed
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of the block, in seconds, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def snapshot(self) -> Tuple[List[int], float]:
+        """Return the cumulative counts of the buckets and the sum of the values."""
+        with self._lock:
+            bucket_counts = list(self.bucket_counts)
+            total = self.total
+        return list(itertools.accumulate(bucket_counts)), total
+
+
+class Histogram(Metric[HistogramSeries]):
+    """Observed values, latencies in seconds by default, counted in buckets."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        bounds = (*self.buckets, float("inf"))
+        self._upper_bounds = [format_number(float(bound)) for bound in bounds]
+
+    def observe(self, observed: float) -> None:
+        """Observe a value of the unlabelled series."""
+        self.labels().observe(observed)
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the duration of a block in the unlabelled series."""
+        with self.labels().time():
+            yield
+
+    def _new_series(self) -> HistogramSeries:
+        return HistogramSeries(self.buckets)
+
+    def _render_series(
+        self,
+        label_values: LabelValues,
+        series: HistogramSeries,
+    ) -> List[str]:
+        cumulative_counts, total = series.snapshot()
+        labels = format_labels(self.labelnames, label_values)
+        count = cumulative_counts[-1]
+        formatted_total = format_number(total)
+        return [
+            *self._render_buckets(label_values, cumulative_counts),
+            f"{self.name}_sum{labels} {formatted_total}",
+            f"{self.name}_count{labels} {count}",
+        ]
+
+    def _render_buckets(
+        self,
+        label_values: LabelValues,
+        cumulative_counts: List[int],
+    ) -> List[str]:
+        names = (*self.labelnames, "le")
+        lines = []
+        for upper_bound, count in zip(self._upper_bounds, cumulative_counts):
+            labels = format_labels(names, (*label_values, upper_bound))
+            lines.append(f"{self.name}_bucket{labels} {count}")
+        return lines
+
+
+class Gauge(Metric[float]):
+    """
+    A value read when the metrics are collected.
+
+    The callback returns the values by label values, so queue depths and cache
+    sizes cost nothing until they are scraped.
+    """
+
+    kind = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], GaugeValues],
+        labelnames: Sequence[str] = (),
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.callback = callback
+
+    def _collect(self) -> List[Tuple[LabelValues, float]]:
+        return list(self.callback().items())
+
+    def _new_series(self) -> float:
+        raise TypeError(f"{self.name} values are read from its callback")
+
+    def _render_series(self, label_values: LabelValues, series: float) -> List[str]:
+        labels = format_labels(self.labelnames, label_values)
+        gauge_value = format_number(series)
+        return [f"{self.name}{labels} {gauge_value}"]
+
+
+class TrackedValues:
+    """Values of a labelled gauge, each one read by its own callback."""
+
+    def __init__(self) -> None:
+        self.callbacks: Dict[str, Callable[[], float]] = {}
+
+    def track(self, label_value: str, callback: Callable[[], float]) -> None:
+        """Report the value returned by callback under a label value."""
+        self.callbacks[label_value] = callback
+
+    def collect(self) -> Dict[LabelValues, float]:
+        return {(label,): callback() for label, callback in self.callbacks.items()}
+
+
+class Registry:
+    """The metrics exposed on /metrics."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}  # type: ignore
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric[SeriesT]") -> "Metric[SeriesT]":
+        """Register a metric, replacing the one of the same name."""
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+    ) -> Counter:
+        counter = Counter(name, documentation, labelnames)
+        self.register(counter)
+        return counter
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ) -> Histogram:
+        histogram = Histogram(name, documentation, labelnames, buckets)
+        self.register(histogram)
+        return histogram
+
+    def gauge(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], GaugeValues],
+        labelnames: Sequence[str] = (),
+    ) -> Gauge:
+        gauge = Gauge(name, documentation, callback, labelnames)
+        self.register(gauge)
+        return gauge
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# Metrics shared by several modules
+SHEETS_API_SECONDS = registry.histogram(
+    "sheets_api_request_seconds",
+    "Latency of the Google Sheets API requests",
+    ["method"],
+)
+SHEETS_API_ERRORS = registry.counter(
+    "sheets_api_errors_total",
+    "Failed Google Sheets API requests",
+    ["method"],
+)
+CACHE_REQUESTS = registry.counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit, miss, stale)",
+    ["cache", "result"],
+)
+cache_sizes = TrackedValues()
+registry.gauge("cache_entries", "Entries held by cache", cache_sizes.collect, ["cache"])
+queue_depths = TrackedValues()
+registry.gauge("queue_depth", "Items waiting in queue", queue_depths.collect, ["queue"])
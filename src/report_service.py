@@ -1,22 +1,130 @@
-from collections import defaultdict
+import calendar
+import hashlib
+from datetime import date
 from io import BytesIO
 from typing import List, Optional, Tuple
 
 from aiogram.utils.formatting import Bold, as_key_value, as_list, as_marked_section
+from src import storage, tracing
+from src.aggregates import SpendingTotals, month_index, months_between
+from src.cache import LRUCache
 from src.chart_service import ChartService
-from src.finances import SheetSpending
-from src.spreadsheets import get_spendings
+from src.metrics import CACHE_REQUESTS, cache_sizes, registry
+from src.settings import REPORT_CACHE_SIZE, REPORT_MAX_MONTHS
+from src.shared_cache import SharedCache, shared_cache
+from src.tenants import get_tenant
+
+PERIOD_FORMAT_ERROR = (
+    "Pass a date in format YYYY, YYYY-MM or YYYY-MM-DD, "
+    + "or a range of them, e.g. 2024-01..2024-06"
+)
+
+REPORT_SECONDS = registry.histogram(
+    "report_generation_seconds",
+    "Latency of the report generation, chart included",
+)
+
+# aggregate revisions of the report months, report text and chart
+CachedReport = Tuple[Tuple[int, ...], str, bytes]
+
+
+def parse_period_bound(period: str) -> Tuple[date, date]:
+    """Return the first and the last days of a YYYY, YYYY-MM or YYYY-MM-DD period."""
+    parts = [int(part) for part in period.split("-")]
+    if len(parts) == 1:
+        year_start = date.min.replace(year=parts[0])
+        return year_start, date.max.replace(year=parts[0])
+    if len(parts) == 2:
+        year, month = parts
+        last_day = calendar.monthrange(year, month)[1]
+        return date(year, month, 1), date(year, month, last_day)
+    if len(parts) == 3:
+        return date(*parts), date(*parts)
+    raise ValueError(f"Invalid period: {period}")
+
+
+def split_report_period(arguments: List[str]) -> Tuple[str, str]:
+    """Return the first and the last periods of the /report arguments."""
+    if len(arguments) == 1 and ".." in arguments[0]:
+        arguments = arguments[0].split("..")
+    if len(arguments) not in {1, 2}:
+        raise ValueError(PERIOD_FORMAT_ERROR)
+    return arguments[0], arguments[-1]
+
+
+def parse_report_period(arguments: List[str]) -> Tuple[date, date]:
+    """
+    Parse the /report arguments into the first and the last days of the report.
+
+    Args:
+        arguments (List[str]): Either one period (``2024``, ``2024-05``,
+            ``2024-05-03``), a ``FROM..TO`` range or two periods.
+    Returns:
+        Tuple[date, date]: The first and the last days, both included.
+    """
+    first, last = split_report_period(arguments)
+    try:
+        start = parse_period_bound(first)[0]
+        end = parse_period_bound(last)[1]
+    except (TypeError, ValueError) as err:
+        raise ValueError(PERIOD_FORMAT_ERROR) from err
+    if start > end:
+        raise ValueError("The start of the period is after its end")
+    if month_index(end) - month_index(start) >= REPORT_MAX_MONTHS:
+        raise ValueError(f"The period is longer than {REPORT_MAX_MONTHS} months")
+    return start, end
+
+
+def fingerprint(totals: SpendingTotals) -> str:
+    """Digest the totals a report is rendered from."""
+    rendered_from = (
+        list(totals.by_category.items()),
+        totals.total,
+        totals.count,
+        len(totals.days),
+    )
+    return hashlib.sha256(repr(rendered_from).encode()).hexdigest()
+
+
+def category_percentages(totals: SpendingTotals) -> List[float]:
+    """Return the share of every category in the total spendings, in percent."""
+    return [
+        cost / totals.total * 100 if totals.total else 0
+        for cost in totals.by_category.values()
+    ]
+
+
+def format_period(start: date, end: date) -> str:
+    """Format the report period for humans."""
+    if start == end:
+        return start.isoformat()
+    return f"{start.isoformat()} - {end.isoformat()}"
 
 
 class ReportService:
+    """
+    Build spending reports.
+
+    Reports are cached by tenant and period together with the revisions of the
+    aggregates they were built from, so a write to any month of the period, or a
+    change found in the sheet, invalidates them. The shared cache keeps them by
+    their totals for the other worker processes.
+    """
+
+    cache: LRUCache[CachedReport] = LRUCache(REPORT_CACHE_SIZE)
+    shared_cache: Optional[SharedCache] = shared_cache
+
     @staticmethod
-    def generate_pie(percentages: List[float], categories: List[str]) -> BytesIO:
+    async def generate_pie(
+        percentages: List[float],
+        categories: List[str],
+    ) -> BytesIO:
         sorted_categories = [
             categ for _, categ in sorted(zip(percentages, categories), reverse=True)
         ]
         sorted_percentages = sorted(percentages, reverse=True)
 
-        return ChartService.pie(
+        return await ChartService.pie(
             chart_values=sorted_percentages,
             labels=sorted_categories,
             title="Total spendings by category",
@@ -27,63 +135,94 @@ class ReportService:
         )
 
     @classmethod
-    def generate_report(  # noqa:WPS210
+    async def generate_report(
         cls,
-        year: str,
-        month: str,
-        day: Optional[str] = None,
+        start: date,
+        end: date,
     ) -> Tuple[str, BytesIO]:
         """
-        Generate a report message from a list of spendings.
+        Generate a report message from the aggregated spendings of a period.
+
+        All the months of the period missing from the aggregates are read with a
+        single spreadsheet request.
 
         Args:
-            year (str): The year to generate the report for.
-            month (str): The month to generate the report for.
-            day (str): The day to generate the report for.
+            start (date): The first day of the report.
+            end (date): The last day of the report.
         Returns:
             str: Formatted report message.
         """
-        spendings: List[SheetSpending] = get_spendings(
-            year=int(year),
-            month=int(month),
-            day=int(day) if day else None,
-        )
+        with REPORT_SECONDS.time():
+            with tracing.span("report.generate"):
+                return await cls._generate_report(start, end)
 
-        spendings_by_category: defaultdict[str, float] = defaultdict(float)
-        total_spendings: float = 0
-        for spending in spendings:
-            total_spendings += spending.usd or 0
-            spendings_by_category[spending.category] += spending.usd or 0
+    @classmethod
+    async def _generate_report(  # noqa:WPS210
+        cls,
+        start: date,
+        end: date,
+    ) -> Tuple[str, BytesIO]:
+        with tracing.span("report.aggregates"):
+            aggregates = await storage.get_aggregates(months_between(start, end))
+        revisions = tuple(aggregate.revision for aggregate in aggregates)
+        tenant_key = get_tenant().key
+        cache_key = (tenant_key, start, end)
+        cached = cls.cache.get(cache_key)
+        if cached is not None and cached[0] == revisions:
+            CACHE_REQUESTS.labels("report", "hit").inc()
+            return cached[1], BytesIO(cached[2])
+        CACHE_REQUESTS.labels("report", "miss").inc()
 
-        categories = list(spendings_by_category.keys())
-        percentages = [
-            value / total_spendings * 100
-            for category, value in spendings_by_category.items()
-        ]
+        totals = SpendingTotals()
+        for aggregate in aggregates:
+            totals.merge(aggregate.totals_between(start, end))
 
-        if not spendings:
+        if not totals.count:
             return "No spendings found", BytesIO()
 
+        if cls.shared_cache is None:
+            text, pie = await cls._render_report(start, end, totals)
+        else:
+            # revisions are counted per process, the workers share by content
+            content = fingerprint(totals)
+            text, pie = await cls.shared_cache.fill_async(
+                f"report:{tenant_key}:{start}:{end}:{content}",
+                lambda: cls._render_report(start, end, totals),
+            )
+        cls.cache.put(cache_key, (revisions, text, pie))
+
+        return text, BytesIO(pie)
+
+    @classmethod
+    async def _render_report(
+        cls,
+        start: date,
+        end: date,
+        totals: SpendingTotals,
+    ) -> Tuple[str, bytes]:
+        categories = list(totals.by_category.keys())
+
         text = as_list(
             as_marked_section(
                 Bold("Total spendings by category"),
                 *[
                     as_key_value(category, round(cost, 2))
-                    for category, cost in spendings_by_category.items()
+                    for category, cost in totals.by_category.items()
                 ],
             ),
             as_marked_section(
                 Bold("Summary:"),
-                as_key_value("Total spendings", round(total_spendings, 2)),
-                as_key_value("Total spendings records", len(spendings)),
-                as_key_value(
-                    "Total days found",
-                    len({spnd.datetime.day for spnd in spendings}),
-                ),
+                as_key_value("Period", format_period(start, end)),
+                as_key_value("Total spendings", round(totals.total, 2)),
+                as_key_value("Total spendings records", totals.count),
+                as_key_value("Total days found", len(totals.days)),
             ),
             sep="\n\n",
         ).as_markdown()
 
-        pie = cls.generate_pie(percentages, categories)
+        with tracing.span("report.pie"):
+            pie = await cls.generate_pie(category_percentages(totals), categories)
+        return text, pie.getvalue()
+
 
-        return text, pie
+cache_sizes.track("report", lambda: len(ReportService.cache))
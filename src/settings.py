@@ -1,14 +1,118 @@
 import os
+import tempfile
 
 CHART_SERVICE_URL: str = os.getenv("CHART_SERVICE_URL", "")
 CHART_SERVICE_RESPONSE_TIMEOUT: int = int(
     os.getenv("CHART_SERVICE_RESPONSE_TIMEOUT", 5),
 )
+# "remote" renders charts with the chart service, "local" with matplotlib
+CHART_RENDERER: str = os.getenv("CHART_RENDERER", "remote")
+CHART_RENDER_WORKERS: int = int(os.getenv("CHART_RENDER_WORKERS", 2))
+CHART_CACHE_SIZE: int = int(os.getenv("CHART_CACHE_SIZE", "128"))
 
 TELEGRAM_BOT_TOKEN: str = os.getenv("TELEGRAM_BOT_TOKEN", "")
 SPREADSHEET_ID: str = os.getenv("SPREADSHEET_ID", "")
 WEBHOOK_HOST: str = os.getenv("DETA_SPACE_APP_HOSTNAME", "")
 SERVICE_ACCOUNT_FILE_PATH: str = os.getenv("SERVICE_ACCOUNT_FILE_PATH", "")
+# JSON file routing chat and user ids to their own spreadsheets, the others use
+# SPREADSHEET_ID
+TENANTS_PATH: str = os.getenv("TENANTS_PATH", "")
+# Directory for the local state files (mirrors, caches)
+DATA_DIR: str = os.getenv("DATA_DIR", tempfile.gettempdir())
+
+# Storage backend of the spendings, "sheets" (Google Sheets) or "sqlite"
+STORAGE_BACKEND: str = os.getenv("STORAGE_BACKEND", "sheets")
+# Database of the "sqlite" storage backend
+SQLITE_PATH: str = os.getenv("SQLITE_PATH", os.path.join(DATA_DIR, "spendings.sqlite3"))
+
+# Upper bound of blocking storage calls (Google Sheets API) running at the same time
+STORAGE_MAX_WORKERS: int = int(os.getenv("STORAGE_MAX_WORKERS", 8))
+
+# Seconds the sub-sheet title -> sheetId index is trusted before a refresh
+SHEET_METADATA_TTL: int = int(os.getenv("SHEET_METADATA_TTL", "600"))
+
+# Local SQLite mirror of the sub-sheets, set to empty string to read sheets directly
+SHEET_MIRROR_PATH: str = os.getenv(
+    "SHEET_MIRROR_PATH",
+    os.path.join(DATA_DIR, "sheet_mirror.sqlite3"),
+)
+# Seconds between full re-reads of a mirrored sub-sheet to catch manual edits
+SHEET_MIRROR_RECONCILE_INTERVAL: int = int(
+    os.getenv("SHEET_MIRROR_RECONCILE_INTERVAL", "900"),
+)
+
+# Exchange rates are refreshed in the background once older than FX_RATE_TTL seconds
+FX_RATE_TTL: int = int(os.getenv("FX_RATE_TTL", "21600"))
+FX_RATES_PATH: str = os.getenv("FX_RATES_PATH", os.path.join(DATA_DIR, "fx_rates.json"))
+
+# Seconds a per-month report aggregate is used before being rebuilt from the sheet
+AGGREGATE_TTL: int = int(os.getenv("AGGREGATE_TTL", "900"))
+# Monthly aggregates kept in memory per spreadsheet, the least recently used first
+# evicted
+AGGREGATE_STORE_SIZE: int = int(os.getenv("AGGREGATE_STORE_SIZE", "120"))
+
+# Generated reports kept in memory until a write to their months
+REPORT_CACHE_SIZE: int = int(os.getenv("REPORT_CACHE_SIZE", "64"))
+# Longest period of a report, in months
+REPORT_MAX_MONTHS: int = int(os.getenv("REPORT_MAX_MONTHS", 60))
+
+# Webhook updates are queued and processed by UPDATE_WORKERS background workers
+UPDATE_WORKERS: int = int(os.getenv("UPDATE_WORKERS", 8))
+UPDATE_QUEUE_SIZE: int = int(os.getenv("UPDATE_QUEUE_SIZE", 1000))
+# Seconds the webhook waits for room in a full queue before asking for a retry
+UPDATE_QUEUE_PUT_TIMEOUT: float = float(os.getenv("UPDATE_QUEUE_PUT_TIMEOUT", 5))
+
+# Updates re-delivered by Telegram within DEDUP_WINDOW seconds are dropped
+DEDUP_WINDOW: int = int(os.getenv("DEDUP_WINDOW", "3600"))
+DEDUP_MAX_SIZE: int = int(os.getenv("DEDUP_MAX_SIZE", "10000"))
+# Optional file keeping the seen updates across restarts
+DEDUP_STORE_PATH: str = os.getenv("DEDUP_STORE_PATH", "")
+
+# With JOURNAL_PATH on a durable disk, spendings are journaled and written to the
+# sheet in batches every JOURNAL_FLUSH_INTERVAL seconds, each worker process to its
+# own file next to JOURNAL_PATH. Without it they are written inline
+JOURNAL_PATH: str = os.getenv("JOURNAL_PATH", "")
+JOURNAL_FLUSH_INTERVAL: float = float(os.getenv("JOURNAL_FLUSH_INTERVAL", 2))
+# Rejected writes of a journal entry before it is moved to the dead-letter file
+JOURNAL_MAX_ATTEMPTS: int = int(os.getenv("JOURNAL_MAX_ATTEMPTS", 5))
+
+# Imported CSV/TSV files are written to the sheet in chunks of IMPORT_CHUNK_SIZE rows
+IMPORT_CHUNK_SIZE: int = int(os.getenv("IMPORT_CHUNK_SIZE", 1000))
+
+# /export reads EXPORT_PAGE_SIZE rows at once and keeps up to EXPORT_SPOOL_SIZE
+# bytes of the file in memory before moving it to disk
+EXPORT_PAGE_SIZE: int = int(os.getenv("EXPORT_PAGE_SIZE", 1000))
+EXPORT_SPOOL_SIZE: int = int(os.getenv("EXPORT_SPOOL_SIZE", 1024 * 1024))
+
+# Updates handled in more than SLOW_UPDATE_THRESHOLD seconds are logged with their
+# trace spans, a negative value disables the slow log
+SLOW_UPDATE_THRESHOLD: float = float(os.getenv("SLOW_UPDATE_THRESHOLD", 2))
+# Fraction of the updates profiled with cProfile, dumped to PROFILE_DIR
+PROFILE_SAMPLE_RATE: float = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+PROFILE_DIR: str = os.getenv("PROFILE_DIR", os.path.join(DATA_DIR, "profiles"))
+
+# With LAZY_STARTUP the webhook server answers before the bot is imported and
+# warmed up in the background, the updates received meanwhile are buffered
+LAZY_STARTUP: bool = os.getenv("LAZY_STARTUP", "").lower() in {"1", "true", "yes"}
+# Sheets API discovery document, the one bundled with the Google API client if empty
+SHEETS_DISCOVERY_PATH: str = os.getenv("SHEETS_DISCOVERY_PATH", "")
+
+# Sheets API read and write requests per minute allowed to a service account, the
+# requests over the quota wait for it, 0 disables the quota
+SHEETS_READ_QUOTA: int = int(os.getenv("SHEETS_READ_QUOTA", "60"))
+SHEETS_WRITE_QUOTA: int = int(os.getenv("SHEETS_WRITE_QUOTA", "60"))
+# Retries of the Sheets API requests failed with 429, or of the reads failed with
+# 5xx, after a random delay up to SHEETS_BACKOFF_BASE * 2 ** retry seconds, at most
+# SHEETS_BACKOFF_MAX
+SHEETS_MAX_RETRIES: int = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_BACKOFF_BASE: float = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+SHEETS_BACKOFF_MAX: float = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+
+# SQLite file of the cache shared by the worker processes of a host (exchange rates,
+# sub-sheet ids, reports), empty to keep the caches in each process
+SHARED_CACHE_PATH: str = os.getenv("SHARED_CACHE_PATH", "")
+# Seconds after which the shared cache entries are purged
+SHARED_CACHE_MAX_AGE: int = int(os.getenv("SHARED_CACHE_MAX_AGE", "86400"))
 
 WELCOME_MD_FILE_PATH: str = os.getenv("WELCOME_MD_FILE_PATH", "")
 HELP_MD_FILE_PATH: str = os.getenv("HELP_MD_FILE_PATH", "")
@@ -0,0 +1,269 @@
+"""
+Cache shared by the server worker processes of a host, kept in a SQLite file.
+
+With several uvicorn workers every process would otherwise request the same
+exchange rates and sub-sheet metadata, and render the same reports. A fill is
+atomic across the processes: the first one to miss a key takes a lease on it and
+loads the value, the others wait for the value instead of loading it too. A lease
+expires after ``lease_timeout`` seconds, in case its process died meanwhile.
+
+A query may wait up to ``lease_timeout`` seconds for the database lock of
+another process, so the async fill runs its queries in a worker thread and waits
+for a lease on the event loop.
+"""
+import asyncio
+import itertools
+import pickle  # noqa: S403
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+)
+
+from src.metrics import CACHE_REQUESTS, cache_sizes
+from src.settings import SHARED_CACHE_MAX_AGE, SHARED_CACHE_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    stored_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+# takes the lease of a key, unless another owner holds it and it has not expired
+TAKE_LEASE = """
+INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?)
+ON CONFLICT (key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+WHERE leases.expires_at < ?
+"""
+
+# Tells whether a cached value, of a given age in seconds, can be used
+Freshness = Callable[[Any, float], bool]
+# expired entries are purged once in this number of writes
+PURGE_EVERY = 100
+
+
+def any_age(cached_value: Any, age: float) -> bool:
+    """Accept every cached value."""
+    return True
+
+
+class SharedCache:
+    """Values pickled to a SQLite file, filled once across the processes."""
+
+    def __init__(
+        self,
+        path: str,
+        max_age: float = SHARED_CACHE_MAX_AGE,
+        lease_timeout: float = 30,
+        poll_interval: float = 0.05,
+    ) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.lease_timeout = lease_timeout
+        self.poll_interval = poll_interval
+        self._connection = sqlite3.connect(
+            path,
+            timeout=lease_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._writes = itertools.count(1)
+
+    def get(self, key: str) -> Optional[Tuple[Any, float]]:
+        """Return a cached value and its age in seconds, None on a miss."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM entries WHERE key = ?",
+                (key,),
+            ).fetchone()
+        if row is None:
+            return None
+        cached_value = pickle.loads(row[0])  # noqa: S301
+        return cached_value, time.time() - row[1]
+
+    def set(self, key: str, cache_value: Any) -> None:
+        """Cache a value for all the processes."""
+        self.set_many({key: cache_value})
+
+    def set_many(self, cache_values: Dict[str, Any]) -> None:
+        """Cache several values in one transaction."""
+        stored_at = time.time()
+        rows = [
+            (key, pickle.dumps(cache_value), stored_at)
+            for key, cache_value in cache_values.items()
+        ]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO entries (key, value, stored_at) "
+                + "VALUES (?, ?, ?)",
+                rows,
+            )
+        if next(self._writes) % PURGE_EVERY == 0:
+            self.purge()
+
+    def delete(self, key: str) -> None:
+        """Remove a cached value, the next lookup of any process misses."""
+        with self._lock:
+            self._connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def purge(self) -> None:
+        """Remove the entries older than max_age."""
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM entries WHERE stored_at < ?",
+                (time.time() - self.max_age,),
+            )
+
+    def count(self, prefix: str = "") -> int:
+        """Return the number of cached values, of the keys with a prefix only."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM entries WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix),
+            ).fetchone()[0]
+
+    def fill(
+        self,
+        key: str,
+        load: Callable[[], Any],
+        fresh: Freshness = any_age,
+    ) -> Any:
+        """
+        Return the cached value, or load it once across the processes.
+
+        :param key: The cache key
+        :param load: Loads the value, None is returned but not cached
+        :param fresh: Tells whether a cached value can be used
+        :return: The cached or loaded value
+        """
+        owner = uuid.uuid4().hex
+        cached = self._wait_for_lease(key, owner, fresh)
+        if cached is not None:
+            return cached
+        with self._leased(key, owner):
+            # the previous lease holder may have filled it since the lookup
+            cached = self._lookup(key, fresh)
+            if cached is not None:
+                return cached
+            return self._store(key, load())
+
+    async def fill_async(
+        self,
+        key: str,
+        load: Callable[[], Awaitable[Any]],
+        fresh: Freshness = any_age,
+    ) -> Any:
+        """Return the cached value, or load it once with a coroutine, see fill."""
+        owner = uuid.uuid4().hex
+        cached = await self._wait_for_lease_async(key, owner, fresh)
+        if cached is not None:
+            return cached
+        async with self._leased_async(key, owner):
+            cached = await asyncio.to_thread(self._lookup, key, fresh)
+            if cached is not None:
+                return cached
+            loaded = await load()
+            return await asyncio.to_thread(self._store, key, loaded)
+
+    def close(self) -> None:
+        """Close the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def _lookup(self, key: str, fresh: Freshness) -> Any:
+        # None is never cached, it stands for a miss
+        cached = self.get(key)
+        if cached is None or not fresh(*cached):
+            return None
+        CACHE_REQUESTS.labels("shared", "hit").inc()
+        return cached[0]
+
+    def _store(self, key: str, loaded: Any) -> Any:
+        CACHE_REQUESTS.labels("shared", "miss").inc()
+        if loaded is not None:
+            self.set(key, loaded)
+        return loaded
+
+    def _wait_for_lease(self, key: str, owner: str, fresh: Freshness) -> Any:
+        """Wait until the key is cached, or leased to the owner, then None."""
+        while True:
+            cached = self._lookup(key, fresh)
+            if cached is not None:
+                return cached
+            if self._lease(key, owner):
+                return None
+            time.sleep(self.poll_interval)
+
+    async def _wait_for_lease_async(
+        self,
+        key: str,
+        owner: str,
+        fresh: Freshness,
+    ) -> Any:
+        while True:
+            cached = await asyncio.to_thread(self._lookup, key, fresh)
+            if cached is not None:
+                return cached
+            if await asyncio.to_thread(self._lease, key, owner):
+                return None
+            await asyncio.sleep(self.poll_interval)
+
+    @contextmanager
+    def _leased(self, key: str, owner: str) -> Iterator[None]:
+        try:
+            yield
+        finally:
+            self._release(key, owner)
+
+    @asynccontextmanager
+    async def _leased_async(self, key: str, owner: str) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            await asyncio.to_thread(self._release, key, owner)
+
+    def _lease(self, key: str, owner: str) -> bool:
+        """Take the lease of a key, unless another fill holds it."""
+        now = time.time()
+        with self._lock:
+            cursor = self._connection.execute(
+                TAKE_LEASE,
+                (key, owner, now + self.lease_timeout, now),
+            )
+            return cursor.rowcount == 1
+
+    def _release(self, key: str, owner: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM leases WHERE key = ? AND owner = ?",
+                (key, owner),
+            )
+
+
+shared_cache: Optional[SharedCache] = (
+    SharedCache(SHARED_CACHE_PATH) if SHARED_CACHE_PATH else None
+)
+if shared_cache is not None:
+    cache_sizes.track("shared", shared_cache.count)
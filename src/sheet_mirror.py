@@ -0,0 +1,223 @@
+"""Local SQLite mirror of the monthly sub-sheets."""
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import Callable, DefaultDict, Dict, Iterator, List, Optional
+
+from src.settings import SHEET_MIRROR_PATH, SHEET_MIRROR_RECONCILE_INTERVAL
+from src.tenants import Tenant, tenant_path
+
+logger = logging.getLogger(__name__)
+
+# first row of the spendings, the first one holds the table headers
+FIRST_DATA_ROW = 2
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sub_sheet_rows (
+    sub_sheet TEXT NOT NULL,
+    row_index INTEGER NOT NULL,
+    row_values TEXT NOT NULL,
+    PRIMARY KEY (sub_sheet, row_index)
+);
+CREATE TABLE IF NOT EXISTS sub_sheet_sync (
+    sub_sheet TEXT PRIMARY KEY,
+    synced_rows INTEGER NOT NULL,
+    reconciled_at REAL NOT NULL
+);
+"""
+
+# The cell values of sheet rows
+Rows = List[List[str]]
+# Reads the sub-sheet rows starting from a 1-based sheet row number
+RowsFetcher = Callable[[int], Rows]
+# 1-based row numbers to start reading from, by sub-sheet
+FirstRows = Dict[str, int]
+# Reads the rows of several sub-sheets starting from their own row numbers
+BatchRowsFetcher = Callable[[FirstRows], Dict[str, Rows]]
+
+
+class SheetMirror:
+    """
+    Keep a local copy of the sub-sheets rows.
+
+    Rows are only ever appended by the bot, so a sync fetches the rows after the
+    last synced one. Manual edits in the sheet are caught up by a full reconcile
+    once in ``reconcile_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        reconcile_interval: float = SHEET_MIRROR_RECONCILE_INTERVAL,
+    ) -> None:
+        self.reconcile_interval = reconcile_interval
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._sync_locks: DefaultDict[str, threading.Lock] = defaultdict(
+            threading.Lock,
+        )
+
+    def sync(self, sub_sheet: str, fetch_rows: RowsFetcher) -> None:
+        """
+        Bring the mirror of a sub-sheet up to date.
+
+        :param sub_sheet: The sub-sheet name
+        :param fetch_rows: Reads the sheet rows starting from a 1-based row number
+        """
+        self.sync_many(
+            [sub_sheet],
+            lambda first_rows: {sub_sheet: fetch_rows(first_rows[sub_sheet])},
+        )
+
+    def sync_many(self, sub_sheets: List[str], fetch_rows: BatchRowsFetcher) -> None:
+        """
+        Bring the mirror of several sub-sheets up to date with a single read.
+
+        :param sub_sheets: The sub-sheet names
+        :param fetch_rows: Reads the rows of several sheets, each one starting from
+            its own 1-based row number
+        """
+        with self._sync_all(sub_sheets):
+            synced_rows = {
+                sub_sheet: self._synced_rows(sub_sheet) for sub_sheet in sub_sheets
+            }
+            fetched_rows = fetch_rows(
+                {
+                    sub_sheet: FIRST_DATA_ROW + (synced or 0)
+                    for sub_sheet, synced in synced_rows.items()
+                },
+            )
+            for sub_sheet, synced in synced_rows.items():
+                rows = fetched_rows.get(sub_sheet, [])
+                if synced is None:
+                    self._replace(sub_sheet, rows)
+                elif rows:
+                    self._append(sub_sheet, synced, rows)
+
+    def rows(self, sub_sheet: str) -> List[List[str]]:
+        """Return the mirrored rows of a sub-sheet."""
+        with self._lock:
+            cursor = self._connection.execute(
+                "SELECT row_values FROM sub_sheet_rows "
+                "WHERE sub_sheet = ? ORDER BY row_index",
+                (sub_sheet,),
+            )
+            return [json.loads(record[0]) for record in cursor]
+
+    def iter_rows(self, sub_sheet: str, page_size: int) -> Iterator[List[str]]:
+        """Iterate over the mirrored rows of a sub-sheet, one page at a time."""
+        last_index = -1
+        while True:
+            with self._lock:
+                page = self._connection.execute(
+                    "SELECT row_index, row_values FROM sub_sheet_rows "
+                    "WHERE sub_sheet = ? AND row_index > ? "
+                    "ORDER BY row_index LIMIT ?",
+                    (sub_sheet, last_index, page_size),
+                ).fetchall()
+            if not page:
+                return
+            for row_index, row_values in page:
+                last_index = row_index
+                yield json.loads(row_values)
+
+    def drop(self, sub_sheet: str) -> None:
+        """Forget a sub-sheet, e.g. when it was removed from the spreadsheet."""
+        with self._transaction():
+            self._delete(sub_sheet)
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Hold the lock over a transaction of the connection."""
+        with self._lock:
+            with self._connection:
+                yield
+
+    @contextmanager
+    def _sync_all(self, sub_sheets: List[str]) -> Iterator[None]:
+        # locked in the same order by every sync, so concurrent ones can't deadlock
+        with ExitStack() as stack:
+            for sub_sheet in sorted(set(sub_sheets)):
+                stack.enter_context(self._sync_lock(sub_sheet))
+            yield
+
+    def _sync_lock(self, sub_sheet: str) -> threading.Lock:
+        with self._lock:
+            return self._sync_locks[sub_sheet]
+
+    def _synced_rows(self, sub_sheet: str) -> Optional[int]:
+        """Return the synced rows count, or None if a full reconcile is due."""
+        with self._lock:
+            sync_state = self._connection.execute(
+                "SELECT synced_rows, reconciled_at FROM sub_sheet_sync "
+                "WHERE sub_sheet = ?",
+                (sub_sheet,),
+            ).fetchone()
+        if sync_state is None:
+            return None
+        synced_rows, reconciled_at = sync_state
+        if time.time() - reconciled_at > self.reconcile_interval:
+            return None
+        return synced_rows
+
+    def _replace(self, sub_sheet: str, rows: List[List[str]]) -> None:
+        rows_count = len(rows)
+        logger.info(f"Reconciling mirror of {sub_sheet}: {rows_count} rows")
+        with self._transaction():
+            self._delete(sub_sheet)
+            self._insert(sub_sheet, 0, rows)
+            self._connection.execute(
+                "INSERT INTO sub_sheet_sync VALUES (?, ?, ?)",
+                (sub_sheet, rows_count, time.time()),
+            )
+
+    def _append(self, sub_sheet: str, synced_rows: int, rows: List[List[str]]) -> None:
+        rows_count = len(rows)
+        logger.info(f"Appending {rows_count} rows to mirror of {sub_sheet}")
+        with self._transaction():
+            self._insert(sub_sheet, synced_rows, rows)
+            self._connection.execute(
+                "UPDATE sub_sheet_sync SET synced_rows = ? WHERE sub_sheet = ?",
+                (synced_rows + rows_count, sub_sheet),
+            )
+
+    def _insert(self, sub_sheet: str, first_index: int, rows: List[List[str]]) -> None:
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO sub_sheet_rows VALUES (?, ?, ?)",
+            (
+                (sub_sheet, first_index + index, json.dumps(row))
+                for index, row in enumerate(rows)
+            ),
+        )
+
+    def _delete(self, sub_sheet: str) -> None:
+        self._connection.execute(
+            "DELETE FROM sub_sheet_rows WHERE sub_sheet = ?",
+            (sub_sheet,),
+        )
+        self._connection.execute(
+            "DELETE FROM sub_sheet_sync WHERE sub_sheet = ?",
+            (sub_sheet,),
+        )
+
+
+# mirrors by tenant, None when mirroring is disabled
+sheet_mirrors: Dict[str, Optional[SheetMirror]] = {}
+_sheet_mirrors_lock = threading.Lock()
+
+
+def get_sheet_mirror(tenant: Tenant) -> Optional[SheetMirror]:
+    """Return the mirror of the spreadsheet of a tenant, opened on first use."""
+    with _sheet_mirrors_lock:
+        if tenant.key not in sheet_mirrors:
+            sheet_mirrors[tenant.key] = (
+                SheetMirror(tenant_path(SHEET_MIRROR_PATH, tenant))
+                if SHEET_MIRROR_PATH
+                else None
+            )
+        return sheet_mirrors[tenant.key]
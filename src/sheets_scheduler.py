@@ -0,0 +1,276 @@
+"""
+Scheduling of the Google Sheets API requests within their quotas.
+
+The Sheets API allows a number of read and of write requests per minute and per
+service account, and answers 429 over it. Every request takes a token of its
+quota first, and waits for one during bursts instead of failing. Requests failed
+with 429 are retried with exponential backoff and jitter, and so are the reads
+failed with 5xx. A write failed with 5xx may have been applied, retrying an
+append of rows could duplicate them.
+
+Requests of the updates being handled come first, the background work (the
+journal flush) waits while they are queued. The priority is kept in a context
+variable, like the tenant, so it follows the calls to the storage worker threads.
+"""
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from http import HTTPStatus
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+from src.metrics import SHEETS_API_ERRORS, SHEETS_API_SECONDS, queue_depths, registry
+from src.settings import (
+    SHEETS_BACKOFF_BASE,
+    SHEETS_BACKOFF_MAX,
+    SHEETS_MAX_RETRIES,
+    SHEETS_READ_QUOTA,
+    SHEETS_WRITE_QUOTA,
+)
+from src.tenants import get_tenant
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+WRITE_METHODS = frozenset(("batchUpdate", "values.append", "values.batchUpdate"))
+
+SHEETS_API_RETRIES = registry.counter(
+    "sheets_api_retries_total",
+    "Google Sheets API requests retried after a 429, or a 5xx response to a read",
+    ["method"],
+)
+SHEETS_QUOTA_WAIT_SECONDS = registry.histogram(
+    "sheets_quota_wait_seconds",
+    "Time the Google Sheets API requests waited for their quota",
+    ["quota"],
+)
+
+# a request waiting for a token, its priority then its arrival order
+Waiter = Tuple[int, int]
+
+current_priority: ContextVar[int] = ContextVar("current_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background_priority() -> Iterator[None]:
+    """Let the Sheets requests of a block wait behind the interactive ones."""
+    token = current_priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+
+class TokenBucket:
+    """
+    Requests allowed per minute, granted in priority order.
+
+    Up to ``burst`` requests go through at once, the tokens are then refilled so
+    that no more than ``per_minute`` requests are granted in any minute. Waiters
+    are served by priority, then in arrival order.
+    """
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None) -> None:
+        self.capacity = max(1.0, per_minute / 6 if burst is None else burst)
+        self.rate = max(per_minute - self.capacity, 1) / 60
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._waiters: List[Waiter] = []
+        self._tickets = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, priority: int = INTERACTIVE) -> float:
+        """
+        Take a token, waiting for it as long as needed.
+
+        :param priority: INTERACTIVE or BACKGROUND
+        :return: The seconds waited
+        """
+        started_at = time.monotonic()
+        with self._condition:
+            with self._queued(priority) as waiter:
+                while not self._take(waiter):
+                    self._condition.wait(self._timeout(waiter))
+        return time.monotonic() - started_at
+
+    def exhaust(self) -> None:
+        """Drop the tokens left, the API said the quota is used up."""
+        with self._condition:
+            self._refill()
+            self._tokens = min(self._tokens, 0)
+
+    def __len__(self) -> int:
+        return len(self._waiters)
+
+    @contextmanager
+    def _queued(self, priority: int) -> Iterator[Waiter]:
+        waiter = (priority, next(self._tickets))
+        heapq.heappush(self._waiters, waiter)
+        try:
+            yield waiter
+        finally:
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            self._condition.notify_all()
+
+    def _take(self, waiter: Waiter) -> bool:
+        """Take a token if the waiter is the first one and a token is left."""
+        self._refill()
+        if self._waiters[0] != waiter or self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def _timeout(self, waiter: Waiter) -> Optional[float]:
+        # only the first waiter sleeps until the next token
+        if self._waiters[0] != waiter:
+            return None
+        return (1 - self._tokens) / self.rate
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+
+def is_rate_limited(error: HttpError) -> bool:
+    """Tell whether a request failed because its quota is used up."""
+    return int(error.resp.status) == HTTPStatus.TOO_MANY_REQUESTS
+
+
+def is_retryable(error: HttpError, write: bool = False) -> bool:
+    """
+    Tell whether a failed request may be sent again.
+
+    :param error: The failure
+    :param write: Whether the request is a write, retried only when rate limited
+    :return: True if rate limited, or a read failed with 5xx
+    """
+    if is_rate_limited(error):
+        return True
+    return not write and int(error.resp.status) >= HTTPStatus.INTERNAL_SERVER_ERROR
+
+
+class SheetsScheduler:
+    """
+    Every Sheets API request goes through the quotas of its service account.
+
+    A quota of 0 is not enforced, the requests are still retried. Writes are
+    only retried after a 429, which the API answers before applying them.
+    """
+
+    def __init__(  # noqa: WPS211
+        self,
+        read_quota: int = SHEETS_READ_QUOTA,
+        write_quota: int = SHEETS_WRITE_QUOTA,
+        max_retries: int = SHEETS_MAX_RETRIES,
+        backoff_base: float = SHEETS_BACKOFF_BASE,
+        backoff_max: float = SHEETS_BACKOFF_MAX,
+    ) -> None:
+        self.quotas = {"read": read_quota, "write": write_quota}
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # token buckets by service account and quota
+        self._buckets: Dict[Tuple[str, str], TokenBucket] = {}
+        self._lock = threading.Lock()
+
+    def execute(self, request: Any, method: str) -> Any:
+        """
+        Execute a Sheets API request within its quota, retrying transient failures.
+
+        :param request: The request built by the Sheets service
+        :param method: The API method name, the label of the metrics
+        :return: The response
+        """
+        quota = "write" if method in WRITE_METHODS else "read"
+        attempt = 0
+        while True:
+            self._wait_for_quota(quota)
+            try:
+                return self._send(request, method)
+            except HttpError as error:
+                if not self._can_retry(error, quota, attempt):
+                    raise
+                self._back_off(error, method, quota, attempt)
+            attempt += 1
+
+    def backoff_delay(self, attempt: int) -> float:
+        """Return a random delay up to the exponential backoff of an attempt."""
+        return random.uniform(  # noqa: S311
+            0,
+            min(self.backoff_max, self.backoff_base * 2**attempt),
+        )
+
+    def get_bucket(self, quota: str) -> Optional[TokenBucket]:
+        """Return the token bucket of a quota of the current service account."""
+        if not self.quotas[quota]:
+            return None
+        key = (get_tenant().service_account_file, quota)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.quotas[quota])
+                self._buckets[key] = bucket
+            return bucket
+
+    def waiting(self, quota: str) -> int:
+        """Return the number of requests waiting for a quota."""
+        return sum(
+            len(bucket)
+            for (_, bucket_quota), bucket in list(self._buckets.items())
+            if bucket_quota == quota
+        )
+
+    def _wait_for_quota(self, quota: str) -> None:
+        bucket = self.get_bucket(quota)
+        if bucket is not None:
+            waited = bucket.acquire(current_priority.get())
+            SHEETS_QUOTA_WAIT_SECONDS.labels(quota).observe(waited)
+
+    def _send(self, request: Any, method: str) -> Any:
+        try:
+            with SHEETS_API_SECONDS.labels(method).time():
+                return request.execute()
+        except Exception:
+            SHEETS_API_ERRORS.labels(method).inc()
+            raise
+
+    def _can_retry(self, error: HttpError, quota: str, attempt: int) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return is_retryable(error, write=quota == "write")
+
+    def _back_off(
+        self,
+        error: HttpError,
+        method: str,
+        quota: str,
+        attempt: int,
+    ) -> None:
+        """Wait before the retry of a failed request, the quota used up if limited."""
+        bucket = self.get_bucket(quota)
+        if bucket is not None and is_rate_limited(error):
+            bucket.exhaust()
+        delay = self.backoff_delay(attempt)
+        status = error.resp.status
+        retry = attempt + 1
+        logger.warning(
+            f"Sheets {method} failed with {status}, "
+            + f"retry {retry} in {delay:.2f}s",
+        )
+        SHEETS_API_RETRIES.labels(method).inc()
+        time.sleep(delay)
+
+
+sheets_scheduler = SheetsScheduler()
+queue_depths.track("sheets_read", lambda: sheets_scheduler.waiting("read"))
+queue_depths.track("sheets_write", lambda: sheets_scheduler.waiting("write"))
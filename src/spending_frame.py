@@ -0,0 +1,295 @@
+"""Columnar, array-backed container of sheet spendings."""
+import itertools
+import logging
+import math
+from array import array
+from collections import defaultdict
+from datetime import date
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from src.finances import SheetSpending
+
+logger = logging.getLogger(__name__)
+
+SHEET_COLUMNS = list(SheetSpending.model_fields)
+CATEGORY_COLUMN = SHEET_COLUMNS.index("category")
+COST_COLUMN = SHEET_COLUMNS.index("cost")
+CURRENCY_COLUMN = SHEET_COLUMNS.index("currency")
+SOURCE_COLUMN = SHEET_COLUMNS.index("source")
+DATE_COLUMN = SHEET_COLUMNS.index("datetime")
+USD_COLUMN = SHEET_COLUMNS.index("usd")
+
+MISSING = math.nan
+
+# the codes of the key columns of a group
+CodeKey = Tuple[int, ...]
+KeyDecoder = Callable[[int], Any]
+
+
+def amount_or_zero(amount: float) -> float:
+    """Return an amount, zero if it is missing."""
+    return 0 if math.isnan(amount) else amount
+
+
+def parse_amount(amount: str) -> float:
+    """Parse a sheet amount, with a decimal point or comma."""
+    return float(amount.replace(",", "."))
+
+
+def parse_ordinal(date_text: str, ordinals: Dict[str, int]) -> int:
+    """Parse an ISO date to its ordinal, once per distinct date text."""
+    ordinal = ordinals.get(date_text)
+    if ordinal is None:
+        ordinal = date.fromisoformat(date_text).toordinal()
+        ordinals[date_text] = ordinal
+    return ordinal
+
+
+def parse_usd(row: Sequence[str]) -> float:
+    """Parse the common currency cost of a sheet row, MISSING if it has none."""
+    try:
+        return parse_amount(row[USD_COLUMN])
+    except (IndexError, ValueError):
+        return MISSING
+
+
+def parse_numbers(
+    row: Sequence[str],
+    ordinals: Dict[str, int],
+) -> Optional[Tuple[int, float, float]]:
+    """
+    Parse the date and the amounts of a sheet row.
+
+    :param row: The sheet row
+    :param ordinals: The ordinals of the dates parsed so far, by date text
+    :return: The date ordinal, the cost and the common currency cost, None if
+        the date or the cost is not parsable
+    """
+    try:
+        ordinal = parse_ordinal(row[DATE_COLUMN], ordinals)
+        cost = parse_amount(row[COST_COLUMN])
+    except (IndexError, ValueError):
+        logger.warning(f"Skipping unparsable sheet row: {row}")
+        return None
+    return ordinal, cost, parse_usd(row)
+
+
+def decode_key(decoders: List[KeyDecoder], codes: CodeKey) -> Tuple[Any, ...]:
+    """Decode the codes of the key columns of a group."""
+    return tuple(decode(code) for decode, code in zip(decoders, codes))
+
+
+class CodeTable:
+    """Interned strings of a column, a row holds the integer code of its value."""
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def code(self, value: str) -> int:
+        """Return the code of a value, interning it on first use."""
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self._codes[value] = code
+            self.values.append(value)
+        return code
+
+    def encode(self, values: Iterable[str]) -> "array[int]":
+        """Return the codes of values, interning the new ones in order."""
+        values = list(values)
+        for distinct_value in dict.fromkeys(values):
+            self.code(distinct_value)
+        return array("I", [self._codes[value] for value in values])
+
+    def decode(self, code: int) -> str:
+        """Return the value of a code."""
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class SpendingFrame:  # noqa: WPS230
+    """
+    Spendings stored column by column.
+
+    Dates are kept as ordinals, amounts in ``array("d")`` (NaN for a missing
+    common currency cost) and categories, currencies and sources as integer codes
+    into interned tables. Names and descriptions are not kept, aggregations never
+    use them. Filters and group-by sums run over whole columns at once instead of
+    over one pydantic model per row.
+    """
+
+    # key columns of group_sum and group_count
+    KEYS = ("date", "day", "category", "currency", "source")
+
+    def __init__(
+        self,
+        categories: Optional[CodeTable] = None,
+        currencies: Optional[CodeTable] = None,
+        sources: Optional[CodeTable] = None,
+    ) -> None:
+        self.ordinals = array("l")
+        self.cost = array("d")
+        self.usd = array("d")
+        self.category = array("I")
+        self.currency = array("I")
+        self.source = array("I")
+        self.categories = categories or CodeTable()
+        self.currencies = currencies or CodeTable()
+        self.sources = sources or CodeTable()
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Sequence[str]]) -> "SpendingFrame":
+        """
+        Build a frame out of sheet rows, without building a model per row.
+
+        Empty rows are skipped, as are rows whose cost or date is not parsable,
+        e.g. edited by hand in the sheet.
+        """
+        frame = cls()
+        frame.extend_rows(rows)
+        return frame
+
+    @classmethod
+    def from_spendings(cls, spendings: Iterable[SheetSpending]) -> "SpendingFrame":
+        frame = cls()
+        for spending in spendings:
+            frame.append(
+                spending.datetime.toordinal(),
+                spending.cost,
+                MISSING if spending.usd is None else spending.usd,
+                spending.category,
+                spending.currency,
+                spending.source,
+            )
+        return frame
+
+    def append(  # noqa: WPS211
+        self,
+        ordinal: int,
+        cost: float,
+        usd: float,
+        category: str,
+        currency: str,
+        source: str,
+    ) -> None:
+        """Append a spending, its date given as an ordinal."""
+        self._append_numbers(ordinal, cost, usd)
+        self.category.append(self.categories.code(category))
+        self.currency.append(self.currencies.code(currency))
+        self.source.append(self.sources.code(source))
+
+    def extend_rows(self, rows: Iterable[Sequence[str]]) -> None:
+        """
+        Append sheet rows, skipping the empty and the unparsable ones.
+
+        A date is parsed once per distinct value and the code columns are
+        encoded in bulk.
+        """
+        parsed_rows: List[Sequence[str]] = []
+        ordinals: Dict[str, int] = {}
+        for row in rows:
+            numbers = parse_numbers(row, ordinals) if row else None
+            if numbers is not None:
+                self._append_numbers(*numbers)
+                parsed_rows.append(row)
+        self.category.extend(
+            self.categories.encode(map(itemgetter(CATEGORY_COLUMN), parsed_rows)),
+        )
+        self.currency.extend(
+            self.currencies.encode(map(itemgetter(CURRENCY_COLUMN), parsed_rows)),
+        )
+        self.source.extend(
+            self.sources.encode(map(itemgetter(SOURCE_COLUMN), parsed_rows)),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ordinals)
+
+    def filter(self, mask: Iterable[Any]) -> "SpendingFrame":
+        """Select the rows where mask is true, sharing the code tables."""
+        selectors = list(mask)
+        frame = SpendingFrame(self.categories, self.currencies, self.sources)
+        for column in ("ordinals", "cost", "usd", "category", "currency", "source"):
+            selected = getattr(frame, column)
+            selected.extend(itertools.compress(getattr(self, column), selectors))
+        return frame
+
+    def between(self, start: date, end: date) -> "SpendingFrame":
+        """Select the spendings dated from start to end, both included."""
+        first, last = start.toordinal(), end.toordinal()
+        return self.filter(first <= ordinal <= last for ordinal in self.ordinals)
+
+    def on_day(self, day: int) -> "SpendingFrame":
+        """Select the spendings of a day of the month."""
+        days = {
+            ordinal: date.fromordinal(ordinal).day for ordinal in set(self.ordinals)
+        }
+        return self.filter(days[ordinal] == day for ordinal in self.ordinals)
+
+    def sum(self, column: str = "usd") -> float:  # noqa: WPS125
+        """Sum an amount column, missing amounts count as zero."""
+        return math.fsum(map(amount_or_zero, getattr(self, column)))
+
+    def group_sum(
+        self,
+        *keys: str,
+        column: str = "usd",
+    ) -> Dict[Tuple[Any, ...], float]:
+        """
+        Sum an amount column by the values of key columns.
+
+        Rows are grouped on their raw codes first, so every distinct key is
+        decoded once rather than once per row.
+
+        :param keys: Key columns, from ``SpendingFrame.KEYS``
+        :param column: The amount column, ``usd`` or ``cost``
+        :return: The sums by tuple of key values
+        """
+        sums: Dict[CodeKey, float] = defaultdict(float)
+        key_codes = zip(*self._key_codes(keys))
+        for key, amount in zip(key_codes, getattr(self, column)):
+            sums[key] += amount_or_zero(amount)
+        return self._decode(keys, sums)
+
+    def group_count(self, *keys: str) -> Dict[Tuple[Any, ...], int]:
+        """Count the rows by the values of key columns."""
+        counts: Dict[CodeKey, int] = defaultdict(int)
+        for key in zip(*self._key_codes(keys)):
+            counts[key] += 1
+        return self._decode(keys, counts)
+
+    def _append_numbers(self, ordinal: int, cost: float, usd: float) -> None:
+        self.ordinals.append(ordinal)
+        self.cost.append(cost)
+        self.usd.append(usd)
+
+    def _key_codes(self, keys: Iterable[str]) -> List[Sequence[int]]:
+        columns = {
+            "date": self.ordinals,
+            "day": self.ordinals,
+            "category": self.category,
+            "currency": self.currency,
+            "source": self.source,
+        }
+        return [columns[key] for key in keys]
+
+    def _decode(self, keys: Sequence[str], grouped: Dict[CodeKey, Any]) -> Any:
+        key_decoders = self._key_decoders(keys)
+        decoded: Dict[Tuple[Any, ...], Any] = defaultdict(int)
+        for codes, grouped_value in grouped.items():
+            decoded[decode_key(key_decoders, codes)] += grouped_value
+        return dict(decoded)
+
+    def _key_decoders(self, keys: Iterable[str]) -> List[KeyDecoder]:
+        decoders: Dict[str, KeyDecoder] = {
+            "date": date.fromordinal,
+            "day": lambda ordinal: date.fromordinal(ordinal).day,
+            "category": self.categories.decode,
+            "currency": self.currencies.decode,
+            "source": self.sources.decode,
+        }
+        return [decoders[key] for key in keys]
@@ -0,0 +1,117 @@
+"""Batch parsing of spending records."""
+from typing import Dict, List, Sequence, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+from src.finances import Spending
+
+# field order of a record in a text message
+RECORD_FIELDS = (
+    "name",
+    "cost",
+    "category",
+    "description",
+    "currency",
+    "source",
+    "datetime",
+)
+RECORD_WIDTH = len(RECORD_FIELDS)
+RECORD_SEPARATOR = "|"
+FIELD_SEPARATOR = ";"
+SPENDING_FORMAT_ERROR = (
+    "Invalid spending format. "
+    "Expected format: name;cost;category;description;currency;source;date"
+)
+
+ParseErrors = List[Tuple[int, str]]
+Record = Dict[str, str]
+# a record with its position in the message or its line in the file
+NumberedRecord = Tuple[int, Record]
+
+spendings_adapter = TypeAdapter(List[Spending])
+
+
+def split_record(record: str) -> Record:
+    """
+    Split a text record into the Spending fields.
+
+    :param record: Fields separated by ``;`` in the message order
+    :return: The field values by field name
+    """
+    values = record.replace("\n", "").split(FIELD_SEPARATOR)
+    width = len(values)
+    if width != RECORD_WIDTH:
+        raise ValueError(f"Expected {RECORD_WIDTH} fields, got {width}")
+    fields = dict(zip(RECORD_FIELDS, map(str.strip, values)))
+    fields["cost"] = fields["cost"].replace(",", ".")
+    return fields
+
+
+def messages_by_record(err: ValidationError) -> Dict[int, List[str]]:
+    """Group the messages of a validation error by the index of the record."""
+    messages: Dict[int, List[str]] = {}
+    for error in err.errors(include_url=False):
+        index, *field = error["loc"]
+        messages.setdefault(int(index), []).append(
+            ": ".join([*map(str, field), error["msg"]]),
+        )
+    return messages
+
+
+def validate_records(
+    records: Sequence[NumberedRecord],
+) -> Tuple[List[Spending], ParseErrors]:
+    """
+    Validate numbered records in one pass over the list.
+
+    Records failing validation are reported with their number, the others are
+    validated again without them, so a single bad record does not reject the
+    whole batch.
+
+    :param records: The field values of every record, with its number
+    :return: The valid spendings, and the errors of the invalid records
+    """
+    try:
+        return spendings_adapter.validate_python([fields for _, fields in records]), []
+    except ValidationError as err:
+        messages_by_index = messages_by_record(err)
+    valid_records = [
+        fields
+        for index, (_, fields) in enumerate(records)
+        if index not in messages_by_index
+    ]
+    return spendings_adapter.validate_python(valid_records), [
+        (records[index][0], "; ".join(messages))
+        for index, messages in sorted(messages_by_index.items())
+    ]
+
+
+def split_records(text: str) -> Tuple[List[NumberedRecord], ParseErrors]:
+    """
+    Split a message into records numbered by their position, starting from 1.
+
+    :param text: The message text
+    :return: The records, and the errors of the records that can not be split
+    """
+    records: List[NumberedRecord] = []
+    errors: ParseErrors = []
+    for position, record in enumerate(text.split(RECORD_SEPARATOR), start=1):
+        try:
+            records.append((position, split_record(record)))
+        except ValueError as err:
+            errors.append((position, str(err)))
+    return records, errors
+
+
+def parse_spendings(text: str) -> Tuple[List[Spending], ParseErrors]:
+    """
+    Parse the spending records of a message.
+
+    Records are separated by ``|``, invalid records are skipped and reported
+    by their position in the message, starting from 1.
+
+    :param text: The message text
+    :return: The valid spendings, and the errors of the invalid records
+    """
+    records, errors = split_records(text)
+    spendings, validation_errors = validate_records(records)
+    return spendings, sorted(errors + validation_errors)
@@ -1,15 +1,32 @@
 """Module for handling spreadsheet operations."""
 
 import functools
+import json
 import logging
+import secrets
+import threading
+import time
+from collections import defaultdict
 from datetime import date
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from google.oauth2 import service_account
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
+from src import tracing
+from src.aggregates import MonthKey, get_aggregate_store
+from src.currency_converter import CurrencyConverter
 from src.finances import SheetSpending, Spending
-from src.settings import SERVICE_ACCOUNT_FILE_PATH, SPREADSHEET_ID
+from src.settings import (
+    SERVICE_ACCOUNT_FILE_PATH,
+    SHEET_METADATA_TTL,
+    SHEETS_DISCOVERY_PATH,
+)
+from src.shared_cache import SharedCache, shared_cache
+from src.sheet_mirror import FIRST_DATA_ROW, Rows, get_sheet_mirror
+from src.sheets_scheduler import is_retryable, sheets_scheduler
+from src.tenants import get_tenant
 
 logger = logging.getLogger(__name__)
 # Constants
@@ -17,9 +34,18 @@ SCOPES = (
     "https://www.googleapis.com/auth/spreadsheets",
     "https://www.googleapis.com/auth/drive",
 )
+# sheet ids are positive 32-bit signed integers
+MAX_SHEET_ID = 2147483647
 TABLE_HEADERS = tuple(
     SheetSpending.model_fields[el].description for el in SheetSpending.model_fields
 )
+COST_COLUMN_INDEX = list(SheetSpending.model_fields).index("cost")
+CURRENCY_COLUMN_INDEX = list(SheetSpending.model_fields).index("currency")
+USD_COLUMN_INDEX = list(SheetSpending.model_fields).index("usd")
+# a request of a spreadsheets.batchUpdate call
+SheetRequest = Dict[str, Any]
+
+_thread_local = threading.local()
 
 
 def get_credentials(service_account_file: str) -> service_account.Credentials:
@@ -30,36 +56,154 @@ def get_credentials(service_account_file: str) -> service_account.Credentials:
     )
 
 
-def find_sub_sheet(sheet_data: Dict[str, Any], name: str) -> Optional[int]:
-    """Find a sub-sheet by name within a sheet."""
-    for sheet_properties in sheet_data.get("sheets", []):
-        if sheet_properties["properties"]["title"] == name:
-            return sheet_properties["properties"]["sheetId"]
-    return None
+def index_sub_sheets(sheet_data: Dict[str, Any]) -> Dict[str, int]:
+    """Map sub-sheet titles to their sheet ids."""
+    return {
+        sheet_properties["properties"]["title"]: sheet_properties["properties"][
+            "sheetId"
+        ]
+        for sheet_properties in sheet_data.get("sheets", [])
+    }
 
 
-def generate_sub_sheet_name(year: int, month: int) -> str:
-    """Generate a name for a sub-sheet based on year and month."""
-    return f"{year}-{month}"
+def execute(request: Any, method: str) -> Any:
+    """
+    Execute a Sheets API request within its quota, retrying transient failures.
+
+    :param request: The request built by the Sheets service
+    :param method: The API method name, the label of the metrics
+    :return: The response
+    """
+    with tracing.span(f"sheets.{method}"):
+        return sheets_scheduler.execute(request, method)
 
 
-def create_sub_sheet(sheet_service: Any, name: str) -> Dict[str, Any]:
-    """Create a new sub-sheet with a specified name."""
-    body = {"requests": [{"addSheet": {"properties": {"title": name}}}]}
-    return sheet_service.batchUpdate(spreadsheetId=SPREADSHEET_ID, body=body).execute()
+class SubSheetIndex:
+    """
+    In-process index of sub-sheet titles to sheet ids of one spreadsheet.
 
+    The index is refreshed from the API only when it expired or a title is missing,
+    and the refresh asks for the sheet properties only instead of the full metadata.
+    A title missing after a refresh is not looked up again until the index expires
+    or the sub-sheet is added.
+    With a shared cache the worker processes refresh it once for all of them.
+    """
 
-def check_sub_sheet_designed(sheets_service: Any, sub_sheet_name: str) -> bool:
-    """Check if a sub-sheet has a specific design."""
-    request_data = (
-        sheets_service.values()
-        .batchGet(
-            spreadsheetId=SPREADSHEET_ID,
-            ranges=[f"{sub_sheet_name}!A1:C1"],
+    fields = "sheets.properties(sheetId,title)"
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        ttl: float = SHEET_METADATA_TTL,
+        shared: Optional[SharedCache] = shared_cache,
+    ) -> None:
+        self.spreadsheet_id = spreadsheet_id
+        self.ttl = ttl
+        self.shared = shared
+        self.cache_key = f"sub_sheets:{spreadsheet_id}"
+        self._sheet_ids: Dict[str, int] = {}
+        # titles known not to exist since the last refresh
+        self._missing: Set[str] = set()
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def get(self, sheets_service: Any, name: str) -> Optional[int]:
+        """Return the sheet id of a sub-sheet, or None if it does not exist."""
+        return self.get_many(sheets_service, [name])[name]
+
+    def get_many(
+        self,
+        sheets_service: Any,
+        names: Iterable[str],
+    ) -> Dict[str, Optional[int]]:
+        """Return the sheet ids of several sub-sheets with at most one refresh."""
+        names = list(names)
+        with self._lock:
+            unknown = set(names) - self._sheet_ids.keys() - self._missing
+            if self._expired() or unknown:
+                self._refresh(sheets_service, names)
+            return {name: self._sheet_ids.get(name) for name in names}
+
+    def add(self, name: str, sheet_id: int) -> None:
+        """Register a sub-sheet created by this process."""
+        with self._lock:
+            self._sheet_ids[name] = sheet_id
+            self._missing.discard(name)
+            if self.shared is not None:
+                self.shared.set(self.cache_key, self._sheet_ids)
+
+    def new_sheet_id(self) -> int:
+        """Pick an unused id for a sub-sheet about to be created."""
+        with self._lock:
+            used_ids = set(self._sheet_ids.values())
+        sheet_id = secrets.randbelow(MAX_SHEET_ID) + 1
+        while sheet_id in used_ids:
+            sheet_id = secrets.randbelow(MAX_SHEET_ID) + 1
+        return sheet_id
+
+    def invalidate(self) -> None:
+        """Force a refresh on the next lookup."""
+        with self._lock:
+            self._refreshed_at = None
+            if self.shared is not None:
+                self.shared.delete(self.cache_key)
+
+    def _expired(self) -> bool:
+        return (
+            self._refreshed_at is None
+            or time.monotonic() - self._refreshed_at > self.ttl
         )
-        .execute()
-    )
-    return bool(request_data["valueRanges"][0].get("values", []))
+
+    def _refresh(self, sheets_service: Any, names: List[str]) -> None:
+        if self.shared is None:
+            self._sheet_ids = self._fetch(sheets_service)
+        else:
+            self._sheet_ids = self.shared.fill(
+                self.cache_key,
+                lambda: self._fetch(sheets_service),
+                lambda sheet_ids, age: age <= self.ttl
+                and all(name in sheet_ids for name in names),
+            )
+        self._missing = {
+            name
+            for name in self._missing.union(names)
+            if name not in self._sheet_ids
+        }
+        self._refreshed_at = time.monotonic()
+
+    def _fetch(self, sheets_service: Any) -> Dict[str, int]:
+        sheet = execute(
+            sheets_service.get(
+                spreadsheetId=self.spreadsheet_id,
+                fields=self.fields,
+            ),
+            "get",
+        )
+        sheet_ids = index_sub_sheets(sheet)
+        sub_sheet_count = len(sheet_ids)
+        logger.info(f"Refreshed sub-sheet index: {sub_sheet_count} sub-sheets")
+        return sheet_ids
+
+
+# sub-sheet indexes by spreadsheet id
+sub_sheet_indexes: Dict[str, SubSheetIndex] = {}
+_sub_sheet_indexes_lock = threading.Lock()
+
+
+def get_sub_sheet_index() -> SubSheetIndex:
+    """Return the sub-sheet index of the spreadsheet of the current tenant."""
+    spreadsheet_id = get_tenant().spreadsheet_id
+    with _sub_sheet_indexes_lock:
+        index = sub_sheet_indexes.get(spreadsheet_id)
+        if index is None:
+            index = SubSheetIndex(spreadsheet_id)
+            sub_sheet_indexes[spreadsheet_id] = index
+        return index
+
+
+def generate_sub_sheet_name(year: int, month: int) -> str:
+    """Generate a name for a sub-sheet based on year and month."""
+    return f"{year}-{month}"
 
 
 def column_letter(column_index: int) -> str:
@@ -71,172 +215,447 @@ def column_letter(column_index: int) -> str:
     return letter
 
 
-def design_sub_sheet(
-    sheets_service: Any,
-    sub_sheet_name: str,
-    sub_sheet_id: int,
-) -> Dict[str, str]:
-    """Apply a specific design to a sub-sheet."""
-    fields = TABLE_HEADERS
-    num_fields = len(fields)
-    end_column_letter = column_letter(num_fields)
-    values_body = {
-        "valueInputOption": "RAW",
-        "data": [
-            {
-                "range": f"{sub_sheet_name}!A1:{end_column_letter}1",
-                "majorDimension": "ROWS",
-                "values": [fields],
-            },
-        ],
+USD_COLUMN = column_letter(USD_COLUMN_INDEX + 1)
+
+
+def cell_data(cell_value: Any) -> Dict[str, Any]:
+    """Convert a python value to Sheets CellData with the default format."""
+    if cell_value is None:
+        return {}
+    if isinstance(cell_value, date):
+        return {"userEnteredValue": {"stringValue": cell_value.strftime("%Y-%m-%d")}}
+    if isinstance(cell_value, (int, float)):
+        return {"userEnteredValue": {"numberValue": cell_value}}
+    return {"userEnteredValue": {"stringValue": str(cell_value)}}
+
+
+def add_sub_sheet_request(name: str, sheet_id: int) -> Dict[str, Any]:
+    """
+    Build a request creating a sub-sheet.
+
+    The sheet id is chosen by the client, so the following requests of the same
+    batch can already reference the new sub-sheet.
+    """
+    return {"addSheet": {"properties": {"title": name, "sheetId": sheet_id}}}
+
+
+def design_sub_sheet_request(sub_sheet_id: int) -> Dict[str, Any]:
+    """Build a request writing the styled table headers of a sub-sheet."""
+    header_format = {
+        "backgroundColor": {"red": 0, "green": 0, "blue": 0},
+        "textFormat": {
+            "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0},
+            "fontSize": 12,
+            "bold": True,
+        },
     }
-    format_requests = [
-        {
-            "repeatCell": {
-                "range": {
-                    "sheetId": sub_sheet_id,
-                    "startRowIndex": 0,
-                    "endRowIndex": 1,
-                    "startColumnIndex": 0,
-                    "endColumnIndex": num_fields,
-                },
-                "cell": {
-                    "userEnteredFormat": {
-                        "backgroundColor": {"red": 0, "green": 0, "blue": 0},
-                        "textFormat": {
-                            "foregroundColor": {"red": 1.0, "green": 1.0, "blue": 1.0},
-                            "fontSize": 12,
-                            "bold": True,
-                        },
-                    },
+    return {
+        "updateCells": {
+            "start": {"sheetId": sub_sheet_id, "rowIndex": 0, "columnIndex": 0},
+            "rows": [
+                {
+                    "values": [
+                        {**cell_data(header), "userEnteredFormat": header_format}
+                        for header in TABLE_HEADERS
+                    ],
                 },
-                "fields": "userEnteredFormat(backgroundColor,textFormat)",
-            },
+            ],
+            "fields": "userEnteredValue,userEnteredFormat(backgroundColor,textFormat)",
         },
-    ]
-    sheets_service.values().batchUpdate(
-        spreadsheetId=SPREADSHEET_ID,
-        body=values_body,
-    ).execute()
-    sheets_service.batchUpdate(
-        spreadsheetId=SPREADSHEET_ID,
-        body={"requests": format_requests},
-    ).execute()
-    return {"status": "Design and values updated successfully"}
-
-
-def append_to_last_row(  # noqa: WPS210
-    sheets_service: Any,
-    spreadsheet_id: str,
-    sheet_name: str,
-    sheet_id: int,
-    row_data: List[List[Any]],
-) -> None:
-    # Calculate the range to search for the last row with data
-    search_range = f"{sheet_name}!A1:A"
-
-    # Get the last row with data
-    sheets_values_request = (
-        sheets_service.values()
-        .get(spreadsheetId=spreadsheet_id, range=search_range)
-        .execute()
-    )
+    }
 
-    # Determine the row number to start appending data
-    # If 'values' is empty, start from row 1, otherwise, start after last row
-    start_row = len(sheets_values_request.get("values", [])) + 1
-
-    # Define the range to append data
-    append_range = f"{sheet_name}!A{start_row}"
-
-    # Append the data
-    body = {"values": row_data}
-    for index, value in enumerate(body["values"]):  # noqa: WPS110
-        for inner_index, inner_value in enumerate(value):
-            if isinstance(inner_value, date):
-                body["values"][index][inner_index] = inner_value.strftime("%Y-%m-%d")
-
-    response = (
-        sheets_service.values()
-        .append(
-            spreadsheetId=spreadsheet_id,
-            range=append_range,
-            valueInputOption="RAW",
-            insertDataOption="INSERT_ROWS",
-            body=body,
-        )
-        .execute()
-    )
 
-    # Get the range of the appended data for formatting reset
-    updates = response.get("updates", {})
-    updated_range = updates.get("updatedRange", "")
-    start_row_index = (
-        updated_range.split("!")[-1].lstrip("A").split(":")[0]  # noqa: WPS221
-    )
+def append_rows_request(
+    sub_sheet_id: int,
+    row_data: List[List[Any]],
+) -> Dict[str, Any]:
+    """
+    Build a request appending rows after the last row with data.
 
-    # Prepare the format reset request
-    format_reset_request = {
-        "requests": [
-            {
-                "repeatCell": {
-                    "range": {
-                        "sheetId": sheet_id,  # Replace with the actual sheet ID
-                        "startRowIndex": int(start_row_index)
-                        - 1,  # Convert to 0-based index
-                        "endRowIndex": int(start_row_index) - 1 + len(row_data),
-                    },
-                    "cell": {
-                        "userEnteredFormat": {},  # Specify the default format settings
-                    },
-                    "fields": "userEnteredFormat",  # Reset all format settings
-                },
-            },
-        ],
+    The format is part of the field mask, so appended rows are written with the
+    default format instead of inheriting it from the row above.
+    """
+    return {
+        "appendCells": {
+            "sheetId": sub_sheet_id,
+            "rows": [
+                {"values": [cell_data(cell_value) for cell_value in row]}
+                for row in row_data
+            ],
+            "fields": "userEnteredValue,userEnteredFormat",
+        },
     }
 
-    # Send the format reset request
-    sheets_service.batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body=format_reset_request,
-    ).execute()
+
+def build_add_spending_requests(  # noqa: WPS210
+    sheets_service: Any,
+    spending_by_sub_sheet: Dict[str, List[SheetSpending]],
+) -> Tuple[List[SheetRequest], Dict[str, int]]:
+    """
+    Build the batchUpdate requests writing spendings to their sub-sheets.
+
+    :param sheets_service: The Sheets service
+    :param spending_by_sub_sheet: Spendings grouped by sub-sheet name
+    :return: The requests and the sub-sheets they create, by name
+    """
+    requests: List[SheetRequest] = []
+    new_sub_sheets: Dict[str, int] = {}
+    sub_sheet_index = get_sub_sheet_index()
+    sub_sheet_ids = sub_sheet_index.get_many(sheets_service, spending_by_sub_sheet)
+    for ssn, spendings in spending_by_sub_sheet.items():
+        sub_sheet_id = sub_sheet_ids[ssn]
+
+        if sub_sheet_id is None:
+            sub_sheet_id = sub_sheet_index.new_sheet_id()
+            new_sub_sheets[ssn] = sub_sheet_id
+            requests.append(add_sub_sheet_request(ssn, sub_sheet_id))
+            requests.append(design_sub_sheet_request(sub_sheet_id))
+
+        logger.info(f"Adding spending {spendings}")
+
+        requests.append(
+            append_rows_request(
+                sub_sheet_id,
+                [list(spending.model_dump().values()) for spending in spendings],
+            ),
+        )
+    return requests, new_sub_sheets
 
 
 @functools.lru_cache()
-def get_sheets_service() -> Any:
-    credentials = get_credentials(
-        service_account_file=SERVICE_ACCOUNT_FILE_PATH,
+def get_service_credentials(
+    service_account_file: str = SERVICE_ACCOUNT_FILE_PATH,
+) -> service_account.Credentials:
+    """Load the credentials of a service account once per process."""
+    return get_credentials(
+        service_account_file=service_account_file,
     )
 
-    return build("sheets", "v4", credentials=credentials).spreadsheets()
 
+@functools.lru_cache()
+def get_discovery_document() -> Dict[str, Any]:
+    """
+    Load the Sheets API discovery document once per process.
 
-def read_spreedsheet(year: int, month: int, day: Optional[int] = None) -> Any:
-    sheets_service = get_sheets_service()
+    The document is read from disk, never fetched from the network: from
+    SHEETS_DISCOVERY_PATH if set, otherwise the copy bundled with the client.
+    """
+    if SHEETS_DISCOVERY_PATH:
+        with open(SHEETS_DISCOVERY_PATH, "r") as discovery_file:
+            return json.load(discovery_file)
+    document = get_static_doc("sheets", "v4")
+    if document is None:
+        raise RuntimeError("The Sheets discovery document is not bundled")
+    return json.loads(document)
+
+
+def get_sheets_service() -> Any:
+    """
+    Return the Sheets service of the calling thread.
+
+    httplib2 connections are not thread-safe, so each storage worker thread keeps
+    its own service (and its open connection) and reuses it between calls. The
+    services are built from the same parsed discovery document, one per service
+    account of the tenants.
+    """
+    service_account_file = get_tenant().service_account_file
+    sheets_services = getattr(_thread_local, "sheets_services", None)
+    if sheets_services is None:
+        sheets_services = {}
+        _thread_local.sheets_services = sheets_services
+    sheets_service = sheets_services.get(service_account_file)
+    if sheets_service is None:
+        sheets_service = build_from_document(
+            get_discovery_document(),
+            credentials=get_service_credentials(service_account_file),
+        ).spreadsheets()
+        sheets_services[service_account_file] = sheets_service
+    return sheets_service
+
+
+def read_sub_sheet_rows(
+    sheets_service: Any,
+    sub_sheet_name: str,
+    first_row: int = FIRST_DATA_ROW,
+    last_row: Optional[int] = None,
+) -> List[List[str]]:
+    """Read the rows of a sub-sheet between 1-based row numbers, both included."""
+    # Calculate the end column letter
+    end_column_letter = column_letter(len(TABLE_HEADERS))
+    end_cell = end_column_letter
+    if last_row is not None:
+        end_cell = f"{end_column_letter}{last_row}"
 
     try:
-        sheet = sheets_service.get(spreadsheetId=SPREADSHEET_ID).execute()
+        response = execute(
+            sheets_service.values().get(
+                spreadsheetId=get_tenant().spreadsheet_id,
+                range=f"{sub_sheet_name}!A{first_row}:{end_cell}",
+            ),
+            "values.get",
+        )
     except HttpError as err:
+        # the sub-sheet may have been removed since the index was refreshed
+        get_sub_sheet_index().invalidate()
         raise ValueError(f"Error while reading spreadsheet: {err}")
+    return response.get("values", [])
 
-    sub_sheet_name = generate_sub_sheet_name(year, month)
 
-    sub_sheet_id = find_sub_sheet(sheet, sub_sheet_name)
+def rows_missing_usd(rows: List[List[str]]) -> Dict[str, List[int]]:
+    """Group the indexes of the rows missing their USD cost by currency."""
+    missing_by_currency: Dict[str, List[int]] = defaultdict(list)
+    for index, row in enumerate(rows):
+        if len(row) > USD_COLUMN_INDEX and row[USD_COLUMN_INDEX]:
+            continue
+        if len(row) > CURRENCY_COLUMN_INDEX:
+            missing_by_currency[row[CURRENCY_COLUMN_INDEX]].append(index)
+    return missing_by_currency
 
-    if sub_sheet_id is None:
-        return []
 
-    # Calculate the end column letter
+def fill_usd(row: List[str], rate: float) -> Optional[float]:
+    """Set the USD cost of a row in place, None if its cost is not a number."""
+    try:
+        usd = float(row[COST_COLUMN_INDEX].replace(",", ".")) * rate
+    except ValueError:
+        return None
+    while len(row) < len(TABLE_HEADERS):
+        row.append("")
+    row[USD_COLUMN_INDEX] = str(usd)
+    return usd
+
+
+def usd_cell(sub_sheet_name: str, sheet_row: int) -> str:
+    """Return the A1 notation of the USD cost cell of a sheet row."""
+    return f"{sub_sheet_name}!{USD_COLUMN}{sheet_row}"
+
+
+def backfill_usd_rows(  # noqa: WPS210
+    sheets_service: Any,
+    sub_sheet_name: str,
+    rows: List[List[str]],
+    first_row: int = FIRST_DATA_ROW,
+) -> int:
+    """
+    Fill in the missing common currency (USD) column of sub-sheet rows.
+
+    Rows are grouped by currency, so each rate is looked up once, and all the
+    computed values are written back to the sheet with a single request. The rows
+    are updated in place.
+
+    :param sheets_service: The Sheets service
+    :param sub_sheet_name: The sub-sheet the rows were read from
+    :param rows: The rows read from the sub-sheet
+    :param first_row: The 1-based sheet row number of the first row
+    :return: The number of filled in rows
+    """
+    data: List[Dict[str, Any]] = []
+    for currency, row_indexes in rows_missing_usd(rows).items():
+        rate = CurrencyConverter.get_rate(currency, "USD")
+        if rate is None:
+            continue
+        for row_index in row_indexes:
+            usd = fill_usd(rows[row_index], rate)
+            if usd is not None:
+                cell = usd_cell(sub_sheet_name, first_row + row_index)
+                data.append({"range": cell, "values": [[usd]]})
+
+    if data:
+        write_usd_cells(sheets_service, sub_sheet_name, data)
+    return len(data)
+
+
+def write_usd_cells(
+    sheets_service: Any,
+    sub_sheet_name: str,
+    data: List[Dict[str, Any]],
+) -> None:
+    """Write the computed USD costs of a sub-sheet with a single request."""
+    filled = len(data)
+    logger.info(f"Backfilling USD cost of {filled} rows in {sub_sheet_name}")
+    try:
+        execute(
+            sheets_service.values().batchUpdate(
+                spreadsheetId=get_tenant().spreadsheet_id,
+                body={"valueInputOption": "RAW", "data": data},
+            ),
+            "values.batchUpdate",
+        )
+    except HttpError as err:
+        # the rows still carry the computed values, the next full read retries
+        logger.error(f"Unable to backfill USD cost in {sub_sheet_name}: {err}")
+
+
+def batch_read_sub_sheet_rows(
+    sheets_service: Any,
+    first_rows: Dict[str, int],
+) -> Dict[str, Rows]:
+    """
+    Read the rows of several sub-sheets with a single batchGet request.
+
+    :param sheets_service: The Sheets service
+    :param first_rows: The 1-based row number to start reading from, by sub-sheet
+    :return: The read rows by sub-sheet
+    """
+    if not first_rows:
+        return {}
+    sub_sheet_names = list(first_rows)
     end_column_letter = column_letter(len(TABLE_HEADERS))
 
-    return (
-        sheets_service.values()
-        .batchGet(
-            spreadsheetId=SPREADSHEET_ID,
-            ranges=[f"{sub_sheet_name}!A1:{end_column_letter}"],
+    try:
+        response = execute(
+            sheets_service.values().batchGet(
+                spreadsheetId=get_tenant().spreadsheet_id,
+                ranges=[
+                    f"{ssn}!A{first_rows[ssn]}:{end_column_letter}"
+                    for ssn in sub_sheet_names
+                ],
+            ),
+            "values.batchGet",
         )
-        .execute()
+    except HttpError as err:
+        # a sub-sheet may have been removed since the index was refreshed
+        get_sub_sheet_index().invalidate()
+        raise ValueError(f"Error while reading spreadsheet: {err}")
+    return {
+        ssn: value_range.get("values", [])
+        for ssn, value_range in zip(sub_sheet_names, response["valueRanges"])
+    }
+
+
+def batch_read_backfilled_rows(
+    sheets_service: Any,
+    first_rows: Dict[str, int],
+) -> Dict[str, Rows]:
+    """Read the rows of several sub-sheets with the missing USD column filled in."""
+    rows_by_sub_sheet = batch_read_sub_sheet_rows(sheets_service, first_rows)
+    for ssn, rows in rows_by_sub_sheet.items():
+        backfill_usd_rows(sheets_service, ssn, rows, first_rows[ssn])
+    return rows_by_sub_sheet
+
+
+def get_sub_sheet_ids(
+    sheets_service: Any,
+    sub_sheet_names: Iterable[str],
+) -> Dict[str, Optional[int]]:
+    """Look the sheet ids of sub-sheets up, None for the missing ones."""
+    try:
+        return get_sub_sheet_index().get_many(sheets_service, sub_sheet_names)
+    except HttpError as err:
+        raise ValueError(f"Error while reading spreadsheet: {err}")
+
+
+def read_sub_sheets(
+    sheets_service: Any,
+    sub_sheet_ids: Dict[str, Optional[int]],
+) -> Dict[str, Rows]:
+    """
+    Read the rows of the existing sub-sheets, through the local mirror if enabled.
+
+    :param sheets_service: The Sheets service
+    :param sub_sheet_ids: The sheet ids by sub-sheet name, None for missing ones
+    :return: The rows by sub-sheet
+    """
+    existing = [ssn for ssn, sheet_id in sub_sheet_ids.items() if sheet_id is not None]
+
+    sheet_mirror = get_sheet_mirror(get_tenant())
+    if sheet_mirror is None:
+        return batch_read_backfilled_rows(
+            sheets_service,
+            dict.fromkeys(existing, FIRST_DATA_ROW),
+        )
+    for removed in sub_sheet_ids.keys() - set(existing):
+        sheet_mirror.drop(removed)
+    with tracing.span("sheet_mirror.sync"):
+        sheet_mirror.sync_many(
+            existing,
+            functools.partial(batch_read_backfilled_rows, sheets_service),
+        )
+    with tracing.span("sheet_mirror.rows"):
+        return dict(zip(existing, map(sheet_mirror.rows, existing)))
+
+
+def read_spreedsheets(months: Iterable[MonthKey]) -> Dict[MonthKey, Rows]:
+    """
+    Read the spending rows of several months, through the local mirror if enabled.
+
+    The rows of all the months are read with a single batchGet request.
+
+    :param months: The (year, month) pairs to read
+    :return: The rows by (year, month)
+    """
+    sheets_service = get_sheets_service()
+
+    sub_sheet_names = {month: generate_sub_sheet_name(*month) for month in months}
+    rows_by_sub_sheet = read_sub_sheets(
+        sheets_service,
+        get_sub_sheet_ids(sheets_service, sub_sheet_names.values()),
     )
+    return {
+        month: rows_by_sub_sheet.get(ssn, []) for month, ssn in sub_sheet_names.items()
+    }
+
+
+def iter_spreedsheets_rows(
+    months: Iterable[MonthKey],
+    page_size: int,
+) -> Iterator[List[str]]:
+    """
+    Iterate over the spending rows of several months, one page at a time.
+
+    With the local mirror enabled each month is synced then paged out of the
+    mirror, so no more than one month of rows is read at a time. Otherwise the
+    months are paged out of the spreadsheet, one page of rows at a time.
+
+    :param months: The (year, month) pairs to read
+    :param page_size: The number of rows read at once
+    :return: The rows, month by month
+    """
+    sheets_service = get_sheets_service()
+    sheet_mirror = get_sheet_mirror(get_tenant())
+    fetch_rows = functools.partial(batch_read_backfilled_rows, sheets_service)
+    for ssn in existing_sub_sheets(sheets_service, months):
+        if sheet_mirror is None:
+            yield from iter_sub_sheet_rows(sheets_service, ssn, page_size)
+        else:
+            sheet_mirror.sync_many([ssn], fetch_rows)
+            yield from sheet_mirror.iter_rows(ssn, page_size)
+
+
+def existing_sub_sheets(sheets_service: Any, months: Iterable[MonthKey]) -> List[str]:
+    """Return the names of the sub-sheets of months that exist, in the same order."""
+    sub_sheet_names = [generate_sub_sheet_name(*month) for month in months]
+    sub_sheet_ids = get_sub_sheet_ids(sheets_service, sub_sheet_names)
+    return [ssn for ssn in sub_sheet_names if sub_sheet_ids[ssn] is not None]
+
+
+def iter_sub_sheet_rows(
+    sheets_service: Any,
+    sub_sheet_name: str,
+    page_size: int,
+) -> Iterator[List[str]]:
+    """Iterate over the rows of a sub-sheet, reading one page at a time."""
+    first_row = FIRST_DATA_ROW
+    while True:
+        rows = read_sub_sheet_rows(
+            sheets_service,
+            sub_sheet_name,
+            first_row,
+            first_row + page_size - 1,
+        )
+        if not rows:
+            return
+        backfill_usd_rows(sheets_service, sub_sheet_name, rows, first_row)
+        yield from rows
+        first_row += page_size
+
+
+def read_spreedsheet(
+    year: int,
+    month: int,
+    day: Optional[int] = None,
+) -> List[List[str]]:
+    """Read the spending rows of a month, through the local mirror if enabled."""
+    return read_spreedsheets([(year, month)])[year, month]
 
 
 def get_spendings(
@@ -253,21 +672,72 @@ def get_spendings(
     :return: A list of sheetspending objects
     """
     sheet_data = read_spreedsheet(year, month, day)
-    if not sheet_data:
-        return []
-    sheet_data = sheet_data["valueRanges"][0].get("values", [])[1:]
-    spendings: List[SheetSpending] = [
-        SheetSpending.from_list(shd) for shd in sheet_data
-    ]
+    with tracing.span("spreadsheets.from_list"):
+        spendings: List[SheetSpending] = [
+            SheetSpending.from_list(shd) for shd in sheet_data if shd
+        ]
     if day:
         spendings = [spending for spending in spendings if spending.datetime.day == day]
     return spendings
 
 
+def send_add_spending_requests(
+    sheets_service: Any,
+    spending_by_sub_sheet: Dict[str, List[SheetSpending]],
+) -> Dict[str, int]:
+    """
+    Send the batchUpdate request adding spendings to their sub-sheets.
+
+    :param sheets_service: The spreadsheets service
+    :param spending_by_sub_sheet: The spendings by sub-sheet name
+    :return: The ids of the sub-sheets created by the request, by name
+    """
+    requests, new_sub_sheets = build_add_spending_requests(
+        sheets_service,
+        spending_by_sub_sheet,
+    )
+    execute(
+        sheets_service.batchUpdate(
+            spreadsheetId=get_tenant().spreadsheet_id,
+            body={"requests": requests},
+        ),
+        "batchUpdate",
+    )
+    return new_sub_sheets
+
+
+def write_spending(
+    sheets_service: Any,
+    spending_by_sub_sheet: Dict[str, List[SheetSpending]],
+) -> Dict[str, int]:
+    """
+    Add spendings to their sub-sheets, once more with fresh metadata if it failed.
+
+    :param sheets_service: The spreadsheets service
+    :param spending_by_sub_sheet: The spendings by sub-sheet name
+    :return: The ids of the created sub-sheets, by name
+    """
+    try:
+        return send_add_spending_requests(sheets_service, spending_by_sub_sheet)
+    except HttpError as err:
+        if is_retryable(err):
+            # rate limited or failed on the server side, fresh metadata would not
+            # help and the rows may have been appended already
+            raise
+        # A sub-sheet may have been created or removed since the index was
+        # refreshed, rebuild the requests from fresh metadata and retry once
+        logger.warning(f"Retrying spendings write with fresh metadata: {err}")
+        get_sub_sheet_index().invalidate()
+        return send_add_spending_requests(sheets_service, spending_by_sub_sheet)
+
+
 def add_spending(spending_list: List[Spending]) -> Dict[str, str]:  # noqa: WPS210
     """
     Adds Spending it to the Google Sheets document.
 
+    Sub-sheet creation, header design and the rows of every affected sub-sheet are
+    sent in a single batchUpdate request.
+
     :param spending_list: List[Spending]: Specify the type of data that is expected to
         be passed into the function
     :return: A dictionary with a status key
@@ -278,10 +748,6 @@ def add_spending(spending_list: List[Spending]) -> Dict[str, str]:  # noqa: WPS2
         SheetSpending.from_spending(spending) for spending in spending_list
     ]
 
-    sheets_service = get_sheets_service()
-
-    sheet = sheets_service.get(spreadsheetId=SPREADSHEET_ID).execute()
-
     spending_by_date: Dict[str, List[SheetSpending]] = {}
 
     for spending in sheet_spending_list:
@@ -289,34 +755,12 @@ def add_spending(spending_list: List[Spending]) -> Dict[str, str]:  # noqa: WPS2
             spending.datetime.year,
             spending.datetime.month,
         )
-        if sub_sheet_name not in spending_by_date:
-            spending_by_date[sub_sheet_name] = []
-        spending_by_date[sub_sheet_name].append(spending)
+        spending_by_date.setdefault(sub_sheet_name, []).append(spending)
 
-    for ssn, spendings in spending_by_date.items():
-        sub_sheet_id: Optional[int] = find_sub_sheet(sheet, ssn)
+    new_sub_sheets = write_spending(get_sheets_service(), spending_by_date)
 
-        if sub_sheet_id is None:
-            sub_sheet_response: Dict[str, Any] = create_sub_sheet(
-                sheets_service,
-                ssn,
-            )[
-                "replies"
-            ][0]["addSheet"]
-            sub_sheet_id = sub_sheet_response["properties"]["sheetId"]
-            design_sub_sheet(sheets_service, ssn, sub_sheet_id)
-
-        logger.info(f"Adding spending {spendings}")
-
-        row_data: List[List[Any]] = []
-        for spending_row in spendings:
-            row_data.append(list(spending_row.model_dump().values()))
-
-        append_to_last_row(
-            sheets_service=sheets_service,
-            spreadsheet_id=SPREADSHEET_ID,
-            sheet_name=ssn,
-            sheet_id=sub_sheet_id,
-            row_data=row_data,
-        )
+    sub_sheet_index = get_sub_sheet_index()
+    for ssn, sub_sheet_id in new_sub_sheets.items():
+        sub_sheet_index.add(ssn, sub_sheet_id)
+    get_aggregate_store().apply(sheet_spending_list)
     return {"status": "Values updated successfully"}
@@ -0,0 +1,274 @@
+"""Spendings stored in a local SQLite database."""
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from datetime import date
+from typing import Any, DefaultDict, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from src.aggregates import MonthKey, MonthlyAggregate, get_aggregate_store
+from src.currency_converter import CurrencyConverter
+from src.finances import SheetSpending, Spending
+from src.spending_frame import (
+    COST_COLUMN,
+    MISSING,
+    USD_COLUMN,
+    SpendingFrame,
+    parse_ordinal,
+)
+from src.storage_backend import StorageBackend, month_end
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spendings (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT NOT NULL,
+    cost REAL NOT NULL,
+    currency TEXT NOT NULL,
+    source TEXT NOT NULL,
+    spent_on TEXT NOT NULL,
+    usd REAL
+);
+CREATE INDEX IF NOT EXISTS spendings_spent_on ON spendings (spent_on);
+CREATE INDEX IF NOT EXISTS spendings_category ON spendings (category, spent_on);
+"""
+
+# the columns are in the order of the sheet headers
+INSERT_SPENDINGS = """
+INSERT INTO spendings (
+    name, category, description, cost, currency, source, spent_on, usd
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SELECT_ROWS = """
+SELECT name, category, description, cost, currency, source, spent_on, usd
+FROM spendings WHERE spent_on BETWEEN ? AND ? ORDER BY id
+"""
+SELECT_ROWS_PAGE = """
+SELECT id, name, category, description, cost, currency, source, spent_on, usd
+FROM spendings WHERE spent_on BETWEEN ? AND ? AND id > ? ORDER BY id LIMIT ?
+"""
+# the dates and amounts, then the code columns in the order of SpendingFrame.append
+SELECT_FRAME = """
+SELECT spent_on, cost, usd, category, currency, source
+FROM spendings WHERE spent_on BETWEEN ? AND ? ORDER BY id
+"""
+SELECT_GROUPS = """
+SELECT spent_on, category, source, SUM(COALESCE(usd, 0)), COUNT(*)
+FROM spendings WHERE spent_on BETWEEN ? AND ?
+GROUP BY spent_on, category, source
+"""
+SELECT_MISSING_USD = """
+SELECT id, cost, currency FROM spendings
+WHERE usd IS NULL AND spent_on BETWEEN ? AND ?
+"""
+UPDATE_USD = "UPDATE spendings SET usd = ? WHERE id = ?"
+
+# a selected record
+Record = Tuple[Any, ...]
+# the ids and costs of spendings, by currency
+CostsByCurrency = DefaultDict[str, List[Tuple[int, float]]]
+
+
+def format_amount(amount: Optional[float]) -> str:
+    """Format an amount the way the sheet displays it."""
+    if amount is None:
+        return ""
+    return str(int(amount)) if amount.is_integer() else str(amount)
+
+
+def to_row(record: Record) -> List[str]:
+    """Convert a record selected in the order of the sheet columns to a sheet row."""
+    row = list(record)
+    row[COST_COLUMN] = format_amount(record[COST_COLUMN])
+    row[USD_COLUMN] = format_amount(record[USD_COLUMN])
+    return row
+
+
+def append_records(frame: SpendingFrame, records: Iterable[Record]) -> None:
+    """Append the records selected by SELECT_FRAME to a frame."""
+    ordinals: Dict[str, int] = {}
+    for spent_on, cost, usd, *codes in records:
+        frame.append(
+            parse_ordinal(spent_on, ordinals),
+            cost,
+            MISSING if usd is None else usd,
+            *codes,
+        )
+
+
+def add_group(  # noqa: WPS211
+    aggregates: Dict[MonthKey, MonthlyAggregate],
+    spent_on: str,
+    category: str,
+    source: str,
+    usd: float,
+    count: int,
+) -> None:
+    """Add a group selected by SELECT_GROUPS to the aggregate of its month, if any."""
+    spent_at = date.fromisoformat(spent_on)
+    aggregate = aggregates.get((spent_at.year, spent_at.month))
+    if aggregate is None:
+        return
+    aggregate.by_day_category[spent_at.day, category] += usd
+    aggregate.by_day_source[spent_at.day, source] += usd
+    aggregate.count_by_day[spent_at.day] += count
+
+
+def group_costs(records: Iterable[Record]) -> CostsByCurrency:
+    """Group the records selected by SELECT_MISSING_USD by currency."""
+    costs_by_currency: CostsByCurrency = defaultdict(list)
+    for spending_id, cost, currency in records:
+        costs_by_currency[currency].append((spending_id, cost))
+    return costs_by_currency
+
+
+def convert_costs(currency: str, costs: List[Tuple[int, float]]) -> List[Record]:
+    """
+    Convert the costs of a currency to USD.
+
+    :param currency: The currency of the costs
+    :param costs: The spending ids and their costs
+    :return: The USD costs along with their spending ids, none if the exchange rate
+        is unavailable
+    """
+    rate = CurrencyConverter.get_rate(currency, "USD")
+    if rate is None:
+        logger.error(f"Unable to backfill USD cost of {currency} spendings")
+        return []
+    return [(cost * rate, spending_id) for spending_id, cost in costs]
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Spendings kept in a single SQLite table.
+
+    Dates are stored as ISO strings, which sort like the dates, and indexed on
+    their own and along with the category, so month and range queries are index
+    range scans.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def add_spending(self, spending_list: List[Spending]) -> Dict[str, str]:
+        sheet_spending_list = [
+            SheetSpending.from_spending(spending) for spending in spending_list
+        ]
+        self._write(
+            INSERT_SPENDINGS,
+            [
+                (
+                    spending.name,
+                    spending.category,
+                    spending.description,
+                    spending.cost,
+                    spending.currency,
+                    spending.source,
+                    spending.datetime.isoformat(),
+                    spending.usd,
+                )
+                for spending in sheet_spending_list
+            ],
+        )
+        get_aggregate_store().apply(sheet_spending_list)
+        return {"status": "Values inserted successfully"}
+
+    def get_spendings(
+        self,
+        year: int,
+        month: int,
+        day: Optional[int] = None,
+    ) -> List[SheetSpending]:
+        first_day = date(year, month, day or 1)
+        last_day = first_day if day else month_end(year, month)
+        return [
+            SheetSpending.from_list(row)
+            for row in self._select_rows(first_day, last_day)
+        ]
+
+    def query(self, start: date, end: date) -> SpendingFrame:
+        frame = SpendingFrame()
+        append_records(frame, self._read(SELECT_FRAME, start, end))
+        return frame
+
+    def build_aggregates(self, months: List[MonthKey]) -> List[MonthlyAggregate]:
+        """
+        Build the aggregates of several months with a single grouped query.
+
+        The spendings written while their exchange rate was unavailable are
+        converted first, the ones still missing a rate count as 0.
+        """
+        if not months:
+            return []
+        aggregates = {month: MonthlyAggregate(*month) for month in months}
+        start = date(*min(months), 1)
+        end = month_end(*max(months))
+        self.backfill_usd(start, end)
+        for group in self._read(SELECT_GROUPS, start, end):
+            add_group(aggregates, *group)
+        return list(aggregates.values())
+
+    def iter_rows(self, months: List[MonthKey], page_size: int) -> Iterator[List[str]]:
+        """Iterate over the rows of several months, paged by keyset on the id."""
+        for year, month in months:
+            last_id = 0
+            while True:
+                records = self._read(
+                    SELECT_ROWS_PAGE,
+                    date(year, month, 1),
+                    month_end(year, month),
+                    last_id,
+                    page_size,
+                )
+                if not records:
+                    break
+                last_id = records[-1][0]
+                yield from (to_row(record[1:]) for record in records)
+
+    def warm_up(self) -> None:
+        """The database is opened along with the backend, there is nothing to do."""
+
+    def backfill_usd(self, start: date, end: date) -> int:
+        """
+        Convert the costs missing their common currency cost, once per currency.
+
+        :param start: The first day of the spendings to convert
+        :param end: The last day of the spendings to convert, included
+        :return: The number of converted costs
+        """
+        records = self._read(SELECT_MISSING_USD, start, end)
+        if not records:
+            return 0
+        updates: List[Record] = []
+        for currency, costs in group_costs(records).items():
+            updates.extend(convert_costs(currency, costs))
+        self._write(UPDATE_USD, updates)
+        return len(updates)
+
+    def _select_rows(self, start: date, end: date) -> List[List[str]]:
+        return [to_row(record) for record in self._read(SELECT_ROWS, start, end)]
+
+    def _read(
+        self,
+        query: str,
+        start: date,
+        end: date,
+        *parameters: int,
+    ) -> List[Record]:
+        with self._lock:
+            cursor = self._connection.execute(
+                query,
+                (start.isoformat(), end.isoformat(), *parameters),
+            )
+            return cursor.fetchall()
+
+    def _write(self, statement: str, records: List[Record]) -> None:
+        with self._lock:
+            with self._connection:
+                self._connection.executemany(statement, records)
@@ -0,0 +1,88 @@
+"""
+Cold start of the webhook server.
+
+Importing the bot (aiogram, the Google API client, the models) takes seconds,
+so the webhook server can import it in a background thread after it starts
+answering. The updates received meanwhile are kept here until the bot is ready.
+Every startup phase is timed from the import of this module, logged and exposed
+as the ``startup_seconds`` gauge.
+"""
+import asyncio
+import importlib
+import logging
+import time
+from types import ModuleType
+from typing import Any, Dict, List
+
+from src.metrics import LabelValues, registry
+
+logger = logging.getLogger(__name__)
+
+UpdateData = Dict[str, Any]
+
+
+class BootTimer:
+    """Seconds from the start of the server to each startup phase."""
+
+    def __init__(self) -> None:
+        self.started_at = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    def mark(self, phase: str) -> float:
+        """Record the first time a phase is reached, and return its time."""
+        if phase not in self.phases:
+            seconds = time.perf_counter() - self.started_at
+            self.phases[phase] = seconds
+            logger.info(f"Startup phase {phase} reached in {seconds:.3f}s")
+        return self.phases[phase]
+
+    def collect(self) -> Dict[LabelValues, float]:
+        return {(phase,): seconds for phase, seconds in self.phases.items()}
+
+
+class PendingUpdates:
+    """
+    Updates received while the bot is loading, queued once it is loaded.
+
+    At most ``maxsize`` updates are kept, Telegram is asked to retry the others.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.loading = True
+        self._updates: List[UpdateData] = []
+
+    def add(self, update_data: UpdateData) -> bool:
+        """Keep an update until the bot is loaded, False if there is no room."""
+        if len(self._updates) >= self.maxsize:
+            return False
+        self._updates.append(update_data)
+        return True
+
+    def release(self) -> List[UpdateData]:
+        """Stop buffering and return the updates received so far."""
+        self.loading = False
+        updates = self._updates
+        self._updates = []
+        return updates
+
+    def __len__(self) -> int:
+        return len(self._updates)
+
+
+async def import_in_background(name: str) -> ModuleType:
+    """Import a module in a thread, so the event loop keeps answering requests."""
+    return await asyncio.get_running_loop().run_in_executor(
+        None,
+        importlib.import_module,
+        name,
+    )
+
+
+boot_timer = BootTimer()
+registry.gauge(
+    "startup_seconds",
+    "Seconds from the start of the server to each startup phase",
+    boot_timer.collect,
+    ["phase"],
+)
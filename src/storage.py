@@ -0,0 +1,230 @@
+"""Asynchronous access to the spendings storage.
+
+The storage backends (the Google API client, SQLite) are blocking, so every storage
+call is dispatched to a bounded pool of worker threads instead of running on the
+event loop. Every call goes to the backend of the tenant of the request.
+"""
+import asyncio
+import contextvars
+import functools
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Callable, Dict, List, Optional, TypeVar
+
+from googleapiclient.errors import HttpError
+from src import tracing
+from src.aggregates import (
+    AggregateStore,
+    MonthKey,
+    MonthlyAggregate,
+    aggregate_stores,
+    get_aggregate_store,
+)
+from src.finances import Spending
+from src.journal import JournalFlusher, SpendingJournal
+from src.metrics import CACHE_REQUESTS, cache_sizes, queue_depths
+from src.settings import (
+    JOURNAL_PATH,
+    SQLITE_PATH,
+    STORAGE_BACKEND,
+    STORAGE_MAX_WORKERS,
+)
+from src.sheets_scheduler import background_priority
+from src.sqlite_backend import SqliteBackend
+from src.storage_backend import SheetsBackend, StorageBackend
+from src.tenants import Tenant, default_tenant, get_tenant, tenant_path
+
+logger = logging.getLogger(__name__)
+
+ResultT = TypeVar("ResultT")
+
+
+def create_backend(
+    name: str = STORAGE_BACKEND,
+    tenant: Tenant = default_tenant,
+) -> StorageBackend:
+    """Create the storage backend selected in the settings for a tenant."""
+    if name == "sheets":
+        return SheetsBackend()
+    if name == "sqlite":
+        return SqliteBackend(tenant_path(SQLITE_PATH, tenant))
+    raise ValueError(f"Unknown storage backend: {name}")
+
+
+# storage backends by tenant
+backends: Dict[str, StorageBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def get_backend() -> StorageBackend:
+    """Return the storage backend of the current tenant, created on first use."""
+    tenant = get_tenant()
+    with _backends_lock:
+        backend = backends.get(tenant.key)
+        if backend is None:
+            backend = create_backend(tenant=tenant)
+            backends[tenant.key] = backend
+        return backend
+
+
+executor = ThreadPoolExecutor(
+    max_workers=STORAGE_MAX_WORKERS,
+    thread_name_prefix="storage",
+)
+
+
+async def run_in_worker(
+    func: Callable[..., ResultT],
+    *args: Any,
+    **kwargs: Any,
+) -> ResultT:
+    """
+    Run a blocking callable in the storage worker pool.
+
+    :param func: The blocking callable
+    :param args: Positional arguments for the callable
+    :param kwargs: Keyword arguments for the callable
+    :return: The callable result
+    """
+    loop = asyncio.get_running_loop()
+    # the trace of the update goes along to the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        executor,
+        functools.partial(context.run, call_traced, func, *args, **kwargs),
+    )
+
+
+def call_traced(func: Callable[..., ResultT], *args: Any, **kwargs: Any) -> ResultT:
+    """Call a storage function in a span of the current trace."""
+    func_name = getattr(func, "__name__", "call")
+    with tracing.span(f"storage.{func_name}"):
+        return func(*args, **kwargs)
+
+
+async def add_spending(spending_list: List[Spending]) -> Dict[str, str]:
+    """Add spendings to the storage without blocking the event loop."""
+    return await run_in_worker(get_backend().add_spending, spending_list)
+
+
+async def flush_spending(spending_list: List[Spending]) -> Dict[str, str]:
+    """Write journaled spendings behind the Sheets requests of the updates."""
+    with background_priority():
+        return await add_spending(spending_list)
+
+
+def is_transient_error(error: Exception) -> bool:
+    """
+    Tell whether a failed write may succeed later, unlike a rejected one.
+
+    Only the writes the backend answered and refused are rejected: a 4xx other
+    than 429, a SQLite constraint. Network failures during an outage are raised by
+    httplib2 and google-auth as their own errors, they are retried until it ends.
+    """
+    if isinstance(error, HttpError):
+        status = int(error.resp.status)
+        refused = HTTPStatus.BAD_REQUEST <= status < HTTPStatus.INTERNAL_SERVER_ERROR
+        return status == HTTPStatus.TOO_MANY_REQUESTS or not refused
+    return not isinstance(error, sqlite3.IntegrityError)
+
+
+spending_journal: Optional[SpendingJournal] = (
+    SpendingJournal(JOURNAL_PATH) if JOURNAL_PATH else None
+)
+journal_flusher: Optional[JournalFlusher] = (
+    JournalFlusher(
+        spending_journal,
+        flush_spending,
+        is_transient=is_transient_error,
+    )
+    if spending_journal
+    else None
+)
+
+
+cache_sizes.track(
+    "aggregate",
+    lambda: sum(len(store) for store in aggregate_stores.values()),
+)
+queue_depths.track(
+    "storage_workers",
+    lambda: executor._work_queue.qsize(),  # noqa: WPS437
+)
+if spending_journal is not None:
+    queue_depths.track("journal", functools.partial(len, spending_journal))
+
+
+async def record_spending(spending_list: List[Spending]) -> None:
+    """
+    Save spendings for the spreadsheet.
+
+    With the journal enabled the spendings are only journaled here and written to
+    the spreadsheet by the background flusher, otherwise they are written inline.
+    """
+    if spending_journal is None:
+        await add_spending(spending_list)
+    else:
+        # fsynced, kept off the event loop
+        await asyncio.to_thread(
+            spending_journal.append,
+            spending_list,
+            get_tenant().key,
+        )
+
+
+async def start() -> None:
+    """Start the background flush of the journal."""
+    if journal_flusher is not None:
+        await journal_flusher.start()
+
+
+async def warm_up() -> None:
+    """Open the storage connection, an error is left for the first request."""
+    try:
+        await run_in_worker(get_backend().warm_up)
+    except Exception as err:
+        logger.error(f"Unable to warm up the storage: {err}")
+
+
+async def stop() -> None:
+    """Flush the journal and stop its background flush."""
+    if journal_flusher is not None:
+        await journal_flusher.stop()
+    if spending_journal is not None:
+        spending_journal.close()
+
+
+async def get_aggregates(months: List[MonthKey]) -> List[MonthlyAggregate]:
+    """Return the aggregates of months, building the missing ones with one read."""
+    aggregates: Dict[MonthKey, MonthlyAggregate] = {}
+    missing: List[MonthKey] = []
+    aggregate_store = get_aggregate_store()
+    for month in months:
+        aggregate = aggregate_store.get(*month)
+        if aggregate is None:
+            CACHE_REQUESTS.labels("aggregate", "miss").inc()
+            missing.append(month)
+        else:
+            CACHE_REQUESTS.labels("aggregate", "hit").inc()
+            aggregates[month] = aggregate
+    if missing:
+        aggregates.update(await build_missing_aggregates(aggregate_store, missing))
+    return [aggregates[key] for key in months]
+
+
+async def build_missing_aggregates(
+    aggregate_store: AggregateStore,
+    months: List[MonthKey],
+) -> Dict[MonthKey, MonthlyAggregate]:
+    """Build the aggregates of months with one read and store them."""
+    generations = {month: aggregate_store.generation(*month) for month in months}
+    aggregates: Dict[MonthKey, MonthlyAggregate] = {}
+    for built in await run_in_worker(get_backend().build_aggregates, months):
+        month = (built.year, built.month)
+        # a spending written during the read is not in it, rebuild next time
+        aggregate_store.put(built, generations[month])
+        aggregates[month] = built
+    return aggregates
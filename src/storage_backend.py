@@ -0,0 +1,78 @@
+"""Storage backends of the spendings."""
+import abc
+import calendar
+import itertools
+from datetime import date
+from typing import Dict, Iterator, List
+
+from src import spreadsheets, tracing
+from src.aggregates import MonthKey, MonthlyAggregate, months_between
+from src.finances import Spending
+from src.spending_frame import SpendingFrame
+
+
+class StorageBackend(abc.ABC):
+    """
+    Blocking access to the stored spendings.
+
+    Spendings are exchanged as sheet rows (lists of strings in the order of the
+    sheet headers) where a backend streams them out, so exports and aggregates
+    work the same on every backend.
+    """
+
+    @abc.abstractmethod
+    def add_spending(self, spending_list: List[Spending]) -> Dict[str, str]:
+        """Store spendings, converting their cost to the common currency."""
+
+    @abc.abstractmethod
+    def query(self, start: date, end: date) -> SpendingFrame:
+        """Return the spendings dated from start to end, both included."""
+
+    @abc.abstractmethod
+    def build_aggregates(self, months: List[MonthKey]) -> List[MonthlyAggregate]:
+        """Build the aggregates of several months at once."""
+
+    @abc.abstractmethod
+    def iter_rows(self, months: List[MonthKey], page_size: int) -> Iterator[List[str]]:
+        """Iterate over the rows of several months, one page at a time."""
+
+    @abc.abstractmethod
+    def warm_up(self) -> None:
+        """Open the connection to the storage before the first update arrives."""
+
+
+def month_end(year: int, month: int) -> date:
+    """Return the last day of a month."""
+    last_day = calendar.monthrange(year, month)[1]
+    return date(year, month, last_day)
+
+
+class SheetsBackend(StorageBackend):
+    """Spendings kept in the monthly sub-sheets of a Google spreadsheet."""
+
+    def warm_up(self) -> None:
+        """Load the credentials and build the Sheets service of a worker thread."""
+        spreadsheets.get_sheets_service()
+
+    def add_spending(self, spending_list: List[Spending]) -> Dict[str, str]:
+        return spreadsheets.add_spending(spending_list)
+
+    def query(self, start: date, end: date) -> SpendingFrame:
+        rows_by_month = spreadsheets.read_spreedsheets(months_between(start, end))
+        with tracing.span("spreadsheets.from_rows"):
+            frame = SpendingFrame.from_rows(
+                itertools.chain.from_iterable(rows_by_month.values()),
+            )
+        return frame.between(start, end)
+
+    def build_aggregates(self, months: List[MonthKey]) -> List[MonthlyAggregate]:
+        """Build the aggregates of several months from a single spreadsheet read."""
+        rows_by_month = spreadsheets.read_spreedsheets(months)
+        with tracing.span("aggregates.from_rows"):
+            return [
+                MonthlyAggregate.from_frame(year, month, SpendingFrame.from_rows(rows))
+                for (year, month), rows in rows_by_month.items()
+            ]
+
+    def iter_rows(self, months: List[MonthKey], page_size: int) -> Iterator[List[str]]:
+        return spreadsheets.iter_spreedsheets_rows(months, page_size)
@@ -0,0 +1,144 @@
+"""
+Routing of the chats to the spreadsheets their spendings are stored in.
+
+The tenant of the update being handled is kept in a context variable, set by the
+bot for every update, so the storage resolves its spreadsheet per request, in
+the storage worker threads included. Everything cached about a spreadsheet (the
+sub-sheet index, the mirror, the aggregates) is kept per tenant.
+"""
+import json
+import logging
+import os
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+from src.settings import SERVICE_ACCOUNT_FILE_PATH, SPREADSHEET_ID, TENANTS_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class Tenant:
+    """A spreadsheet, and the service account it is accessed with."""
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        service_account_file: str = SERVICE_ACCOUNT_FILE_PATH,
+    ) -> None:
+        self.spreadsheet_id = spreadsheet_id
+        self.service_account_file = service_account_file
+
+    @property
+    def key(self) -> str:
+        """The key of the tenant state, and of its journaled spendings."""
+        return self.spreadsheet_id
+
+    def __repr__(self) -> str:
+        return f"Tenant({self.spreadsheet_id!r})"
+
+
+class TenantRouter:
+    """
+    Chat and user ids mapped to their tenants, loaded from a JSON file.
+
+    The file maps ids to spreadsheet ids, or to a ``spreadsheet_id`` and the
+    ``service_account_file`` to access it with::
+
+        {
+            "chats": {"-1001234": "<spreadsheet id>"},
+            "users": {
+                "42": {"spreadsheet_id": "<id>", "service_account_file": "<path>"}
+            }
+        }
+
+    The chat is looked up first, then the user, the others use the default tenant.
+    """
+
+    def __init__(self, path: str, default: Tenant) -> None:
+        self.path = path
+        self.default = default
+        self._tenants: Dict[str, Tenant] = {default.key: default}
+        self._chats: Dict[int, Tenant] = {}
+        self._users: Dict[int, Tenant] = {}
+        self._load()
+
+    def resolve(self, chat_id: Optional[int], user_id: Optional[int]) -> Tenant:
+        """Return the tenant of a chat, or of a user."""
+        if chat_id is not None and chat_id in self._chats:
+            return self._chats[chat_id]
+        if user_id is not None and user_id in self._users:
+            return self._users[user_id]
+        return self.default
+
+    def get(self, key: str) -> Tenant:
+        """Return the tenant of a key, one that is not configured anymore included."""
+        tenant = self._tenants.get(key)
+        if tenant is None:
+            logger.warning(f"Tenant {key} is not configured, using default credentials")
+            tenant = Tenant(key)
+        return tenant
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def _load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as tenants_file:
+            routes = json.load(tenants_file)
+        self._chats = self._parse_routes(routes.get("chats", {}))
+        self._users = self._parse_routes(routes.get("users", {}))
+        tenant_count = len(self._tenants)
+        chat_count = len(self._chats)
+        user_count = len(self._users)
+        logger.info(
+            f"Loaded {tenant_count} tenants for {chat_count} chats "
+            + f"and {user_count} users",
+        )
+
+    def _parse_routes(self, routes: Dict[str, Any]) -> Dict[int, Tenant]:
+        return {
+            int(route_id): self._tenant(target) for route_id, target in routes.items()
+        }
+
+    def _tenant(self, target: Any) -> Tenant:
+        if isinstance(target, str):
+            target = {"spreadsheet_id": target}
+        tenant = Tenant(
+            target["spreadsheet_id"],
+            target.get("service_account_file", SERVICE_ACCOUNT_FILE_PATH),
+        )
+        # the chats of a spreadsheet share its tenant, and so its cached state
+        return self._tenants.setdefault(tenant.key, tenant)
+
+
+def tenant_path(path: str, tenant: Tenant) -> str:
+    """Return the local file of a tenant, path itself for the default spreadsheet."""
+    if tenant.spreadsheet_id == SPREADSHEET_ID:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}-{tenant.key}{extension}"
+
+
+default_tenant = Tenant(SPREADSHEET_ID)
+tenant_router = TenantRouter(TENANTS_PATH, default_tenant)
+current_tenant: ContextVar[Tenant] = ContextVar(
+    "current_tenant",
+    default=default_tenant,
+)
+
+
+def get_tenant() -> Tenant:
+    """Return the tenant of the request being handled."""
+    return current_tenant.get()
+
+
+@contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    """Route the storage calls of a block to a tenant."""
+    token = current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        current_tenant.reset(token)
@@ -0,0 +1,184 @@
+"""
+Per-update trace spans, slow update log and sampled profiling.
+
+The trace of the update being handled is kept in a context variable, so spans
+opened anywhere below the handler, in the storage worker threads included, are
+recorded in it. Outside of a trace ``span`` only reads the context variable, so
+the spans stay in the code under full load.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional
+
+from src.settings import PROFILE_DIR, PROFILE_SAMPLE_RATE, SLOW_UPDATE_THRESHOLD
+
+logger = logging.getLogger(__name__)
+
+
+class Span:
+    __slots__ = ("name", "start", "duration", "depth", "thread")
+
+    def __init__(  # noqa: WPS211
+        self,
+        name: str,
+        start: float,
+        duration: float,
+        depth: int,
+        thread: str,
+    ) -> None:
+        self.name = name
+        self.start = start
+        self.duration = duration
+        self.depth = depth
+        self.thread = thread
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "start_ms": round(self.start * 1000, 3),
+            "duration_ms": round(self.duration * 1000, 3),
+            "depth": self.depth,
+            "thread": self.thread,
+        }
+
+
+class Trace:
+    """The spans recorded while handling one update, in the order they ended."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.start = time.perf_counter()
+        self.duration: float = 0
+        self.spans: List[Span] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, duration: float, depth: int) -> None:
+        """Record a span, start is the perf_counter value it started at."""
+        recorded = Span(
+            name,
+            start - self.start,
+            duration,
+            depth,
+            threading.current_thread().name,
+        )
+        with self._lock:
+            self.spans.append(recorded)
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the trace with its spans sorted by start time."""
+        with self._lock:
+            spans = sorted(self.spans, key=lambda recorded: recorded.start)
+        return {
+            "trace": self.name,
+            "duration_ms": round(self.duration * 1000, 3),
+            "spans": [recorded.to_dict() for recorded in spans],
+        }
+
+
+current_trace: ContextVar[Optional[Trace]] = ContextVar("current_trace", default=None)
+_span_depth: ContextVar[int] = ContextVar("span_depth", default=0)
+# one update is profiled at a time, a second profiler would replace the first
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Record the duration of a block in the current trace, if there is one."""
+    update_trace = current_trace.get()
+    if update_trace is None:
+        yield
+        return
+    depth = _span_depth.get()
+    token = _span_depth.set(depth + 1)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        update_trace.add(name, start, time.perf_counter() - start, depth)
+        _span_depth.reset(token)
+
+
+@contextmanager
+def trace(
+    name: str,
+    slow_threshold: float = SLOW_UPDATE_THRESHOLD,
+) -> Iterator[Trace]:
+    """
+    Trace the handling of an update.
+
+    A trace lasting longer than slow_threshold seconds is written to the slow
+    log, as a JSON entry with its span breakdown.
+
+    :param name: The trace name, the update id
+    :param slow_threshold: Seconds, a negative value disables the slow log
+    :return: The trace
+    """
+    update_trace = Trace(name)
+    trace_token = current_trace.set(update_trace)
+    depth_token = _span_depth.set(0)
+    try:
+        yield update_trace
+    finally:
+        update_trace.finish()
+        _span_depth.reset(depth_token)
+        current_trace.reset(trace_token)
+        if 0 <= slow_threshold < update_trace.duration:
+            entry = json.dumps(update_trace.to_dict())
+            logger.warning(f"Slow update: {entry}")
+
+
+@contextmanager
+def sampled_profile(
+    name: str,
+    sample_rate: float = PROFILE_SAMPLE_RATE,
+    profile_dir: str = PROFILE_DIR,
+) -> Iterator[Optional[str]]:
+    """
+    Profile a sampled fraction of the blocks with cProfile.
+
+    The profile only covers the calling thread, work done in worker threads
+    shows as time spent waiting for them, and other updates handled by the
+    event loop meanwhile are part of it.
+
+    :param name: The profile file name, without extension
+    :param sample_rate: The fraction of the blocks profiled, 0 disables profiling
+    :param profile_dir: The directory the ``.prof`` files are dumped to
+    :return: The path the profile will be dumped to, None if not sampled
+    """
+    if sample_rate <= 0 or random.random() >= sample_rate:  # noqa: S311
+        yield None
+        return
+    if not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    started_ms = int(time.time() * 1000)
+    path = os.path.join(profile_dir, f"{name}-{started_ms}.prof")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield path
+    finally:
+        profiler.disable()
+        _profile_lock.release()
+        dump_profile(profiler, path)
+
+
+def dump_profile(profiler: cProfile.Profile, path: str) -> None:
+    """Dump the profiler stats, to read with pstats or snakeviz."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+    except OSError as err:
+        logger.error(f"Unable to dump profile to {path}: {err}")
+    else:
+        logger.info(f"Profile dumped to {path}")
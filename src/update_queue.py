@@ -0,0 +1,105 @@
+"""Background processing of Telegram updates."""
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, List, Optional
+
+# aiogram takes seconds to import, the webhook answers before it is loaded
+if TYPE_CHECKING:
+    from aiogram import types
+
+logger = logging.getLogger(__name__)
+
+UpdateHandler = Callable[["types.Update"], Awaitable[Any]]
+
+
+def update_chat_id(update: "types.Update") -> int:
+    """Return the chat of an update, or the update id for chat-less updates."""
+    try:
+        event = update.event
+    except LookupError:  # update of an unknown type
+        return update.update_id
+    chat = getattr(event, "chat", None) or getattr(
+        getattr(event, "message", None),
+        "chat",
+        None,
+    )
+    if chat is None:
+        return update.update_id
+    return chat.id
+
+
+class UpdateQueue:
+    """
+    Process updates with a fixed number of background workers.
+
+    Every chat is served by the same worker, so updates of one chat are handled
+    in the order they arrived while different chats are handled concurrently.
+    When the queue of a worker is full, ``put`` waits for room up to
+    ``put_timeout`` seconds and then gives up, so the caller can push back.
+    """
+
+    def __init__(
+        self,
+        handler: UpdateHandler,
+        workers: int,
+        maxsize: int,
+        put_timeout: float,
+    ) -> None:
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self.put_timeout = put_timeout
+        self._queues: List["asyncio.Queue[types.Update]"] = []
+        self._tasks: List["asyncio.Task[None]"] = []
+
+    async def start(self) -> None:
+        """Start the workers."""
+        worker_maxsize = max(1, self.maxsize // self.workers)
+        self._queues = [
+            asyncio.Queue(maxsize=worker_maxsize) for _ in range(self.workers)
+        ]
+        self._tasks = [
+            asyncio.create_task(self._work(queue)) for queue in self._queues
+        ]
+
+    async def stop(self, timeout: Optional[float] = None) -> None:
+        """Wait for the queued updates to be processed and stop the workers."""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning(f"Stopping with {self.depth()} unprocessed updates")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def put(self, update: "types.Update") -> bool:
+        """
+        Queue an update.
+
+        :param update: The update
+        :return: False if the queue stayed full for ``put_timeout`` seconds
+        """
+        queue = self._queues[update_chat_id(update) % self.workers]
+        try:
+            await asyncio.wait_for(queue.put(update), self.put_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue is full, rejecting {update.update_id}")
+            return False
+        return True
+
+    def depth(self) -> int:
+        """Return the number of queued updates."""
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def _work(self, queue: "asyncio.Queue[types.Update]") -> None:
+        while True:
+            update = await queue.get()
+            try:
+                await self.handler(update)
+            except Exception:
+                logger.exception(f"Unable to process update {update.update_id}")
+            finally:
+                queue.task_done()
@@ -0,0 +1,88 @@
+"""Test aggregates module."""
+from datetime import date
+
+from src.aggregates import AggregateStore, MonthlyAggregate
+from src.finances import SheetSpending
+
+
+def make_spending(day: int, category: str, usd: float) -> SheetSpending:
+    return SheetSpending(
+        name="Spending",
+        category=category,
+        description="",
+        cost=usd,
+        currency="USD",
+        source="Cash",
+        datetime=date(2023, 11, day),
+        usd=usd,
+    )
+
+
+def make_aggregate(*spendings: SheetSpending) -> MonthlyAggregate:
+    return MonthlyAggregate.from_spendings(2023, 11, list(spendings))
+
+
+def make_month() -> MonthlyAggregate:
+    return make_aggregate(
+        make_spending(1, "Food", 10),
+        make_spending(1, "Taxi", 5),
+        make_spending(2, "Food", 20),
+    )
+
+
+def test_monthly_aggregate_totals() -> None:
+    """Test month totals."""
+    month_totals = make_month().totals()
+    assert month_totals.total == 35
+    assert month_totals.count == 3
+    assert dict(month_totals.by_category) == {"Food": 30, "Taxi": 5}
+    assert dict(month_totals.by_source) == {"Cash": 35}
+    assert len(month_totals.days) == 2
+
+
+def test_monthly_aggregate_day_totals() -> None:
+    """Test totals of the selected days."""
+    day_totals = make_month().totals(days=[1])
+    assert day_totals.total == 15
+    assert day_totals.count == 2
+    assert day_totals.days == {date(2023, 11, 1)}
+
+
+def test_store_applies_deltas_to_built_months() -> None:
+    """Test written spendings update only the aggregates already built."""
+    store = AggregateStore()
+    store.put(make_aggregate(make_spending(1, "Food", 10)))
+
+    store.apply([make_spending(3, "Food", 5)])
+
+    built = store.get(2023, 11)
+    assert built is not None
+    assert built.totals().total == 15
+    assert store.get(2023, 10) is None
+
+
+def test_aggregate_store_is_bounded() -> None:
+    """Test the least recently used months are evicted above maxsize."""
+    store = AggregateStore(maxsize=2)
+    for month in (9, 10, 11):
+        store.put(MonthlyAggregate.from_spendings(2023, month, []))
+        store.get(2023, 9)
+
+    assert len(store) == 2
+    assert store.get(2023, 9) is not None
+    assert store.get(2023, 10) is None
+
+
+def test_rebuild_before_a_write_is_not_stored() -> None:
+    """Test a rebuild does not overwrite a spending applied during its read."""
+    store = AggregateStore()
+    store.put(make_aggregate(make_spending(1, "Food", 10)))
+    generation = store.generation(2023, 11)
+
+    store.apply([make_spending(3, "Food", 5)])
+    rebuilt = make_aggregate(make_spending(1, "Food", 10))
+
+    assert not store.put(rebuilt, generation)
+    built = store.get(2023, 11)
+    assert built is not None
+    assert built.totals().total == 15
@@ -0,0 +1,56 @@
+"""Test chart service module."""
+import subprocess  # noqa: S404
+import sys
+from typing import Any, List
+
+import pytest
+from src.chart_service import ChartService
+
+
+class FakeResponse:
+    ok = True
+    content = b"png"
+
+
+class FakeSession:
+    def __init__(self) -> None:
+        self.requests: List[Any] = []
+
+    def post(self, **kwargs: Any) -> FakeResponse:
+        self.requests.append(kwargs)
+        return FakeResponse()
+
+
+@pytest.mark.asyncio
+async def test_identical_charts_are_rendered_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test the chart cache is keyed by the chart values, labels and options."""
+    session = FakeSession()
+    monkeypatch.setattr(ChartService, "_session", session)
+    ChartService.cache.clear()
+
+    first = await ChartService.pie([60, 40], ["Food", "Taxi"])
+    second = await ChartService.pie([60, 40], ["Food", "Taxi"])
+    await ChartService.pie([60, 40], ["Food", "Taxi"], title="Other")
+
+    assert first.read() == second.read() == b"png"
+    assert len(session.requests) == 2
+
+
+def test_renderer_imports_no_application_module() -> None:
+    """Test the render processes do not import the storage along the renderer."""
+    imported = subprocess.run(  # noqa: S603
+        [
+            sys.executable,
+            "-c",
+            "import sys, src.chart_renderer; print(sorted(sys.modules))",
+        ],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+    assert "src.chart_renderer" in imported
+    assert "src.storage" not in imported
+    assert "src.settings" not in imported
@@ -0,0 +1,72 @@
+"""Test currency converter module."""
+import json
+from pathlib import Path
+from typing import List
+
+import google_currency
+import pytest
+from src.currency_converter import CurrencyConverter, RateStore
+from src.tracing import trace
+
+
+def test_rate_store_persists_rates(tmp_path: Path) -> None:
+    """Test rates survive a restart and expire after the TTL."""
+    rates_path = str(tmp_path / "rates.json")
+    RateStore(rates_path, ttl=60).set_many({("EUR", "USD"): 1.1})
+
+    assert RateStore(rates_path, ttl=60).get("EUR", "USD") == (1.1, True)
+    expired_store = RateStore(rates_path, ttl=-1)
+    assert expired_store.get("EUR", "USD") == (1.1, False)
+    assert RateStore(rates_path, ttl=60).get("GEL", "USD") == (None, False)
+
+
+def test_failed_rate_is_not_cached(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test a failed lookup is retried instead of being stored as a zero rate."""
+    responses: List[str] = [json.dumps({}), json.dumps({"amount": "0.37"})]
+    monkeypatch.setattr(
+        google_currency,
+        "convert",
+        lambda *args: responses.pop(0),
+    )
+    monkeypatch.setattr(
+        CurrencyConverter,
+        "rate_store",
+        RateStore(str(tmp_path / "rates.json"), ttl=60),
+    )
+
+    assert CurrencyConverter.convert("GEL", "USD", 10) is None
+    assert CurrencyConverter.convert("GEL", "USD", 10) == pytest.approx(3.7)
+    assert CurrencyConverter.convert("GEL", "USD", 10) == pytest.approx(3.7)
+    assert not responses
+
+
+def test_fetches_are_traced(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test rates fetched in the executor threads are spans of the update trace."""
+    monkeypatch.setattr(
+        google_currency,
+        "convert",
+        lambda *args: json.dumps({"amount": "0.37"}),
+    )
+    monkeypatch.setattr(
+        CurrencyConverter,
+        "rate_store",
+        RateStore(str(tmp_path / "rates.json"), ttl=60),
+    )
+
+    with trace("update-1") as update_trace:
+        assert CurrencyConverter.get_rate("GEL", "USD") == pytest.approx(0.37)
+        refresh = CurrencyConverter.refresh([("EUR", "USD")])
+        assert refresh is not None
+        refresh.result(timeout=5)
+        threads = [
+            span.thread for span in update_trace.spans if span.name == "fx.fetch"
+        ]
+
+    assert len(threads) == 2
+    assert all(thread.startswith("fx") for thread in threads)
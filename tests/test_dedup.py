@@ -0,0 +1,54 @@
+"""Test dedup module."""
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiogram import types
+from src.dedup import UpdateDeduplicator
+
+
+def make_update(update_id: int, message_id: int) -> types.Update:
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=message_id,
+            date=datetime.fromtimestamp(1635768000, tz=timezone.utc),
+            chat=types.Chat(id=1, type="private"),
+            text="text",
+        ),
+    )
+
+
+def test_redelivered_updates_are_duplicates(tmp_path: Path) -> None:
+    """Test re-deliveries are detected."""
+    store_path = str(tmp_path / "seen")
+    deduplicator = UpdateDeduplicator(maxsize=10, window=60, path=store_path)
+
+    assert not deduplicator.is_duplicate(make_update(1, message_id=1))
+    assert deduplicator.is_duplicate(make_update(1, message_id=1))
+    assert deduplicator.is_duplicate(make_update(2, message_id=1))
+    assert not deduplicator.is_duplicate(make_update(3, message_id=3))
+
+
+def test_seen_updates_survive_restarts(tmp_path: Path) -> None:
+    """Test re-deliveries are detected after a restart until forgotten."""
+    store_path = str(tmp_path / "seen")
+    deduplicator = UpdateDeduplicator(maxsize=10, window=60, path=store_path)
+    deduplicator.is_duplicate(make_update(3, message_id=3))
+
+    restarted = UpdateDeduplicator(maxsize=10, window=60, path=store_path)
+    assert restarted.is_duplicate(make_update(3, message_id=3))
+
+    restarted.forget(make_update(3, message_id=3))
+    assert not restarted.is_duplicate(make_update(3, message_id=3))
+
+
+def test_seen_updates_are_bounded() -> None:
+    """Test old updates are forgotten by size and by age."""
+    deduplicator = UpdateDeduplicator(maxsize=2, window=60)
+    for update_id in range(3):
+        deduplicator.is_duplicate(make_update(update_id, message_id=update_id))
+    assert len(deduplicator) == 2
+
+    expired = UpdateDeduplicator(maxsize=10, window=-1)
+    expired.is_duplicate(make_update(1, message_id=1))
+    assert not expired.is_duplicate(make_update(1, message_id=1))
@@ -0,0 +1,51 @@
+"""Test exporter module."""
+import csv
+import gzip
+import io
+from datetime import date
+from typing import List
+
+from src.exporter import in_period, write_csv
+from src.spreadsheets import TABLE_HEADERS
+
+ROWS = [
+    ["Lunch", "Food", "", "10", "USD", "Cash", "2023-11-01", "10"],
+    ["Dinner", "Food", "", "20", "GEL", "Card", "2023-11-02", "7.5"],
+]
+
+
+def read_csv(content: bytes) -> List[List[str]]:
+    return list(csv.reader(io.StringIO(content.decode())))
+
+
+def test_write_csv() -> None:
+    """Test rows are written after the header."""
+    export_file, count = write_csv(iter(ROWS))
+
+    with export_file:
+        rows = read_csv(export_file.read())
+
+    assert count == 2
+    assert rows == [list(TABLE_HEADERS), *ROWS]
+
+
+def test_write_csv_compressed() -> None:
+    """Test the gzipped file decompresses to the same CSV."""
+    export_file, count = write_csv(iter(ROWS), compress=True)
+
+    with export_file:
+        rows = read_csv(gzip.decompress(export_file.read()))
+
+    assert count == 2
+    assert rows == [list(TABLE_HEADERS), *ROWS]
+
+
+def test_in_period() -> None:
+    """Test rows are filtered by date and hand edited dates are kept."""
+    start = date(2023, 11, 2)
+    end = date(2023, 11, 30)
+
+    assert not in_period(ROWS[0], start, end)
+    assert in_period(ROWS[1], start, end)
+    edited_row = ["Taxi", "Transport", "", "5", "EUR", "Card", "yesterday"]
+    assert in_period(edited_row, start, end)
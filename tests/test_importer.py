@@ -0,0 +1,65 @@
+"""Test importer module."""
+from io import BytesIO
+
+import pytest
+from src.importer import ImportFileError, SpendingImport
+
+
+def test_import_without_header() -> None:
+    """Test rows in the message order are imported in chunks."""
+    import_file = BytesIO(
+        (
+            "Lunch;10,5;Food;Nice meal;USD;Cash;2023-11-01\n"
+            + "Dinner;20;Food;;GEL;Card;2023-11-02\n"
+            + "\n"
+            + "Taxi;5;Transport;;EUR;Card;2023-11-03\n"
+        ).encode(),
+    )
+    spending_import = SpendingImport(import_file)
+
+    first_chunk = spending_import.read_chunk(2)
+    second_chunk = spending_import.read_chunk(2)
+
+    assert [spending.name for spending in first_chunk] == ["Lunch", "Dinner"]
+    assert [spending.name for spending in second_chunk] == ["Taxi"]
+    assert not spending_import.read_chunk(2)
+    assert spending_import.imported == 3
+    assert not spending_import.errors
+
+
+def test_import_of_decimal_commas() -> None:
+    """Test costs may use a decimal comma, as in the spreadsheet locales."""
+    import_file = BytesIO(b"Lunch;10,5;Food;Nice meal;USD;Cash;2023-11-01\n")
+
+    chunk = SpendingImport(import_file).read_chunk(1)
+
+    assert chunk[0].cost == 10.5  # noqa: WPS459
+
+
+def test_import_with_header_and_invalid_rows() -> None:
+    """Test header columns are mapped and invalid rows are reported by line."""
+    import_file = BytesIO(
+        (
+            "Date\tName\tCategory\tDescription\tCost\tCurrency\tSource\tExtra\n"
+            + "2023-11-01\tLunch\tFood\t\t10\tUSD\tCash\tx\n"
+            + "2023-11-01\tLunch\tFood\t\t10\tXYZ\tCash\tx\n"
+            + "not a date\tLunch\tFood\t\t10\tUSD\tCash\tx\n"
+            + "2023-11-02\tDinner\n"
+        ).encode(),
+    )
+    spending_import = SpendingImport(import_file)
+
+    chunk = spending_import.read_chunk(100)
+
+    assert [spending.name for spending in chunk] == ["Lunch"]
+    assert [line_number for line_number, _ in spending_import.errors] == [3, 4, 5]
+
+
+def test_import_of_a_non_utf8_file() -> None:
+    """Test a file in another encoding is reported instead of crashing."""
+    import_file = BytesIO(
+        "Обед;10;Food;;USD;Cash;2023-11-01\n".encode("cp1251"),
+    )
+
+    with pytest.raises(ImportFileError, match="UTF-8"):
+        SpendingImport(import_file).read_chunk(10)
@@ -0,0 +1,122 @@
+"""Test journal module."""
+import os
+from datetime import date
+from pathlib import Path
+from typing import List
+
+import pytest
+from src.finances import Spending
+from src.journal import JournalFlusher, SpendingJournal
+
+
+def make_spending(name: str) -> Spending:
+    return Spending(
+        name=name,
+        category="Food",
+        description="",
+        cost=10,
+        currency="USD",
+        source="Cash",
+        datetime=date(2023, 11, 1),
+    )
+
+
+def test_unflushed_entries_are_replayed(tmp_path: Path) -> None:
+    """Test journaled spendings survive a restart until flushed."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    journal = SpendingJournal(journal_path)
+    first_id = journal.append([make_spending("Lunch"), make_spending("Coffee")])
+    journal.append([make_spending("Dinner")])
+    journal.close()
+
+    restarted = SpendingJournal(journal_path)
+    pending = restarted.pending()
+    assert [len(spendings) for _, spendings in pending] == [2, 1]
+    assert pending[0][1][0] == make_spending("Lunch")
+
+    restarted.mark_flushed(first_id)
+    restarted.append([make_spending("Taxi")])
+    restarted.close()
+    assert [
+        spendings[0].name for _, spendings in SpendingJournal(journal_path).pending()
+    ] == ["Dinner", "Taxi"]
+
+
+@pytest.mark.asyncio
+async def test_flusher_coalesces_entries(tmp_path: Path) -> None:
+    """Test all the pending entries are written together and kept on failure."""
+    journal = SpendingJournal(str(tmp_path / "journal.jsonl"))
+    writes: List[List[Spending]] = []
+    failing = True
+
+    async def write(spendings: List[Spending]) -> None:  # noqa: WPS430
+        if failing:
+            raise ValueError("Sheets is down")
+        writes.append(spendings)
+
+    # the spreadsheet being down is transient, the entries stay together
+    flusher = JournalFlusher(journal, write, is_transient=lambda error: True)
+    journal.append([make_spending("Lunch")])
+    journal.append([make_spending("Dinner")])
+
+    await flusher.flush()
+    assert len(journal) == 2
+
+    failing = False
+    await flusher.flush()
+    assert [[spending.name for spending in spendings] for spendings in writes] == [
+        ["Lunch", "Dinner"],
+    ]
+    assert not len(journal)
+
+
+def test_worker_journals_are_apart_and_adopted(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test each process journals to its own file, adopted once it is gone."""
+    journal_path = str(tmp_path / "journal.jsonl")
+    monkeypatch.setattr(os, "getpid", lambda: 1)
+    first = SpendingJournal(journal_path)
+    monkeypatch.setattr(os, "getpid", lambda: 2)
+    second = SpendingJournal(journal_path)
+
+    entry_ids = [
+        first.append([make_spending("Lunch")]),
+        second.append([make_spending("Dinner")]),
+    ]
+    # every process numbers its own entries
+    assert entry_ids == [1, 1]
+    # a running process keeps its entries
+    assert not second.adopt_orphans()
+
+    first.close()
+    assert second.adopt_orphans() == 1
+    assert [spendings[0].name for _, spendings in second.pending()] == [
+        "Dinner",
+        "Lunch",
+    ]
+    assert not os.path.exists(first.path)
+    second.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_entry_is_moved_to_dead_letters(tmp_path: Path) -> None:
+    """Test an entry rejected max_attempts times stops holding up the others."""
+    journal = SpendingJournal(str(tmp_path / "journal.jsonl"))
+    writes: List[List[str]] = []
+
+    async def write(spendings: List[Spending]) -> None:  # noqa: WPS430
+        if any(spending.name == "Bad" for spending in spendings):
+            raise ValueError("Invalid range")
+        writes.append([spending.name for spending in spendings])
+
+    for name in ("Lunch", "Bad", "Dinner"):
+        journal.append([make_spending(name)])
+    await JournalFlusher(journal, write, max_attempts=2).flush()
+
+    assert writes == [["Lunch"], ["Dinner"]]
+    assert not len(journal)
+    with open(journal.dead_letter_path) as dead_letter_file:
+        assert '"Bad"' in dead_letter_file.read()
+    journal.close()
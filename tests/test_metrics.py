@@ -0,0 +1,64 @@
+"""Test metrics module."""
+import pytest
+from src.metrics import Metric, Registry, TrackedValues
+
+
+def test_render_counter_and_histogram() -> None:
+    """Test series are rendered in the Prometheus text format."""
+    registry = Registry()
+    counter = registry.counter("requests_total", "Requests", ["method"])
+    histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+
+    counter.labels('batch"Get').inc()
+    counter.labels('batch"Get').inc(2)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        r'requests_total{method="batch\"Get"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 3',
+        "latency_seconds_sum 5.55",
+        "latency_seconds_count 3",
+    ]
+
+
+def test_histogram_times_failing_blocks() -> None:
+    """Test a block is observed even when it raises."""
+    registry = Registry()
+    histogram = registry.histogram("handler_seconds", "Handlers", ["handler"])
+
+    with pytest.raises(ValueError):
+        with histogram.labels("report").time():
+            raise ValueError("Failed")
+
+    assert 'handler_seconds_count{handler="report"} 1' in registry.render()
+    with pytest.raises(ValueError):
+        histogram.labels("report", "extra")
+
+
+def test_gauge_reads_tracked_values() -> None:
+    """Test gauges read their values when rendered."""
+    registry = Registry()
+    depths = TrackedValues()
+    gauge = registry.gauge("queue_depth", "Depth", depths.collect, ["queue"])
+    queue = [1, 2]
+    depths.track("updates", lambda: len(queue))
+
+    queue.append(3)
+
+    assert 'queue_depth{queue="updates"} 3' in registry.render()
+    with pytest.raises(TypeError):
+        gauge.labels("updates")
+
+
+def test_metric_is_abstract() -> None:
+    """Test a metric without a series format cannot be created."""
+    with pytest.raises(TypeError):
+        Metric("broken", "Broken")  # type: ignore
@@ -0,0 +1,141 @@
+"""Test report service module."""
+from datetime import date
+from io import BytesIO
+from typing import Any, List
+
+import pytest
+from src import storage
+from src.aggregates import MonthKey, MonthlyAggregate
+from src.finances import SheetSpending
+from src.report_service import ReportService, parse_report_period
+
+
+@pytest.mark.parametrize(
+    "arguments,period",
+    [
+        (["2024-05"], (date(2024, 5, 1), date(2024, 5, 31))),
+        (["2024-05-03"], (date(2024, 5, 3), date(2024, 5, 3))),
+        (["2024"], (date(2024, 1, 1), date(2024, 12, 31))),
+        (["2024-01..2024-06"], (date(2024, 1, 1), date(2024, 6, 30))),
+        (["2024-01-10", "2024-02-05"], (date(2024, 1, 10), date(2024, 2, 5))),
+    ],
+)
+def test_parse_report_period(arguments: List[str], period: Any) -> None:
+    """Test supported report periods."""
+    assert parse_report_period(arguments) == period
+
+
+@pytest.mark.parametrize(
+    "arguments",
+    [
+        [],
+        ["2024-13"],
+        ["may"],
+        ["2024-06..2024-01"],
+        ["2024", "2025", "2026"],
+        ["0001..9999"],
+    ],
+)
+def test_parse_invalid_report_period(arguments: List[str]) -> None:
+    """Test invalid report periods."""
+    with pytest.raises(ValueError):
+        parse_report_period(arguments)
+
+
+@pytest.mark.asyncio
+async def test_generate_report_for_range(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test a range report merges the months restricted to the range days."""
+    requested_months: List[List[MonthKey]] = []
+
+    async def get_aggregates(  # noqa: WPS430
+        months: List[MonthKey],
+    ) -> List[MonthlyAggregate]:
+        requested_months.append(months)
+        return [
+            MonthlyAggregate.from_spendings(
+                year,
+                month,
+                [
+                    SheetSpending(
+                        name="Spending",
+                        category="Food",
+                        description="",
+                        cost=10,
+                        currency="USD",
+                        source="Cash",
+                        datetime=date(year, month, day),
+                        usd=10,
+                    )
+                    for day in (1, 20)
+                ],
+            )
+            for year, month in months
+        ]
+
+    monkeypatch.setattr(storage, "get_aggregates", get_aggregates)
+
+    async def generate_pie(*args: Any) -> BytesIO:  # noqa: WPS430
+        return BytesIO()
+
+    monkeypatch.setattr(ReportService, "generate_pie", generate_pie)
+
+    text, _ = await ReportService.generate_report(
+        date(2024, 1, 10),
+        date(2024, 3, 10),
+    )
+
+    assert requested_months == [[(2024, 1), (2024, 2), (2024, 3)]]
+    assert "*Total spendings records:* 4" in text
+    assert "*Total spendings:* 40" in text
+
+
+@pytest.mark.asyncio
+async def test_report_cache_invalidated_by_writes(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test repeated reports are cached until their month changes."""
+    spending = SheetSpending(
+        name="Spending",
+        category="Food",
+        description="",
+        cost=10,
+        currency="USD",
+        source="Cash",
+        datetime=date(2024, 5, 1),
+        usd=10,
+    )
+    aggregate = MonthlyAggregate.from_spendings(2024, 5, [spending])
+    rendered_charts: List[Any] = []
+
+    async def get_aggregates(  # noqa: WPS430
+        months: List[MonthKey],
+    ) -> List[MonthlyAggregate]:
+        return [aggregate]
+
+    async def generate_pie(*args: Any) -> BytesIO:  # noqa: WPS430
+        rendered_charts.append(args)
+        return BytesIO(b"png")
+
+    monkeypatch.setattr(storage, "get_aggregates", get_aggregates)
+    monkeypatch.setattr(ReportService, "generate_pie", generate_pie)
+    ReportService.cache.clear()
+
+    first_text, _ = await ReportService.generate_report(
+        date(2024, 5, 1),
+        date(2024, 5, 31),
+    )
+    second_text, second_pie = await ReportService.generate_report(
+        date(2024, 5, 1),
+        date(2024, 5, 31),
+    )
+    assert first_text == second_text
+    assert second_pie.read() == b"png"
+    assert len(rendered_charts) == 1
+
+    aggregate.add(spending)
+    third_text, _ = await ReportService.generate_report(
+        date(2024, 5, 1),
+        date(2024, 5, 31),
+    )
+    assert third_text != first_text
+    assert len(rendered_charts) == 2
@@ -0,0 +1,123 @@
+"""Test shared_cache module."""
+import asyncio
+import functools
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+import pytest
+from src.currency_converter import RateStore
+from src.shared_cache import SharedCache
+
+RATE = 2.5
+
+
+def load_slowly(loads: List[int]) -> int:
+    loads.append(1)
+    time.sleep(0.05)
+    return 42
+
+
+def fill_in_worker(path: str, loads: List[int], results: List[int]) -> None:
+    # a cache per worker, as each process opens its own
+    cache = SharedCache(path, poll_interval=0.01)
+    results.append(cache.fill("answer", functools.partial(load_slowly, loads)))
+    cache.close()
+
+
+async def render_slowly(renders: List[int]) -> bytes:
+    renders.append(1)
+    await asyncio.sleep(0.05)
+    return b"pie"
+
+
+async def render_pie() -> bytes:
+    return b"pie"
+
+
+async def tick(ticks: List[int], task: "asyncio.Task[bytes]") -> None:
+    while not task.done():
+        ticks.append(1)
+        await asyncio.sleep(0.01)
+
+
+def fetch_rate(fetched: List[str], from_currency: str, to_currency: str) -> float:
+    fetched.append(from_currency)
+    return RATE
+
+
+def test_concurrent_misses_load_once(tmp_path: Path) -> None:
+    """Test workers missing the same key at once load it a single time."""
+    path = str(tmp_path / "shared.sqlite3")
+    loads: List[int] = []
+    results: List[int] = []
+
+    workers = [
+        threading.Thread(target=fill_in_worker, args=(path, loads, results))
+        for _ in range(4)
+    ]
+    for started in workers:
+        started.start()
+    for joined in workers:
+        joined.join()
+
+    assert results == [42, 42, 42, 42]
+    assert len(loads) == 1
+
+
+@pytest.mark.asyncio
+async def test_async_fill_waits_for_the_lease(tmp_path: Path) -> None:
+    """Test a report rendered by one fill is served to the concurrent ones."""
+    cache = SharedCache(str(tmp_path / "shared.sqlite3"), poll_interval=0.01)
+    renders: List[int] = []
+    render = functools.partial(render_slowly, renders)
+
+    results = await asyncio.gather(
+        *[cache.fill_async("report", render) for _ in range(3)],
+    )
+
+    assert results == [b"pie", b"pie", b"pie"]
+    assert len(renders) == 1
+    cache.close()
+
+
+@pytest.mark.asyncio
+async def test_async_fill_queries_off_the_event_loop(tmp_path: Path) -> None:
+    """Test the event loop keeps running while another process locks the cache."""
+    path = str(tmp_path / "shared.sqlite3")
+    cache = SharedCache(path, lease_timeout=1, poll_interval=0.01)
+    blocker = sqlite3.connect(path, isolation_level=None)
+    blocker.execute("BEGIN EXCLUSIVE")
+    ticks: List[int] = []
+
+    fill = asyncio.create_task(cache.fill_async("report", render_pie))
+    ticker = asyncio.create_task(tick(ticks, fill))
+    await asyncio.sleep(0.2)
+    blocker.rollback()
+
+    assert await fill == b"pie"
+    assert len(ticks) > 10
+    await ticker
+    blocker.close()
+    cache.close()
+
+
+def test_rates_are_shared_by_workers(tmp_path: Path) -> None:
+    """Test a rate fetched by a worker is used by the others until it expires."""
+    path = str(tmp_path / "shared.sqlite3")
+    fetched: List[str] = []
+    fetch = functools.partial(fetch_rate, fetched)
+
+    first_cache, second_cache = SharedCache(path), SharedCache(path)
+    first = RateStore("", ttl=60, shared=first_cache)
+    second = RateStore("", ttl=60, shared=second_cache)
+
+    assert first.fill(("GEL", "USD"), fetch) == RATE
+    assert second.fill(("GEL", "USD"), fetch) == RATE
+    assert second.get("GEL", "USD") == (RATE, True)
+    assert fetched == ["GEL"]
+    assert len(second) == 1
+    first_cache.close()
+    second_cache.close()
@@ -0,0 +1,41 @@
+"""Test sheet mirror module."""
+from typing import List
+
+from src.sheet_mirror import SheetMirror
+
+
+class FakeSubSheet:
+    def __init__(self, rows: List[List[str]]) -> None:
+        self.rows = rows
+        self.requested_rows: List[int] = []
+
+    def fetch_rows(self, first_row: int) -> List[List[str]]:
+        self.requested_rows.append(first_row)
+        return self.rows[first_row - 2 :]  # noqa: E203
+
+
+def test_sync_fetches_only_new_rows() -> None:
+    """Test the mirror reads the full sheet once and then only the tail."""
+    sub_sheet = FakeSubSheet([["Lunch"], ["Dinner"]])
+    mirror = SheetMirror(":memory:")
+
+    mirror.sync("2023-11", sub_sheet.fetch_rows)
+    sub_sheet.rows.append(["Coffee"])
+    mirror.sync("2023-11", sub_sheet.fetch_rows)
+    mirror.sync("2023-11", sub_sheet.fetch_rows)
+
+    assert sub_sheet.requested_rows == [2, 4, 5]
+    assert mirror.rows("2023-11") == [["Lunch"], ["Dinner"], ["Coffee"]]
+
+
+def test_sync_reconciles_manual_edits() -> None:
+    """Test a due reconcile replaces the mirrored rows."""
+    sub_sheet = FakeSubSheet([["Lunch"], ["Dinner"]])
+    mirror = SheetMirror(":memory:", reconcile_interval=-1)
+
+    mirror.sync("2023-11", sub_sheet.fetch_rows)
+    sub_sheet.rows = [["Breakfast"]]
+    mirror.sync("2023-11", sub_sheet.fetch_rows)
+
+    assert sub_sheet.requested_rows == [2, 2]
+    assert mirror.rows("2023-11") == [["Breakfast"]]
@@ -0,0 +1,101 @@
+"""Test sheets_scheduler module."""
+import threading
+import time
+from typing import Any, Dict, List
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+from src.sheets_scheduler import BACKGROUND, INTERACTIVE, SheetsScheduler, TokenBucket
+
+
+class FlakyRequest:
+    def __init__(self, statuses: List[int]) -> None:
+        self.statuses = statuses
+        self.calls = 0
+
+    def execute(self) -> Dict[str, Any]:
+        self.calls += 1
+        if self.statuses:
+            status = self.statuses.pop(0)
+            raise HttpError(httplib2.Response({"status": status}), b"")
+        return {"status": "ok"}
+
+
+@pytest.fixture
+def scheduler() -> SheetsScheduler:
+    return SheetsScheduler(read_quota=0, write_quota=600, backoff_base=0)
+
+
+def test_transient_failures_are_retried(scheduler: SheetsScheduler) -> None:
+    """Test 429 and 5xx responses to reads are retried, only 429 ones to writes."""
+    read = FlakyRequest([429, 503])
+    write = FlakyRequest([429])
+
+    assert scheduler.execute(read, "values.batchGet") == {"status": "ok"}
+    assert read.calls == 3
+    assert scheduler.execute(write, "batchUpdate") == {"status": "ok"}
+    assert write.calls == 2
+
+
+def test_other_failures_are_not_retried(scheduler: SheetsScheduler) -> None:
+    """Test 5xx responses to writes and 4xx responses are not retried."""
+    # the rows of a write failed with 5xx may have been appended already
+    write = FlakyRequest([503])
+    with pytest.raises(HttpError):
+        scheduler.execute(write, "batchUpdate")
+    read = FlakyRequest([400])
+    with pytest.raises(HttpError):
+        scheduler.execute(read, "values.batchGet")
+
+    assert write.calls == 1
+    assert read.calls == 1
+
+
+def test_retries_are_limited(scheduler: SheetsScheduler) -> None:
+    """Test a request failing more than max_retries times fails."""
+    scheduler.max_retries = 1
+    request = FlakyRequest([500, 500, 500])
+    with pytest.raises(HttpError):
+        scheduler.execute(request, "values.batchGet")
+
+    assert request.calls == 2
+
+
+def take(bucket: TokenBucket, granted: List[str], name: str, priority: int) -> None:
+    bucket.acquire(priority)
+    granted.append(name)
+
+
+def test_interactive_requests_go_first() -> None:
+    """Test a background request waits while an interactive one is queued."""
+    bucket = TokenBucket(per_minute=600, burst=1)
+    bucket.acquire()
+    granted: List[str] = []
+
+    background = threading.Thread(
+        target=take,
+        args=(bucket, granted, "flush", BACKGROUND),
+    )
+    interactive = threading.Thread(
+        target=take,
+        args=(bucket, granted, "report", INTERACTIVE),
+    )
+    background.start()
+    time.sleep(0.02)
+    interactive.start()
+    background.join()
+    interactive.join()
+
+    assert granted == ["report", "flush"]
+    assert not bucket
+
+
+def test_burst_is_queued_within_the_quota() -> None:
+    """Test requests over the burst wait for their tokens instead of failing."""
+    bucket = TokenBucket(per_minute=1200, burst=2)
+    waited = [bucket.acquire() for _ in range(4)]
+
+    assert waited[:2] == pytest.approx([0, 0], abs=0.01)
+    # the other 1198 requests of the minute are granted at a steady rate
+    assert sum(waited) == pytest.approx(0.1, abs=0.05)
@@ -0,0 +1,69 @@
+"""Test spending_frame module."""
+from datetime import date
+
+from src.aggregates import MonthlyAggregate
+from src.finances import SheetSpending
+from src.spending_frame import SpendingFrame
+
+ROWS = [
+    ["Lunch", "Food", "", "10", "USD", "Cash", "2023-11-01", "10"],
+    ["Taxi", "Transport", "", "15", "GEL", "Card", "2023-11-01", "5,5"],
+    [],
+    ["Dinner", "Food", "", "20", "GEL", "Card", "2023-11-02"],
+    ["Cafe", "Food", "", "4", "USD", "Cash", "edited by hand", "4"],
+    ["Cake", "Food", "", "2", "USD", "Cash", "2023-11-03", "2"],
+]
+
+
+def test_frame_from_rows() -> None:
+    """Test rows are stored as columns and unparsable rows are skipped."""
+    frame = SpendingFrame.from_rows(ROWS)
+
+    assert len(frame) == 4
+    assert frame.categories.values == ["Food", "Transport"]
+    assert list(frame.category) == [0, 1, 0, 0]
+    assert frame.sum() == 17.5  # noqa: WPS459
+    assert frame.sum("cost") == 47
+
+
+def test_frame_group_by() -> None:
+    """Test group-by sums and counts decode their keys."""
+    frame = SpendingFrame.from_rows(ROWS)
+
+    assert frame.group_sum("category") == {("Food",): 12, ("Transport",): 5.5}
+    assert frame.group_sum("day", "source", column="cost") == {
+        (1, "Cash"): 10,
+        (1, "Card"): 15,
+        (2, "Card"): 20,
+        (3, "Cash"): 2,
+    }
+    assert frame.group_count("date") == {
+        (date(2023, 11, 1),): 2,
+        (date(2023, 11, 2),): 1,
+        (date(2023, 11, 3),): 1,
+    }
+
+
+def test_frame_filter() -> None:
+    """Test filters select rows and share the code tables."""
+    frame = SpendingFrame.from_rows(ROWS)
+
+    selected = frame.between(
+        date(2023, 11, 2),
+        date(2023, 11, 3),
+    )
+    assert len(selected) == 2
+    assert selected.categories is frame.categories
+    assert len(frame.on_day(1)) == 2
+
+
+def test_aggregate_from_frame_matches_spendings() -> None:
+    """Test the aggregate of a frame has the same sums as the one of models."""
+    rows = [row for row in ROWS if row and row[6] != "edited by hand"]
+    spendings = [SheetSpending.from_list(row) for row in rows]
+
+    from_frame = MonthlyAggregate.from_frame(2023, 11, SpendingFrame.from_rows(rows))
+    from_spendings = MonthlyAggregate.from_spendings(2023, 11, spendings)
+
+    assert from_frame.same_sums(from_spendings)
+    assert from_frame.totals().total == from_spendings.totals().total
@@ -0,0 +1,43 @@
+"""Test spending_parser module."""
+from datetime import date
+
+from src.spending_parser import parse_spendings
+
+INVALID_RECORDS = (
+    "Lunch;10;Food;;XYZ;Cash;2023-11-01"
+    + "|Dinner;20;Food;;GEL;Card;2023-11-02"
+    + "|Taxi;5;Transport;EUR;Card;2023-11-03"
+    + "|Cafe;much;Food;;USD;Card;yesterday"
+)
+
+
+def test_parse_spendings() -> None:
+    """Test every record of a message is parsed."""
+    spendings, errors = parse_spendings(
+        "Lunch;10,5;Food;Nice meal;USD;Cash;2023-11-01"
+        + " | Taxi; 5 ;Transport;;EUR;Card;2023-11-02\n",
+    )
+
+    assert not errors
+    assert [spending.name for spending in spendings] == ["Lunch", "Taxi"]
+    assert spendings[0].cost == 10.5  # noqa: WPS459
+    assert spendings[1].cost == 5
+    assert spendings[1].datetime == date(2023, 11, 2)
+
+
+def test_parse_spendings_reports_invalid_records() -> None:
+    """Test invalid records are reported by position and valid ones are kept."""
+    spendings, errors = parse_spendings(INVALID_RECORDS)
+
+    assert [spending.name for spending in spendings] == ["Dinner"]
+    assert [position for position, _ in errors] == [1, 3, 4]
+
+
+def test_parse_spendings_error_messages() -> None:
+    """Test the errors of invalid records name the wrong fields."""
+    _, errors = parse_spendings(INVALID_RECORDS)
+
+    assert errors[0][1].startswith("currency: ")
+    assert errors[1][1] == "Expected 7 fields, got 6"
+    assert "cost: " in errors[2][1]
+    assert "datetime: " in errors[2][1]
@@ -0,0 +1,217 @@
+"""Test spreadsheets module."""
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List
+
+import pytest
+from benchmarks.fake_sheets import FakeSheetsService as InMemorySheetsService
+from src import sheet_mirror, spreadsheets
+from src.currency_converter import CurrencyConverter
+from src.finances import Spending
+from src.tenants import default_tenant
+
+
+class FakeRequest:
+    def __init__(self, response: Dict[str, Any]) -> None:
+        self.response = response
+
+    def execute(self) -> Dict[str, Any]:
+        return self.response
+
+
+class FakeSheetsService:
+    def __init__(self, titles: List[str]) -> None:
+        self.titles = titles
+        self.get_calls: List[Dict[str, Any]] = []
+        self.batch_update_calls: List[Dict[str, Any]] = []
+        self.values_batch_update_calls: List[Dict[str, Any]] = []
+
+    def get(self, **kwargs: Any) -> FakeRequest:
+        self.get_calls.append(kwargs)
+        return FakeRequest(
+            {
+                "sheets": [
+                    {"properties": {"sheetId": index, "title": title}}
+                    for index, title in enumerate(self.titles)
+                ],
+            },
+        )
+
+    def batchUpdate(self, **kwargs: Any) -> FakeRequest:  # noqa: N802
+        self.batch_update_calls.append(kwargs)
+        return FakeRequest({})
+
+    def values(self) -> "FakeValuesService":
+        return FakeValuesService(self)
+
+
+class FakeValuesService:
+    def __init__(self, sheets_service: FakeSheetsService) -> None:
+        self.sheets_service = sheets_service
+
+    def batchUpdate(self, **kwargs: Any) -> FakeRequest:  # noqa: N802
+        self.sheets_service.values_batch_update_calls.append(kwargs)
+        return FakeRequest({})
+
+
+def test_sub_sheet_index_refreshes_only_on_miss() -> None:
+    """Test the index hits the API only for unknown titles."""
+    sheets_service = FakeSheetsService(["2023-10", "2023-11"])
+    index = spreadsheets.SubSheetIndex("spreadsheet")
+
+    assert index.get(sheets_service, "2023-11") == 1
+    assert index.get(sheets_service, "2023-10") == 0
+    assert len(sheets_service.get_calls) == 1
+    assert sheets_service.get_calls[0]["fields"] == spreadsheets.SubSheetIndex.fields
+
+
+def test_sub_sheet_index_caches_missing_titles() -> None:
+    """Test a missing title is looked up once, until its sub-sheet is added."""
+    sheets_service = FakeSheetsService(["2023-11"])
+    index = spreadsheets.SubSheetIndex("spreadsheet")
+
+    assert index.get_many(sheets_service, ["2023-11", "2023-12"])["2023-12"] is None
+    assert index.get(sheets_service, "2023-12") is None
+    assert len(sheets_service.get_calls) == 1
+
+    index.add("2023-12", 7)  # noqa: WPS432
+    assert index.get(sheets_service, "2023-12") == 7  # noqa: WPS432
+    assert len(sheets_service.get_calls) == 1
+
+
+def test_sub_sheet_index_expires() -> None:
+    """Test the index is refreshed after its TTL."""
+    sheets_service = FakeSheetsService(["2023-11"])
+    index = spreadsheets.SubSheetIndex("spreadsheet", ttl=0)
+
+    index.get(sheets_service, "2023-11")
+    index.get(sheets_service, "2023-11")
+
+    assert len(sheets_service.get_calls) == 2
+
+
+def test_add_spending_sends_single_batch_update(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test spendings for several months are written with one request."""
+    sheets_service = FakeSheetsService(["2023-10"])
+    monkeypatch.setattr(spreadsheets, "get_sheets_service", lambda: sheets_service)
+    monkeypatch.setattr(spreadsheets, "sub_sheet_indexes", {})
+
+    spreadsheets.add_spending(
+        [
+            Spending(
+                name="Lunch",
+                category="Food",
+                description="",
+                cost=10.5,
+                currency="USD",
+                source="Cash",
+                datetime=date(2023, month, 1),
+            )
+            for month in (10, 11, 12)
+        ],
+    )
+
+    assert len(sheets_service.get_calls) == 1
+    assert len(sheets_service.batch_update_calls) == 1
+    requests = sheets_service.batch_update_calls[0]["body"]["requests"]
+    assert [next(iter(request)) for request in requests] == [
+        "appendCells",
+        "addSheet",
+        "updateCells",
+        "appendCells",
+        "addSheet",
+        "updateCells",
+        "appendCells",
+    ]
+    sub_sheet_index = spreadsheets.get_sub_sheet_index()
+    assert sub_sheet_index.get(sheets_service, "2023-12") is not None
+    assert len(sheets_service.get_calls) == 1
+
+
+def test_backfill_usd_rows(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test missing USD costs are converted once per currency and written back."""
+    requested_rates: List[str] = []
+
+    def get_rate(from_currency: str, to_currency: str) -> float:  # noqa: WPS430
+        requested_rates.append(from_currency)
+        return 0.5
+
+    monkeypatch.setattr(CurrencyConverter, "get_rate", get_rate)
+    sheets_service = FakeSheetsService([])
+    rows = [
+        ["Lunch", "Food", "", "10", "GEL", "Cash", "2023-11-01"],
+        ["Taxi", "Transport", "", "4", "GEL", "Card", "2023-11-01", ""],
+        ["Coffee", "Food", "", "3", "USD", "Cash", "2023-11-02", "3"],
+        ["Dinner", "Food", "", "20", "EUR", "Cash", "2023-11-02"],
+    ]
+
+    backfilled = spreadsheets.backfill_usd_rows(sheets_service, "2023-11", rows)
+
+    assert backfilled == 3
+    assert sorted(requested_rates) == ["EUR", "GEL"]
+    assert [row[7] for row in rows] == ["5.0", "2.0", "3", "10.0"]
+    assert len(sheets_service.values_batch_update_calls) == 1
+    data = sheets_service.values_batch_update_calls[0]["body"]["data"]
+    assert sorted(update["range"] for update in data) == [
+        "2023-11!H2",
+        "2023-11!H3",
+        "2023-11!H5",
+    ]
+
+
+def test_write_and_read_round_trips(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the API calls of a write and of a read of the written month."""
+    sheets_service = InMemorySheetsService()
+    monkeypatch.setattr(spreadsheets, "get_sheets_service", lambda: sheets_service)
+    monkeypatch.setattr(spreadsheets, "sub_sheet_indexes", {})
+    monkeypatch.setattr(sheet_mirror, "sheet_mirrors", {default_tenant.key: None})
+
+    spreadsheets.add_spending(
+        [
+            Spending(
+                name=name,
+                category="Food",
+                description="",
+                cost=10,
+                currency="USD",
+                source="Cash",
+                datetime=date(2023, 11, 1),
+            )
+            for name in ("Lunch", "Dinner")
+        ],
+    )
+    assert sheets_service.calls == {"get": 1, "batchUpdate": 1}
+
+    sheets_service.calls.clear()
+    rows = spreadsheets.read_spreedsheets([(2023, 11)])[2023, 11]
+
+    assert sheets_service.calls == {"values.batchGet": 1}
+    assert [row[0] for row in rows] == ["Lunch", "Dinner"]
+    assert rows[0][6:] == ["2023-11-01", "10"]
+
+
+def test_export_syncs_one_month_at_a_time(
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test a cold export reads a month only once the previous one is paged out."""
+    sheets_service = InMemorySheetsService()
+    header = ["Name", "Category", "Description", "Cost", "Currency", "Source"]
+    months = [(2023, 10), (2023, 11), (2023, 12)]
+    for year, month in months:
+        spent_on = f"{year}-{month}-01"
+        row = ["Lunch", "Food", "", "10", "USD", "Cash", spent_on, "10"]
+        sheets_service.add_sheet(f"{year}-{month}", [header, row])
+    monkeypatch.setattr(spreadsheets, "get_sheets_service", lambda: sheets_service)
+    monkeypatch.setattr(spreadsheets, "sub_sheet_indexes", {})
+    mirror = sheet_mirror.SheetMirror(str(tmp_path / "mirror.sqlite3"))
+    monkeypatch.setattr(sheet_mirror, "sheet_mirrors", {default_tenant.key: mirror})
+
+    rows = spreadsheets.iter_spreedsheets_rows(months, 1)
+
+    assert next(rows)[6] == "2023-10-01"
+    assert sheets_service.calls["values.batchGet"] == 1
+    assert [row[6] for row in rows] == ["2023-11-01", "2023-12-01"]
+    assert sheets_service.calls["values.batchGet"] == 3
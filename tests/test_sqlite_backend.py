@@ -0,0 +1,115 @@
+"""Test sqlite_backend module."""
+from datetime import date
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+from src.aggregates import MonthlyAggregate
+from src.currency_converter import CurrencyConverter
+from src.finances import SheetSpending, Spending
+from src.spending_frame import SpendingFrame
+from src.sqlite_backend import SqliteBackend
+
+
+def make_spending(name: str, currency: str, spent_on: date) -> Spending:
+    return Spending(
+        name=name,
+        category="Food",
+        description="",
+        cost=10,
+        currency=currency,  # type: ignore
+        source="Cash",
+        datetime=spent_on,
+    )
+
+
+def get_rate(from_currency: str, to_currency: str) -> Optional[float]:
+    return {"USD": 1.0, "GEL": 0.5}.get(from_currency)
+
+
+@pytest.fixture
+def backend(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> SqliteBackend:
+    monkeypatch.setattr(CurrencyConverter, "get_rate", get_rate)
+    sqlite_backend = SqliteBackend(str(tmp_path / "spendings.sqlite3"))
+    sqlite_backend.add_spending(
+        [
+            make_spending("Lunch", "USD", date(2023, 11, 1)),
+            make_spending("Dinner", "GEL", date(2023, 11, 30)),
+            make_spending("Taxi", "EUR", date(2023, 12, 1)),
+        ],
+    )
+    return sqlite_backend
+
+
+def test_get_spendings(backend: SqliteBackend) -> None:
+    """Test spendings are read back by month and day."""
+    spendings = backend.get_spendings(2023, 11)
+    day_spendings = backend.get_spendings(2023, 11, 30)
+
+    assert [spending.name for spending in spendings] == ["Lunch", "Dinner"]
+    assert [spending.usd for spending in spendings] == [10, 5]
+    assert [spending.name for spending in day_spendings] == ["Dinner"]
+    assert backend.get_spendings(2023, 12)[0].usd is None
+
+
+def test_query(backend: SqliteBackend) -> None:
+    """Test spendings are read into a frame by date range."""
+    first_day = date(2023, 11, 1)
+    last_day = date(2023, 12, 31)
+    frame = backend.query(date(2023, 11, 30), last_day)
+
+    assert len(frame) == 2
+    assert frame.sum() == 5
+    assert len(backend.query(first_day, first_day)) == 1
+
+
+def test_build_aggregates(backend: SqliteBackend) -> None:
+    """Test aggregates built with SQL match the ones built from spendings."""
+    months = [(2023, 11), (2023, 12), (2024, 1)]
+    aggregates = backend.build_aggregates(months)
+
+    built = [(aggregate.year, aggregate.month) for aggregate in aggregates]
+    assert built == months
+    expected = MonthlyAggregate.from_frame(
+        2023,
+        11,
+        SpendingFrame.from_spendings(backend.get_spendings(2023, 11)),
+    )
+    assert aggregates[0].same_sums(expected)
+    assert aggregates[1].totals().count == 1
+    assert not aggregates[2].count_by_day
+
+
+def test_iter_rows(backend: SqliteBackend) -> None:
+    """Test rows are paged in the sheet format."""
+    months = [(2023, 11), (2023, 12)]
+    rows: List[List[str]] = list(backend.iter_rows(months, 1))
+
+    assert [row[0] for row in rows] == ["Lunch", "Dinner", "Taxi"]
+    assert rows[1] == ["Dinner", "Food", "", "10", "GEL", "Cash", "2023-11-30", "5"]
+    assert rows[2][7] == ""
+    assert SheetSpending.from_list(rows[1]).usd == 5
+
+
+def test_backfill_usd(
+    backend: SqliteBackend,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test missing USD costs are backfilled once."""
+    monkeypatch.setattr(CurrencyConverter, "get_rate", lambda *args: 1.5)
+    december = (date(2023, 12, 1), date(2023, 12, 31))
+    assert backend.backfill_usd(*december) == 1
+    assert backend.get_spendings(2023, 12)[0].usd == 15
+    assert backend.backfill_usd(*december) == 0
+
+
+def test_build_aggregates_backfills_usd(
+    backend: SqliteBackend,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test spendings stored without a rate are converted before aggregating."""
+    monkeypatch.setattr(CurrencyConverter, "get_rate", lambda *args: 1.5)
+    aggregate = backend.build_aggregates([(2023, 12)])[0]
+
+    assert aggregate.totals().total == 15
+    assert backend.get_spendings(2023, 12)[0].usd == 15
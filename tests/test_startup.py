@@ -0,0 +1,80 @@
+"""Test startup module."""
+from types import ModuleType
+from typing import Any, Dict, List
+
+import main
+import pytest
+from src.spreadsheets import get_discovery_document
+from src.startup import BootTimer, PendingUpdates, import_in_background
+
+
+def test_boot_timer_keeps_the_first_time() -> None:
+    """Test a phase reached again keeps the time it was first reached."""
+    boot_timer = BootTimer()
+
+    first = boot_timer.mark("ready")
+
+    assert boot_timer.mark("ready") == first
+    assert boot_timer.collect() == {("ready",): first}
+
+
+def test_pending_updates_add() -> None:
+    """Test updates are kept while loading, up to maxsize."""
+    pending_updates = PendingUpdates(maxsize=2)
+
+    assert pending_updates.add({"update_id": 1})
+    assert pending_updates.add({"update_id": 2})
+    assert not pending_updates.add({"update_id": 3})
+    assert pending_updates.loading
+
+
+def test_pending_updates_release() -> None:
+    """Test the kept updates are released once, and buffering stops."""
+    pending_updates = PendingUpdates(maxsize=2)
+    pending_updates.add({"update_id": 1})
+    pending_updates.add({"update_id": 2})
+
+    assert pending_updates.release() == [{"update_id": 1}, {"update_id": 2}]
+    assert not pending_updates.loading
+    assert not pending_updates
+
+
+@pytest.mark.asyncio
+async def test_import_in_background() -> None:
+    """Test a module is imported off the event loop."""
+    module = await import_in_background("src.spending_parser")
+
+    assert module.__name__ == "src.spending_parser"
+
+
+def test_discovery_document_is_bundled() -> None:
+    """Test the Sheets service is described without a network request."""
+    document = get_discovery_document()
+
+    assert document["name"] == "sheets"
+    assert document["version"] == "v4"
+    assert get_discovery_document() is document
+
+
+@pytest.mark.asyncio
+async def test_failed_load_stops_buffering(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test updates are queued instead of answered 503 when the bot fails to load."""
+    queued: List[Dict[str, Any]] = []
+
+    async def broken_import(name: str) -> ModuleType:  # noqa: WPS430
+        raise ImportError(name)
+
+    async def queue_update(update_data: Dict[str, Any]) -> str:  # noqa: WPS430
+        queued.append(update_data)
+        return "queued"
+
+    monkeypatch.setattr(main, "import_in_background", broken_import)
+    monkeypatch.setattr(main, "queue_update", queue_update)
+    monkeypatch.setattr(main, "pending_updates", PendingUpdates(maxsize=2))
+    main.pending_updates.add({"update_id": 1})
+
+    with pytest.raises(ImportError):
+        await main.load_bot()
+
+    assert not main.pending_updates.loading
+    assert queued == [{"update_id": 1}]
@@ -0,0 +1,96 @@
+"""Test storage module."""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import date
+from pathlib import Path
+from typing import Any, List
+
+import httplib2
+import pytest
+from google.auth.exceptions import TransportError
+from googleapiclient.errors import HttpError
+from src import spreadsheets, storage
+from src.finances import Spending
+from src.journal import JournalFlusher, SpendingJournal
+
+
+def make_spending(name: str) -> Spending:
+    return Spending(
+        name=name,
+        category="Food",
+        description="",
+        cost=10,
+        currency="USD",
+        source="Cash",
+        datetime=date(2023, 11, 1),
+    )
+
+
+@pytest.mark.asyncio
+async def test_storage_calls_do_not_block_event_loop(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Test slow storage calls run concurrently in worker threads."""
+    worker_threads: List[str] = []
+
+    def slow_get_spendings(*args: Any) -> List[Any]:  # noqa: WPS430
+        worker_threads.append(threading.current_thread().name)
+        time.sleep(0.2)
+        return []
+
+    monkeypatch.setattr(spreadsheets, "get_spendings", slow_get_spendings)
+
+    started_at = time.monotonic()
+    # four coroutines, gather runs a repeated one only once
+    calls = [
+        storage.run_in_worker(spreadsheets.get_spendings, 2023, 11) for _ in range(4)
+    ]
+    await asyncio.gather(*calls)
+
+    assert time.monotonic() - started_at < 0.6  # noqa: WPS459
+    assert len(worker_threads) == 4
+    assert all(name.startswith("storage") for name in worker_threads)
+
+
+@pytest.mark.asyncio
+async def test_outage_keeps_entries_pending(tmp_path: Path) -> None:
+    """Test network failures never move entries to the dead letters."""
+    journal = SpendingJournal(str(tmp_path / "journal.jsonl"))
+    failures: List[Exception] = [
+        httplib2.ServerNotFoundError("Unable to find the server"),
+        TransportError("Connection reset"),
+        HttpError(httplib2.Response({"status": 503}), b""),
+    ]
+
+    async def write(spendings: List[Spending]) -> None:  # noqa: WPS430
+        raise failures[0]
+
+    journal.append([make_spending("Lunch")])
+    flusher = JournalFlusher(
+        journal,
+        write,
+        max_attempts=1,
+        is_transient=storage.is_transient_error,
+    )
+    while failures:
+        await flusher.flush()
+        failures.pop(0)
+
+    assert len(journal) == 1
+    assert not os.path.exists(journal.dead_letter_path)
+    journal.close()
+
+
+def test_rejected_writes_are_not_transient() -> None:
+    """Test only the writes refused by the backend count as rejected."""
+    assert not storage.is_transient_error(
+        HttpError(httplib2.Response({"status": 400}), b""),
+    )
+    assert storage.is_transient_error(
+        HttpError(httplib2.Response({"status": 429}), b""),
+    )
+    assert not storage.is_transient_error(sqlite3.IntegrityError("UNIQUE"))
+    assert storage.is_transient_error(sqlite3.OperationalError("locked"))
@@ -0,0 +1,90 @@
+"""Test tenants module."""
+import functools
+import json
+from datetime import date
+from pathlib import Path
+from typing import List
+
+import pytest
+from src.aggregates import get_aggregate_store
+from src.finances import Spending
+from src.journal import JournalFlusher, SpendingJournal
+from src.tenants import Tenant, TenantRouter, get_tenant, tenant_path, use_tenant
+
+
+@pytest.fixture
+def router(tmp_path: Path) -> TenantRouter:
+    tenants_path = tmp_path / "tenants.json"
+    tenants_path.write_text(
+        json.dumps(
+            {
+                "chats": {"-100": "family", "-200": "family"},
+                "users": {
+                    "42": {"spreadsheet_id": "alice", "service_account_file": "a.json"},
+                },
+            },
+        ),
+    )
+    return TenantRouter(str(tenants_path), Tenant("default"))
+
+
+def test_router_resolves_chats_then_users(router: TenantRouter) -> None:
+    """Test chats and users are routed to their spreadsheets, others to default."""
+    assert router.resolve(-100, 42).spreadsheet_id == "family"
+    assert router.resolve(-100, None) is router.resolve(-200, None)
+    assert router.resolve(42, 42).service_account_file == "a.json"
+    assert router.resolve(7, 7) is router.default
+
+
+def test_router_get(router: TenantRouter) -> None:
+    """Test tenants are found by key, the removed ones included."""
+    assert router.get("alice") is router.resolve(None, 42)
+    assert router.get("removed").spreadsheet_id == "removed"
+    assert len(router) == 3
+
+
+def test_tenant_state_is_kept_apart() -> None:
+    """Test tenants get their own aggregates and local files."""
+    with use_tenant(Tenant("first")):
+        first_store = get_aggregate_store()
+    with use_tenant(Tenant("second")):
+        assert get_aggregate_store() is not first_store
+    with use_tenant(Tenant("first")):
+        assert get_aggregate_store() is first_store
+
+    assert tenant_path("/data/mirror.sqlite3", Tenant("first")) == (
+        "/data/mirror-first.sqlite3"
+    )
+
+
+async def write_unless_down(writes: List[str], spendings: List[Spending]) -> None:
+    tenant_key = get_tenant().key
+    if tenant_key == "down":
+        raise ValueError("Sheets is down")
+    spending_count = len(spendings)
+    writes.append(f"{tenant_key}: {spending_count}")
+
+
+@pytest.mark.asyncio
+async def test_journal_flushes_tenants_apart(tmp_path: Path) -> None:
+    """Test journaled spendings are written per tenant, failures kept per tenant."""
+    journal = SpendingJournal(str(tmp_path / "journal.jsonl"))
+    writes: List[str] = []
+    spending = Spending(
+        name="Lunch",
+        category="Food",
+        description="",
+        cost=10,
+        currency="USD",
+        source="Cash",
+        datetime=date(2023, 11, 1),
+    )
+    journal.append([spending], "first")
+    journal.append([spending], "down")
+    journal.append([spending, spending], "first")
+
+    await JournalFlusher(journal, functools.partial(write_unless_down, writes)).flush()
+
+    assert writes == ["first: 3"]
+    journal.close()
+    assert list(SpendingJournal(journal.base_path).pending_by_tenant()) == ["down"]
@@ -0,0 +1,64 @@
+"""Test tracing module."""
+import json
+import logging
+import os
+import time
+
+import pytest
+from src import storage
+from src.tracing import current_trace, sampled_profile, span, trace
+
+
+def test_span_outside_of_a_trace() -> None:
+    """Test spans are no-ops when no update is traced."""
+    with span("sheets.get"):
+        assert current_trace.get() is None
+
+
+def read_rows() -> int:
+    with span("sheets.values.get"):
+        return 1
+
+
+@pytest.mark.asyncio
+async def test_spans_propagate_to_storage_workers() -> None:
+    """Test spans opened in worker threads are recorded in the update trace."""
+    with trace("update-1") as update_trace:
+        with span("bot.generate_report"):
+            assert await storage.run_in_worker(read_rows) == 1
+        spans = [recorded.to_dict() for recorded in update_trace.spans]
+
+    assert [(recorded["name"], recorded["depth"]) for recorded in spans] == [
+        ("sheets.values.get", 2),
+        ("storage.read_rows", 1),
+        ("bot.generate_report", 0),
+    ]
+    assert spans[0]["thread"].startswith("storage")
+
+
+def test_slow_trace_is_logged(caplog: pytest.LogCaptureFixture) -> None:
+    """Test a trace longer than the threshold is logged with its spans."""
+    with caplog.at_level(logging.WARNING, logger="src.tracing"):
+        with trace("update-2", slow_threshold=0):
+            with span("report.pie"):
+                time.sleep(0.001)
+        with trace("update-3", slow_threshold=60) as fast_trace:
+            assert not fast_trace.spans
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    entry = json.loads(message.split(": ", 1)[1])
+    assert entry["trace"] == "update-2"
+    assert [recorded["name"] for recorded in entry["spans"]] == ["report.pie"]
+    assert entry["spans"][0]["duration_ms"] <= entry["duration_ms"]
+
+
+def test_sampled_profile(tmp_path: str) -> None:
+    """Test sampled blocks are profiled to disk and the others are not."""
+    with sampled_profile("update-4", sample_rate=0, profile_dir=tmp_path) as skipped:
+        assert skipped is None
+    with sampled_profile("update-5", sample_rate=1, profile_dir=tmp_path) as path:
+        assert path is not None
+        profile_name = os.path.basename(path)
+
+    assert os.listdir(tmp_path) == [profile_name]
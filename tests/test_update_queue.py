@@ -0,0 +1,72 @@
+"""Test update queue module."""
+import asyncio
+from datetime import datetime, timezone
+from typing import List, Tuple
+
+import pytest
+from aiogram import types
+from src.update_queue import UpdateQueue
+
+
+def make_update(update_id: int, chat_id: int) -> types.Update:
+    return types.Update(
+        update_id=update_id,
+        message=types.Message(
+            message_id=update_id,
+            date=datetime.fromtimestamp(1635768000, tz=timezone.utc),
+            chat=types.Chat(id=chat_id, type="private"),
+            text="text",
+        ),
+    )
+
+
+def chat_updates(processed: List[Tuple[int, int]], chat_id: int) -> List[int]:
+    return [update for chat, update in processed if chat == chat_id]
+
+
+async def put_updates(queue: UpdateQueue, update_ids: List[int]) -> List[bool]:
+    accepted: List[bool] = []
+    for update_id in update_ids:
+        accepted.append(await queue.put(make_update(update_id, chat_id=1)))
+        # let the worker take the update
+        await asyncio.sleep(0)
+    return accepted
+
+
+@pytest.mark.asyncio
+async def test_updates_of_a_chat_keep_their_order() -> None:
+    """Test chats are processed concurrently, each one in order."""
+    processed: List[Tuple[int, int]] = []
+
+    async def handler(update: types.Update) -> None:  # noqa: WPS430
+        await asyncio.sleep(0.05 if update.update_id % 2 else 0)
+        assert update.message is not None
+        processed.append((update.message.chat.id, update.update_id))
+
+    queue = UpdateQueue(handler, workers=2, maxsize=10, put_timeout=1)
+    await queue.start()
+    for update_id in range(1, 7):
+        assert await queue.put(make_update(update_id, chat_id=update_id % 2))
+    await queue.stop()
+
+    assert chat_updates(processed, chat_id=1) == [1, 3, 5]
+    assert chat_updates(processed, chat_id=0) == [2, 4, 6]
+    assert processed.index((0, 6)) < processed.index((1, 3))
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_updates() -> None:
+    """Test a full queue pushes back after the put timeout."""
+    release = asyncio.Event()
+
+    async def handler(update: types.Update) -> None:  # noqa: WPS430
+        await release.wait()
+
+    queue = UpdateQueue(handler, workers=1, maxsize=1, put_timeout=0.01)
+    await queue.start()
+
+    assert await put_updates(queue, [1, 2, 3]) == [True, True, False]
+    assert queue.depth() == 1
+
+    release.set()
+    await queue.stop()